@@ -0,0 +1,245 @@
+"""Time the `processing` functions on synthetic races of growing size.
+
+Each benchmark runs at every field size, recording the best wall time
+of a few repeats and the peak memory allocated (via tracemalloc) during
+one run. Results are saved as json, so a run can be compared against an
+earlier one to catch regressions.
+
+All io benchmarks read and write in a temporary data directory.
+"""
+import getopt
+import json
+import math
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from processing import analysis, cleaners, io, survival, synthetic, util
+
+
+BENCH_YEAR = 1900
+
+
+def create_benchmarks(df_split_times, df_split_info, race_year):
+  """Name -> zero-arg callable, for one synthetic race."""
+  df_sorted = cleaners.sort_df_split_data(df_split_times, df_split_info)
+  df_split_secs = df_split_times / pd.Timedelta(seconds=1)
+  for fmt in io.SPLIT_SECS_FNAMES:
+    io.save_df_split_times_clean(df_sorted, race_year, fmt=fmt)
+  io.save_df_split_info_clean(df_split_info, race_year)
+  io.save_results_store([race_year])
+
+  return {
+    'analysis.df_split_stats': lambda: analysis.df_split_stats(df_sorted),
+    'analysis.df_segment_times': lambda: analysis.df_segment_times(df_sorted),
+    'analysis.df_segment_pace': lambda: analysis.df_segment_pace(df_sorted,
+      df_split_info),
+    'analysis.stats_df': lambda: analysis.stats_df(df_split_secs),
+    'survival.df_kaplan_meier': lambda: survival.df_kaplan_meier(df_sorted,
+      df_split_info),
+    'cleaners.sort_df_split_data': lambda: cleaners.sort_df_split_data(
+      df_split_times, df_split_info),
+    'util.df_td_fmt': lambda: util.df_td_fmt(df_sorted),
+    'util.get_df_negative_timedelta': lambda: util.get_df_negative_timedelta(
+      df_sorted),
+    'io.load_df_split_info_raw': lambda: io.load_df_split_info_raw(race_year),
+    'io.load_df_split_times_raw': lambda: io.load_df_split_times_raw(race_year),
+    'io.load_df_split_ms_raw': lambda: io.load_df_split_ms_raw(
+      io.get_raw_race_data_dir(race_year)),
+    'io.save_df_split_info_clean': lambda: io.save_df_split_info_clean(
+      df_split_info, race_year),
+    'io.load_df_split_info_clean': lambda: io.load_df_split_info_clean(
+      race_year),
+    **{
+      f'io.save_df_split_times_clean[{fmt}]':
+        lambda fmt=fmt: io.save_df_split_times_clean(df_sorted, race_year, fmt=fmt)
+      for fmt in io.SPLIT_SECS_FNAMES
+    },
+    **{
+      f'io.load_df_split_times_clean[{fmt}]':
+        lambda fmt=fmt: io.load_df_split_times_clean(race_year, fmt=fmt)
+      for fmt in io.SPLIT_SECS_FNAMES
+    },
+    **{
+      f'io.load_df_split_secs_clean[{fmt}]':
+        lambda fmt=fmt: io.load_df_split_secs_clean(race_year, fmt=fmt)
+      for fmt in io.SPLIT_SECS_FNAMES
+    },
+    'io.save_results_store': lambda: io.save_results_store([race_year]),
+    'io.ResultsStore.df_split_secs': lambda: io.ResultsStore().df_split_secs(
+      race_year),
+  }
+
+
+def time_func(func, repeat=3):
+  """Best wall time of `repeat` runs, and peak memory (MB) of one run."""
+  wall_times = []
+  for _ in range(repeat):
+    t_st = time.perf_counter()
+    func()
+    wall_times.append(time.perf_counter() - t_st)
+
+  tracemalloc.start()
+  func()
+  _, peak_bytes = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return min(wall_times), peak_bytes / 2 ** 20
+
+
+def run_benchmarks(sizes, n_splits=12, dnf_rate=0.4, missing_rate=0.02,
+                   repeat=3, only=None, seed=0):
+  """Run every benchmark (or those whose name contains `only`) at each size.
+
+  Returns:
+    dict: run metadata and a list of results, ready to save as json.
+  """
+  results = []
+  data_dir_orig = io.DATA_DIR
+  with tempfile.TemporaryDirectory() as data_dir:
+    io.DATA_DIR = data_dir
+    try:
+      for n_athletes in sizes:
+        synthetic.save_race_raw(BENCH_YEAR, n_athletes, n_splits=n_splits,
+          dnf_rate=dnf_rate, missing_rate=missing_rate, seed=seed)
+        benchmarks = create_benchmarks(
+          io.load_df_split_times_raw(BENCH_YEAR),
+          synthetic.create_df_split_info(n_splits),
+          BENCH_YEAR)
+        for name, func in benchmarks.items():
+          if only is not None and only not in name:
+            continue
+          wall_s, peak_mb = time_func(func, repeat=repeat)
+          results.append({
+            'name': name,
+            'n_athletes': n_athletes,
+            'wall_s': wall_s,
+            'peak_mb': peak_mb,
+          })
+          print(f'{name:45s} {n_athletes:>8d} {wall_s:10.4f}s {peak_mb:10.1f}MB')
+    finally:
+      io.DATA_DIR = data_dir_orig
+
+  return {
+    'meta': {
+      'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+      'python': platform.python_version(),
+      'pandas': pd.__version__,
+      'n_splits': n_splits,
+      'dnf_rate': dnf_rate,
+      'missing_rate': missing_rate,
+      'repeat': repeat,
+      'seed': seed,
+    },
+    'results': results,
+  }
+
+
+def df_scaling(run):
+  """Wall time per benchmark (rows) and field size (columns).
+
+  The `exponent` column is the log-log slope between the smallest and
+  largest size: ~1 means linear in athletes, ~2 quadratic.
+  """
+  df = pd.DataFrame(run['results']).pivot(
+    index='name', columns='n_athletes', values='wall_s')
+  if len(df.columns) > 1:
+    n_st, n_ed = df.columns[0], df.columns[-1]
+    df['exponent'] = (
+      (df[n_ed] / df[n_st]).apply(math.log) / math.log(n_ed / n_st)
+    ).round(2)
+  return df
+
+
+def df_compare(run, run_base, threshold=1.2):
+  """Wall time ratio of `run` over `run_base` for shared benchmarks.
+
+  Rows slower by more than `threshold` are flagged as regressions.
+  """
+  keys = ['name', 'n_athletes']
+  df = pd.DataFrame(run['results']).merge(
+    pd.DataFrame(run_base['results']), on=keys, suffixes=('', '_base'))
+  df['ratio'] = (df['wall_s'] / df['wall_s_base']).round(2)
+  df['regression'] = df['ratio'] > threshold
+  return df.set_index(keys)[['wall_s_base', 'wall_s', 'ratio', 'regression']]
+
+
+def execute(argv=None):
+  if argv is None:
+    argv = sys.argv
+
+  arg_help = (
+    f'Usage\n'
+    f'=====\n'
+    f'  {argv[0]} [-n <athletes> ...] [-o <out.json>] [-c <base.json>]\n\n'
+    f'Benchmark the processing package on synthetic races\n\n'
+    f'Optional Arguments\n'
+    f'==================\n'
+    f'  -h, --help            show this help message and exit\n'
+    f'  -n, --athletes N      field size; repeat for a scaling curve\n'
+    f'                        (default 1000 and 10000)\n'
+    f'  -s, --splits N        number of splits (default 12)\n'
+    f'  --dnf-rate R          fraction of athletes who DNF (default 0.4)\n'
+    f'  --missing-rate R      chance of a missing split (default 0.02)\n'
+    f'  -r, --repeat N        timed runs per benchmark (default 3)\n'
+    f'  -k, --only NAME       only run benchmarks whose name contains NAME\n'
+    f'  -o, --output FILE     save results as json\n'
+    f'  -c, --compare FILE    compare against an earlier results json\n'
+  )
+
+  try:
+    opts, args = getopt.getopt(
+      argv[1:],
+      'hn:s:r:k:o:c:',
+      ['help', 'athletes=', 'splits=', 'dnf-rate=', 'missing-rate=',
+       'repeat=', 'only=', 'output=', 'compare=']
+    )
+  except getopt.GetoptError:
+    print(arg_help)
+    sys.exit(2)
+
+  sizes = []
+  kwargs = {}
+  fname_out = None
+  fname_base = None
+  for opt, arg in opts:
+    if opt in ('-h', '--help'):
+      print(arg_help)
+      sys.exit(0)
+    elif opt in ('-n', '--athletes'):
+      sizes.append(int(arg))
+    elif opt in ('-s', '--splits'):
+      kwargs['n_splits'] = int(arg)
+    elif opt == '--dnf-rate':
+      kwargs['dnf_rate'] = float(arg)
+    elif opt == '--missing-rate':
+      kwargs['missing_rate'] = float(arg)
+    elif opt in ('-r', '--repeat'):
+      kwargs['repeat'] = int(arg)
+    elif opt in ('-k', '--only'):
+      kwargs['only'] = arg
+    elif opt in ('-o', '--output'):
+      fname_out = arg
+    elif opt in ('-c', '--compare'):
+      fname_base = arg
+
+  run = run_benchmarks(sorted(sizes) or [1000, 10000], **kwargs)
+  print(df_scaling(run))
+
+  if fname_out is not None:
+    with open(fname_out, 'w') as f:
+      json.dump(run, f, indent=2)
+
+  if fname_base is not None:
+    with open(fname_base, 'r') as f:
+      df = df_compare(run, json.load(f))
+    print(df)
+    if df['regression'].any():
+      return 1
+
+
+if __name__ == "__main__":
+  sys.exit(execute())
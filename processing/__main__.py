@@ -0,0 +1,7 @@
+import sys
+
+from processing.cli import execute
+
+
+if __name__ == "__main__":
+  sys.exit(execute())
@@ -1,6 +1,77 @@
+import functools
+import os
+import warnings
+
+import numpy as np
 import pandas as pd
 
+from processing import io
 from processing import util
+from processing.results import RaceResults
+
+
+def _array_valid(df_split_times):
+  if isinstance(df_split_times, RaceResults):
+    return ~df_split_times.mask
+  return df_split_times.notna().to_numpy()
+
+
+def _to_df_split_times(df_split_times):
+  if isinstance(df_split_times, RaceResults):
+    return df_split_times.to_df_split_times()
+  return df_split_times
+
+
+def array_last_valid_split_position(df_split_times):
+  """Find the row position of the furthest split each athlete reached.
+
+  Computed once from the NA mask, rather than calling
+  `pd.Series.last_valid_index` on every column.
+
+  Like the other split stats functions, also accepts `RaceResults`,
+  whose missing mask is used directly.
+
+  Returns:
+    np.ndarray: int64 row position for each athlete (column).
+      -1 for athletes with no valid split data at all.
+  """
+  arr_valid = _array_valid(df_split_times)
+  if not len(arr_valid):
+    # No splits for anyone to have reached.
+    return np.full(arr_valid.shape[1], -1, dtype='int64')
+  # Flip the rows so argmax finds the last valid split, not the first.
+  arr_pos = arr_valid.shape[0] - 1 - arr_valid[::-1].argmax(axis=0)
+  arr_pos[~arr_valid.any(axis=0)] = -1
+  return arr_pos.astype('int64')
+
+
+def array_number_stopped_by_split(df_split_times, arr_last_valid=None):
+  """Count athletes whose last valid split is each split, in one bincount.
+
+  Athletes with no valid splits are not counted anywhere, same as
+  `group_athletes_by_last_valid_split`.
+  """
+  if arr_last_valid is None:
+    arr_last_valid = array_last_valid_split_position(df_split_times)
+  return np.bincount(arr_last_valid[arr_last_valid >= 0],
+    minlength=len(df_split_times.index))
+
+
+def group_athlete_positions_by_last_valid_split(df_split_times):
+  """Group athlete column positions by the last split they reached.
+
+  Like `group_athletes_by_last_valid_split`, but yields integer column
+  positions instead of slicing a new DataFrame for every split.
+  """
+  arr_last_valid = array_last_valid_split_position(df_split_times)
+  # One stable sort groups the athletes; each group keeps column order.
+  arr_order = np.argsort(arr_last_valid, kind='stable')
+  arr_bounds = np.searchsorted(arr_last_valid[arr_order],
+    np.arange(len(df_split_times.index) + 1))
+  return (
+    (split_label, arr_order[arr_bounds[i]:arr_bounds[i + 1]])
+    for i, split_label in enumerate(df_split_times.index)
+  )
 
 
 def group_athletes_by_last_valid_split(df_split_times):
@@ -9,29 +80,33 @@ def group_athletes_by_last_valid_split(df_split_times):
   return (
     (
       split_label,
-      # print(split_name)
-      df_split_times.loc[
+      df_split_times.iloc[
         # subset of rows up to and including current split
-        :split_label,
+        :i + 1,
         # subset of columns whose last valid split is the current split
-        df_split_times.apply(pd.Series.last_valid_index) == split_label
+        arr_cols
       ]
     )
-    for split_label in df_split_times.index
+    for i, (split_label, arr_cols)
+    in enumerate(group_athlete_positions_by_last_valid_split(df_split_times))
   )
 
 
 def series_number_stopped_by_split(df_split_times):
-  return pd.Series({
-    split_name: len(df_split_times_stn.columns)
-    for split_name, df_split_times_stn 
-    in group_athletes_by_last_valid_split(df_split_times)
-  })
+  return pd.Series(array_number_stopped_by_split(df_split_times),
+    index=df_split_times.index)
+
+
+def _array_athletes_through_each_split(arr_stopped):
+  # Reverse cumsum: everyone who stopped at this split or any later one.
+  return arr_stopped[::-1].cumsum()[::-1]
 
 
 def series_athletes_through_each_split(df_split_times):
-  s = series_number_stopped_by_split(df_split_times)
-  return s.sum() - s.cumsum().shift(1, fill_value=0)
+  return pd.Series(
+    _array_athletes_through_each_split(
+      array_number_stopped_by_split(df_split_times)),
+    index=df_split_times.index)
 
 
 def series_gross_dnf_rate_after_split(df_split_times):
@@ -40,21 +115,120 @@ def series_gross_dnf_rate_after_split(df_split_times):
 
 
 def series_net_dnf_rate_after_split(df_split_times):
-  return 100 * series_number_stopped_by_split(df_split_times
-    ).div(series_athletes_through_each_split(df_split_times))
+  arr_stopped = array_number_stopped_by_split(df_split_times)
+  return 100 * pd.Series(arr_stopped, index=df_split_times.index
+    ).div(_array_athletes_through_each_split(arr_stopped))
 
 
-def df_split_stats(df_split_times):
+def _df_split_stats_from_stopped(arr_stopped, index):
+  arr_through = _array_athletes_through_each_split(arr_stopped)
+  s_stopped = pd.Series(arr_stopped, index=index)
   return pd.DataFrame({
-    'num_athletes_to_split': series_athletes_through_each_split(df_split_times),
-    'num_athletes_dnf_after_split': series_number_stopped_by_split(df_split_times),
-    'gross_dnf_rate_after_split': series_gross_dnf_rate_after_split(df_split_times).round(1),
-    'net_dnf_rate_after_split': series_net_dnf_rate_after_split(df_split_times).round(1),
+    'num_athletes_to_split': pd.Series(arr_through, index=index),
+    'num_athletes_dnf_after_split': s_stopped,
+    'gross_dnf_rate_after_split': (100 * s_stopped / arr_stopped.sum()).round(1),
+    'net_dnf_rate_after_split': (100 * s_stopped.div(arr_through)).round(1),
   }).convert_dtypes()
 
 
+def df_split_stats(df_split_times):
+  """Athletes reaching, and stopping after, each split.
+
+  The furthest split for each athlete is found once; every column
+  is derived from the resulting counts.
+  """
+  return _df_split_stats_from_stopped(
+    array_number_stopped_by_split(df_split_times), df_split_times.index)
+
+
+def _array_rank_keys(df_split_times):
+  # Missing splits sort after every valid one.
+  return np.where(_array_valid(df_split_times), _array_secs(df_split_times),
+    np.inf)
+
+
+def array_split_ranks(df_split_times):
+  """Rank of every athlete at every split, all splits in one pass.
+
+  One argsort along the athletes axis covers every split at once. Ties
+  share the best rank (like `rank(method='min')`), and missing splits
+  aren't ranked, so they don't push anyone down.
+
+  Returns:
+    np.ndarray: float64 ranks, splits x athletes, NaN where missing.
+  """
+  arr_keys = _array_rank_keys(df_split_times)
+  n_athletes = arr_keys.shape[1]
+  arr_order = np.argsort(arr_keys, axis=1, kind='stable')
+  arr_sorted = np.take_along_axis(arr_keys, arr_order, axis=1)
+
+  arr_is_new = np.ones(arr_sorted.shape, dtype=bool)
+  arr_is_new[:, 1:] = arr_sorted[:, 1:] != arr_sorted[:, :-1]
+  # Each tied run takes the rank of its first member.
+  arr_ranks_sorted = 1 + np.maximum.accumulate(
+    np.where(arr_is_new, np.arange(n_athletes), 0), axis=1)
+
+  arr_ranks = np.empty(arr_keys.shape, dtype='float64')
+  np.put_along_axis(arr_ranks, arr_order, arr_ranks_sorted, axis=1)
+  arr_ranks[np.isinf(arr_keys)] = np.nan
+  return arr_ranks
+
+
+def df_split_ranks(df_split_times, arr_ranks=None):
+  """Rank of every athlete at every aid station.
+
+  Columns keep the order of `df_split_times`, so ranks line up with a
+  frame from `cleaners.sort_df_split_data` (or can be sorted the same
+  way with `cleaners.sort_df_split_data_columns(column_order=...)`).
+  """
+  if arr_ranks is None:
+    arr_ranks = array_split_ranks(df_split_times)
+  return pd.DataFrame(arr_ranks, index=df_split_times.index,
+    columns=df_split_times.columns).astype('Int64')
+
+
+def df_position_changes(df_split_times, arr_ranks=None):
+  """Positions gained (positive) or lost (negative) over each segment.
+
+  Segments run between consecutive splits, indexed like
+  `create_segment_index(..., include_start=False)`. Missing if the
+  athlete is missing either end.
+  """
+  if arr_ranks is None:
+    arr_ranks = array_split_ranks(df_split_times)
+  return pd.DataFrame(arr_ranks[:-1] - arr_ranks[1:],
+    index=create_segment_index(df_split_times, include_start=False),
+    columns=df_split_times.columns).astype('Int64')
+
+
+def df_top_n_by_split(df_split_times, n=10):
+  """The fastest `n` athletes at each split, in order.
+
+  Uses a partial sort (argpartition), so only the top `n` of each
+  split are ever fully sorted. Ties at the cutoff are broken
+  arbitrarily.
+
+  Returns:
+    pd.DataFrame: athlete names, splits x positions 1..n.
+      None where fewer than `n` athletes reached a split.
+  """
+  arr_keys = _array_rank_keys(df_split_times)
+  n = min(n, arr_keys.shape[1])
+  arr_top = np.argpartition(arr_keys, n - 1, axis=1)[:, :n]
+  arr_top = np.take_along_axis(arr_top,
+    np.argsort(np.take_along_axis(arr_keys, arr_top, axis=1), axis=1,
+      kind='stable'),
+    axis=1)
+
+  arr_names = np.asarray(df_split_times.columns, dtype=object)[arr_top]
+  arr_names[np.isinf(np.take_along_axis(arr_keys, arr_top, axis=1))] = None
+  return pd.DataFrame(arr_names, index=df_split_times.index,
+    columns=pd.RangeIndex(1, n + 1, name='rank'))
+
+
 def df_split_times_none_missing(df_split_times):
   """Find athletes who aren't missing any split times."""
+  df_split_times = _to_df_split_times(df_split_times)
   util.print_td(df_split_times)
   return df_split_times[df_split_times.columns[
     ~df_split_times.isnull().any()]]
@@ -64,23 +238,115 @@ def df_segment_times(df_split_times):
   """figure out how much time each athlete spent between each aid
   
   NOTE: This function has only been tested on a DataFrame with 
-  NO missing split data. 
+  NO missing split data. See `df_segment_times_valid` for data with
+  missing splits.
   """
+  if isinstance(df_split_times, RaceResults):
+    arr_mask = df_split_times.mask.copy()
+    arr_mask[1:] |= df_split_times.mask[:-1]
+    return pd.DataFrame(
+      io.array_to_array_td(
+        np.diff(df_split_times.secs, axis=0, prepend=0), arr_mask),
+      index=df_split_times.index, columns=df_split_times.columns)
+
   df_out = df_split_times.diff(1)  # .fillna(df_split_times)
   df_out.iloc[0, :] = df_split_times.iloc[0, :]
   # df_out.index = create_segment_index(df_split_times)
   return df_out
 
 
+def _array_secs(df_split_times):
+  """Split data as float seconds; values where data is missing are junk."""
+  if isinstance(df_split_times, RaceResults):
+    return df_split_times.secs.astype('float64')
+  arr = df_split_times.to_numpy()
+  if arr.dtype.kind == 'm':
+    return arr.astype('timedelta64[ns]').view('int64') / util.NS_PER_SEC
+  return df_split_times.to_numpy(dtype='float64', na_value=np.nan)
+
+
+def array_split_secs(df_split_times):
+  """Split data as float seconds, NaN where missing.
+
+  Accepts timedelta or numeric DataFrames, and RaceResults.
+  """
+  return np.where(_array_valid(df_split_times), _array_secs(df_split_times),
+    np.nan)
+
+
+def df_segment_times_valid(df_split_times, include_start=True):
+  """Time between each pair of consecutive reached splits, for everyone.
+
+  Unlike `df_segment_times`, athletes with missing splits are kept: a
+  segment spans from each valid split to the next valid one, the same
+  segments `create_segment_index_valid` finds one athlete at a time.
+  Here it's done for the whole matrix at once, by forward-filling the
+  position of the last valid split.
+
+  Args:
+    include_start (bool): include each athlete's segment from 'Start'
+      to their first valid split (see `create_segment_index`).
+  Returns:
+    pd.DataFrame: long form, one row per (athlete, segment), with
+      'athlete' and 'seconds' columns, indexed by (label_st, label_ed).
+  """
+  arr_valid = _array_valid(df_split_times)
+  arr_secs = _array_secs(df_split_times)
+  # -1 means 'Start'.
+  arr_pos_prev = util.array_prev_valid_position(arr_valid)
+
+  # Transposed, so rows come out grouped by athlete, in split order.
+  ix_athlete, ix_ed = np.nonzero(arr_valid.T)
+  ix_st = arr_pos_prev[ix_ed, ix_athlete]
+  if not include_start:
+    keep = ix_st >= 0
+    ix_athlete, ix_ed, ix_st = ix_athlete[keep], ix_ed[keep], ix_st[keep]
+
+  arr_secs_st = np.where(ix_st >= 0,
+    arr_secs[np.maximum(ix_st, 0), ix_athlete], 0.0)
+  # 'Start' goes last, so position -1 picks it.
+  arr_labels = np.array(df_split_times.index.to_list() + ['Start'],
+    dtype=object)
+
+  return pd.DataFrame(
+    {
+      'athlete': df_split_times.columns[ix_athlete],
+      'seconds': arr_secs[ix_ed, ix_athlete] - arr_secs_st,
+    },
+    index=pd.MultiIndex.from_arrays([arr_labels[ix_st], arr_labels[ix_ed]],
+      names=('label_st', 'label_ed')),
+  )
+
+
 def df_segment_percent_of_total(df_split_times):
   """% of total time
   
   aka "split_fraction"
   """
-  return 100.0 * df_segment_times(df_split_times) / df_split_times.iloc[-1, :]
+  return 100.0 * df_segment_times(df_split_times
+    ) / _to_df_split_times(df_split_times).iloc[-1, :]
+
+
+def _stats_df_race_results(results):
+  arr_secs = np.where(results.mask, np.nan, results.secs)
+  with warnings.catch_warnings():
+    # Splits nobody reached are all-NaN; their stats are NaN (NaT).
+    warnings.simplefilter('ignore', category=RuntimeWarning)
+    dict_stats = {
+      'median': np.nanmedian(arr_secs, axis=1),
+      'mean': np.nanmean(arr_secs, axis=1),
+      'std': np.nanstd(arr_secs, axis=1, ddof=1),
+      'min': np.nanmin(arr_secs, axis=1),
+      'max': np.nanmax(arr_secs, axis=1),
+    }
+  return pd.DataFrame(
+    {name: pd.to_timedelta(arr, unit='s') for name, arr in dict_stats.items()},
+    index=results.index)
 
 
 def stats_df(df):
+  if isinstance(df, RaceResults):
+    return _stats_df_race_results(df)
   df_stats = pd.DataFrame(index=df.index)
   df_stats['median'] = df.median(axis=1)
   df_stats['mean'] = df.mean(axis=1)
@@ -153,3 +419,370 @@ def create_segment_index_valid(series_split_times):
       index_split_labels_valid[1:],
     ],
     names=('label_st', 'label_ed'))
+
+
+# Chunked (out-of-core) execution.
+#
+# Each function below takes an iterable of chunks: RaceResults or
+# DataFrames holding the same splits, each with a batch of athletes.
+# Only one chunk is in memory at a time; partial results are merged
+# as they go, so peak memory is set by chunk size, not field size.
+
+CHUNK_SIZE = 10000
+
+
+def iter_race_results_chunks(race_year, chunk_size=CHUNK_SIZE,
+                             results_store=None, fmt=None):
+  """Yield a year's clean split data as RaceResults, `chunk_size`
+  athletes at a time.
+
+  Reads from `results_store` if given, otherwise from the year's clean
+  directory. Both the store and the `.npy` clean format are memory
+  mapped, so each chunk only reads its own athletes from disk. A csv
+  clean file has to be parsed whole first.
+  """
+  if results_store is None:
+    arr_secs, arr_mask, index, columns = io.load_arrays_secs_clean(race_year,
+      fmt=fmt)
+  else:
+    arr_secs, arr_mask = results_store.arrays(race_year)
+    index, columns = results_store.get_labels(race_year)
+  try:
+    df_split_info = io.load_df_split_info_clean(race_year)
+  except FileNotFoundError:
+    df_split_info = None
+
+  for ix_st in range(0, len(columns), chunk_size):
+    ix_ed = ix_st + chunk_size
+    yield RaceResults.from_arrays_athletes_major(
+      arr_secs[ix_st:ix_ed], arr_mask[ix_st:ix_ed],
+      index, columns[ix_st:ix_ed], df_split_info=df_split_info)
+
+
+def _iter_chunks_or_empty(chunks, index):
+  # With no chunks at all, stand in one empty chunk, so results still
+  # come out with their splits (all zero or NaN).
+  is_empty = True
+  for chunk in chunks:
+    is_empty = False
+    yield chunk
+  if is_empty:
+    yield pd.DataFrame(
+      index=pd.Index([] if index is None else index, name=io.INDEX_NAME))
+
+
+def df_split_stats_chunked(chunks, index=None):
+  """`df_split_stats`, from stopped counts summed chunk by chunk.
+
+  Identical to the in-memory result.
+
+  Args:
+    index (pd.Index): split labels, for when `chunks` turns out empty
+      (eg. a year with no athletes): the result then has zero counts.
+      Without it, an empty result has no splits either.
+  """
+  arr_stopped = None
+  for chunk in _iter_chunks_or_empty(chunks, index):
+    if arr_stopped is None:
+      arr_stopped = array_number_stopped_by_split(chunk)
+      index_chunks = chunk.index
+    else:
+      arr_stopped = arr_stopped + array_number_stopped_by_split(chunk)
+  return _df_split_stats_from_stopped(arr_stopped, index_chunks)
+
+
+def accumulate_stats_chunked(chunks, segments=False, index=None, **kwargs):
+  """Feed each chunk (or its segment times) to a StatsAccumulator.
+
+  Args:
+    segments (bool): accumulate `df_segment_times` of each chunk,
+      rather than the split times themselves.
+    index (pd.Index): split labels, as in `df_split_stats_chunked`.
+    kwargs: passed to `streaming.StatsAccumulator`.
+  Returns:
+    streaming.StatsAccumulator: merged over every chunk.
+  """
+  # streaming builds on this module, so import it here.
+  from processing import streaming
+
+  accumulator = None
+  for chunk in _iter_chunks_or_empty(chunks, index):
+    df_chunk = df_segment_times(chunk) if segments else chunk
+    if accumulator is None:
+      accumulator = streaming.StatsAccumulator(df_chunk.index, **kwargs)
+    accumulator.update_df(df_chunk)
+  return accumulator
+
+
+def stats_df_chunked(chunks, segments=False, index=None, **kwargs):
+  """`stats_df` of split (or segment) times, chunk by chunk.
+
+  Mean, std, min and max are exact; the median is accurate to within
+  the accumulator's bin width (see `streaming.StatsAccumulator`).
+  Like `stats_df` on times, every column is a timedelta.
+  """
+  df_stats = accumulate_stats_chunked(chunks, segments=segments, index=index,
+    **kwargs).stats_df()
+  # Via integer ns and a mask, as casting NaN to a timedelta warns.
+  arr_stats = df_stats.to_numpy(dtype='float64')
+  arr_null = np.isnan(arr_stats)
+  return pd.DataFrame(
+    io.array_to_array_td(np.round(np.where(arr_null, 0, arr_stats) * 1e9),
+      arr_null, unit='ns'),
+    index=df_stats.index, columns=df_stats.columns)
+
+
+# Cutoffs.
+
+CUTOFF_SURVIVAL_MINUTES = np.arange(0, 121, 5)
+
+
+def _array_split_info(df_split_times, df_split_info, col):
+  """One split info column, aligned with the split data's rows."""
+  if df_split_info is None:
+    if isinstance(df_split_times, RaceResults):
+      return getattr(df_split_times, col)
+    raise ValueError(f'`df_split_info` is needed for {col}.')
+  return df_split_info[col].reindex(df_split_times.index
+    ).to_numpy(dtype='float64')
+
+
+def array_cutoff_margin_secs(df_split_times, df_split_info=None):
+  """Seconds to spare before each split's cutoff, for every athlete.
+
+  Each split's `cutoff_hr` is broadcast against the whole time matrix
+  in one operation. Negative means the athlete arrived after the
+  cutoff. NaN where the split is missing or has no cutoff.
+
+  Returns:
+    np.ndarray: float64, splits x athletes.
+  """
+  arr_cutoff_secs = 3600 * _array_split_info(df_split_times, df_split_info,
+    'cutoff_hr')
+  return arr_cutoff_secs[:, np.newaxis] - array_split_secs(df_split_times)
+
+
+def df_cutoff_margins(df_split_times, df_split_info=None, arr_margin=None):
+  """Margin to each split's cutoff, as timedeltas."""
+  if arr_margin is None:
+    arr_margin = array_cutoff_margin_secs(df_split_times, df_split_info)
+  return pd.DataFrame(
+    io.array_to_array_td(np.nan_to_num(np.round(arr_margin)),
+      np.isnan(arr_margin)),
+    index=df_split_times.index, columns=df_split_times.columns)
+
+
+def df_tightest_cutoff(df_split_times, df_split_info=None, arr_margin=None):
+  """Each athlete's closest call: the split with the smallest margin.
+
+  Returns:
+    pd.DataFrame: indexed by athlete, with the split 'label' and the
+      'margin' there. Missing for athletes who never reached a split
+      with a cutoff.
+  """
+  if arr_margin is None:
+    arr_margin = array_cutoff_margin_secs(df_split_times, df_split_info)
+  arr_has_margin = ~np.isnan(arr_margin).all(axis=0)
+  ix_tightest = np.argmin(np.where(np.isnan(arr_margin), np.inf, arr_margin),
+    axis=0)
+  arr_tightest = arr_margin[ix_tightest, np.arange(arr_margin.shape[1])]
+  return pd.DataFrame(
+    {
+      'label': pd.Series(df_split_times.index[ix_tightest]).where(
+        arr_has_margin).to_numpy(),
+      'margin': pd.to_timedelta(arr_tightest, unit='s'),
+    },
+    index=df_split_times.columns,
+  )
+
+
+def df_cutoff_survival(df_split_times, df_split_info=None, arr_margin=None,
+                       minutes=CUTOFF_SURVIVAL_MINUTES):
+  """How many athletes made each cutoff with at most N minutes to spare.
+
+  Athletes past the cutoff aren't counted. Every split and every N is
+  covered by one searchsorted, one bincount and one cumsum.
+
+  Returns:
+    pd.DataFrame: athlete counts, splits x minutes. Only splits with a
+      cutoff are included.
+  """
+  if arr_margin is None:
+    arr_margin = array_cutoff_margin_secs(df_split_times, df_split_info)
+  arr_minutes = np.asarray(minutes)
+  n_splits = arr_margin.shape[0]
+
+  ix_split, ix_athlete = np.nonzero(arr_margin >= 0)
+  ix_bin = np.searchsorted(60 * arr_minutes, arr_margin[ix_split, ix_athlete],
+    side='left')
+  # Margins over the largest N land in an extra bin that's dropped.
+  arr_counts = np.bincount(ix_split * (len(arr_minutes) + 1) + ix_bin,
+    minlength=n_splits * (len(arr_minutes) + 1)
+    ).reshape(n_splits, len(arr_minutes) + 1)[:, :-1].cumsum(axis=1)
+
+  has_cutoff = ~np.isnan(_array_split_info(df_split_times, df_split_info,
+    'cutoff_hr'))
+  return pd.DataFrame(arr_counts[has_cutoff],
+    index=df_split_times.index[has_cutoff],
+    columns=pd.Index(arr_minutes, name='minutes'))
+
+
+@functools.lru_cache(maxsize=16)
+def _get_cutoff_analysis(race_year, mtimes):
+  results = RaceResults.from_clean(race_year)
+  arr_margin = array_cutoff_margin_secs(results)
+  return {
+    'margins': df_cutoff_margins(results, arr_margin=arr_margin),
+    'tightest': df_tightest_cutoff(results, arr_margin=arr_margin),
+    'survival': df_cutoff_survival(results, arr_margin=arr_margin),
+  }
+
+
+def _get_clean_mtimes(race_year, split_info_only=False):
+  # Part of cache keys, so caches refresh when clean data is re-saved.
+  fnames = [
+    os.path.join(io.get_clean_race_data_dir(race_year), io.SPLIT_INFO_FNAME)]
+  if not split_info_only:
+    fnames.append(io.get_split_secs_clean_fname(race_year))
+  return tuple(os.path.getmtime(fname) for fname in fnames)
+
+
+def get_cutoff_analysis(race_year):
+  """Cutoff margins, tightest cutoffs and survival curves for a year.
+
+  Cached per year (until its clean files change), so interactive plots
+  can redraw without recomputing. The cached DataFrames are shared;
+  copy before modifying them.
+
+  Returns:
+    dict: 'margins', 'tightest' and 'survival' DataFrames.
+  """
+  return _get_cutoff_analysis(race_year, _get_clean_mtimes(race_year))
+
+
+# Pace.
+
+def create_segment_distance_matrix(arr_distance_mi):
+  """Distance between every pair of stations, start included.
+
+  Position 0 is the start line and position i + 1 is split i, so
+  `arr[i + 1, j + 1]` is the distance from split i to split j.
+  """
+  arr_station_mi = np.concatenate([[0.0], arr_distance_mi])
+  return arr_station_mi[np.newaxis, :] - arr_station_mi[:, np.newaxis]
+
+
+@functools.lru_cache(maxsize=16)
+def _get_course_geometry(race_year, mtimes):
+  df_split_info = io.load_df_split_info_clean(race_year)
+  labels = ['Start'] + df_split_info.index.to_list()
+  return {
+    'distance_mi': df_split_info['distance_mi'],
+    'segment_mi': pd.DataFrame(
+      create_segment_distance_matrix(
+        df_split_info['distance_mi'].to_numpy(dtype='float64')),
+      index=pd.Index(labels, name='label_st'),
+      columns=pd.Index(labels, name='label_ed')),
+  }
+
+
+def get_course_geometry(race_year):
+  """A year's split distances and every station-to-station distance.
+
+  Computed once per course and cached by year (until the clean split
+  info changes).
+
+  Returns:
+    dict: 'distance_mi' Series by split label, and 'segment_mi', a
+      DataFrame of distances from each station (rows) to each station
+      (columns), 'Start' included.
+  """
+  return _get_course_geometry(race_year,
+    _get_clean_mtimes(race_year, split_info_only=True))
+
+
+def array_segment_pace(df_split_times, df_split_info=None, arr_segment_mi=None):
+  """Pace (min/mi) into each valid split, for every athlete at once.
+
+  Each segment spans from the athlete's previous valid station (or the
+  start) to the split, so missing splits are bridged, not dropped.
+
+  Args:
+    arr_segment_mi (np.ndarray): from `create_segment_distance_matrix`,
+      eg. a cached `get_course_geometry(race_year)['segment_mi']`.
+      Built from split info distances if not given.
+  Returns:
+    np.ndarray: float64, splits x athletes, NaN where the split is
+      missing or the segment has no known distance.
+  """
+  if arr_segment_mi is None:
+    arr_segment_mi = create_segment_distance_matrix(
+      _array_split_info(df_split_times, df_split_info, 'distance_mi'))
+  arr_valid = _array_valid(df_split_times)
+  arr_secs = _array_secs(df_split_times)
+  n_splits, n_athletes = arr_valid.shape
+
+  arr_pos_prev = util.array_prev_valid_position(arr_valid)
+  arr_secs_prev = np.where(arr_pos_prev >= 0,
+    arr_secs[np.maximum(arr_pos_prev, 0), np.arange(n_athletes)], 0.0)
+  arr_mi = np.asarray(arr_segment_mi)[arr_pos_prev + 1,
+    np.arange(1, n_splits + 1)[:, np.newaxis]]
+
+  with np.errstate(divide='ignore', invalid='ignore'):
+    arr_pace = (arr_secs - arr_secs_prev) / 60 / arr_mi
+  return np.where(arr_valid & (arr_mi > 0), arr_pace, np.nan)
+
+
+def df_segment_pace(df_split_times, df_split_info=None, arr_segment_mi=None):
+  """Pace (min/mi) into each split, splits x athletes.
+
+  See `array_segment_pace`.
+  """
+  return pd.DataFrame(
+    array_segment_pace(df_split_times, df_split_info=df_split_info,
+      arr_segment_mi=arr_segment_mi),
+    index=df_split_times.index.rename('label_ed'),
+    columns=df_split_times.columns)
+
+
+def df_segment_pace_valid(df_split_times, df_split_info=None,
+                          segment_mi=None):
+  """`df_segment_times_valid`, plus each segment's distance and pace.
+
+  Args:
+    segment_mi (pd.DataFrame): station-to-station distances, as in
+      `get_course_geometry`. Built from split info if not given.
+  """
+  if segment_mi is None:
+    labels = ['Start'] + df_split_times.index.to_list()
+    segment_mi = pd.DataFrame(
+      create_segment_distance_matrix(
+        _array_split_info(df_split_times, df_split_info, 'distance_mi')),
+      index=labels, columns=labels)
+  df = df_segment_times_valid(df_split_times)
+  ix_st = segment_mi.index.get_indexer(df.index.get_level_values('label_st'))
+  ix_ed = segment_mi.columns.get_indexer(df.index.get_level_values('label_ed'))
+  df['distance_mi'] = segment_mi.to_numpy()[ix_st, ix_ed]
+  df['pace'] = (df['seconds'] / 60 / df['distance_mi']).where(
+    df['distance_mi'] > 0)
+  return df
+
+
+def df_segment_pace_years(race_years=None):
+  """Long-form segment paces for every athlete in many years at once.
+
+  Course geometry comes from the per-year cache.
+
+  Returns:
+    pd.DataFrame: `df_segment_pace_valid` for each year, stacked with
+      a 'race_year' column.
+  """
+  if race_years is None:
+    race_years = io.get_race_years()
+  dfs = []
+  for race_year in race_years:
+    df = df_segment_pace_valid(RaceResults.from_clean(race_year),
+      segment_mi=get_course_geometry(race_year)['segment_mi'])
+    df.insert(0, 'race_year', race_year)
+    dfs.append(df)
+  return pd.concat(dfs)
@@ -0,0 +1,285 @@
+"""Cross-year athlete index: stable IDs from normalized names.
+
+Athletes only exist as column labels, and the same runner can be
+spelled 'José  Smith' one year and 'jose smith' the next. `AthleteIndex`
+normalizes names (case, accents, whitespace), gives each distinct
+normalized name a stable integer ID, and records the column position
+of each ID in each year.
+
+IDs are never reassigned: re-indexing a year or adding a new one keeps
+every existing ID, and the index persists as json in the data
+directory. Positions are only good for the columns they were indexed
+from, so each year also keeps a hash of its athlete labels, and joins
+refuse data whose columns have changed since (re-index the year).
+
+Lookups are dict lookups, and joins index per-year position arrays
+with the requested IDs, so cohort queries cost O(matches), not
+O(athletes x years). Two athletes with the same normalized name in one
+year share an ID; joins take the first.
+
+  index = AthleteIndex.load()
+  ids = index.get_returning_ids([2019, 2021, 2022])
+  df = index.df_split_secs_by_year(ids)  # finish times, ID x year
+"""
+import hashlib
+import json
+import os
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from processing import io
+from processing.results import RaceResults
+
+
+ATHLETE_INDEX_FNAME = 'athlete_index.json'
+
+
+def get_athlete_index_fname():
+  return os.path.join(io.DATA_DIR, ATHLETE_INDEX_FNAME)
+
+
+def hash_athlete_labels(athletes):
+  """Fingerprint of a year's athlete columns, names and order."""
+  return hashlib.sha256(
+    json.dumps([str(athlete) for athlete in athletes]).encode()).hexdigest()
+
+
+def normalize_name(name):
+  """Casefolded, accents stripped, whitespace collapsed."""
+  decomposed = unicodedata.normalize('NFKD', str(name))
+  stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+  return ' '.join(stripped.casefold().split())
+
+
+class AthleteIndex:
+  """Stable athlete IDs and where each one appears, year by year.
+
+  Attributes:
+    names (list): display name of each ID (as first seen).
+  """
+  def __init__(self):
+    self.names = []
+    self._ids = {}
+    self._year_ids = {}
+    self._year_hashes = {}
+    self._year_positions = {}
+
+  @property
+  def race_years(self):
+    return sorted(self._year_ids)
+
+  def __len__(self):
+    return len(self.names)
+
+  def _get_or_add_id(self, name):
+    key = normalize_name(name)
+    athlete_id = self._ids.get(key)
+    if athlete_id is None:
+      athlete_id = self._ids[key] = len(self.names)
+      self.names.append(name)
+    return athlete_id
+
+  def add_year(self, race_year, athletes):
+    """Index (or re-index) one year's athlete columns, in column order."""
+    self._year_ids[race_year] = np.array(
+      [self._get_or_add_id(athlete) for athlete in athletes], dtype='int64')
+    self._year_hashes[race_year] = hash_athlete_labels(athletes)
+    self._year_positions.clear()
+    return self
+
+  def _get_year_positions(self, race_year):
+    # ID -> column position in `race_year` (-1 if absent), built on
+    # first use after the index changes.
+    if race_year not in self._year_positions:
+      arr_ids = self._year_ids[race_year]
+      arr_pos = np.full(len(self.names), -1, dtype='int64')
+      # Reversed, so the first of any duplicate positions wins.
+      arr_pos[arr_ids[::-1]] = np.arange(len(arr_ids))[::-1]
+      self._year_positions[race_year] = arr_pos
+    return self._year_positions[race_year]
+
+  def get_id(self, name):
+    """ID for a name (in any spelling that normalizes the same), or None."""
+    return self._ids.get(normalize_name(name))
+
+  def get_ids(self, names):
+    """IDs for many names; -1 for names not in the index."""
+    return np.array([self._ids.get(normalize_name(name), -1) for name in names],
+      dtype='int64')
+
+  def get_positions(self, athlete_id):
+    """(year, column position) of each of an athlete's results."""
+    return [
+      (race_year, int(self._get_year_positions(race_year)[athlete_id]))
+      for race_year in self.race_years
+      if self._get_year_positions(race_year)[athlete_id] >= 0
+    ]
+
+  def check_columns(self, race_year, athletes):
+    """Raise if a year's columns aren't the ones it was indexed from."""
+    if self._year_hashes.get(race_year) != hash_athlete_labels(athletes):
+      raise ValueError(
+        f'{race_year} athletes changed since they were indexed; '
+        f're-index the year (`update_athlete_index`).')
+
+  def get_year_ids(self, race_year):
+    """ID of each athlete column in a year."""
+    return self._year_ids[race_year]
+
+  def get_returning_ids(self, race_years=None, min_years=None):
+    """IDs of athletes with results in several years.
+
+    Args:
+      race_years (list): years to look in; defaults to every year.
+      min_years (int): how many of them an athlete needs; defaults to
+        all of them.
+    Returns:
+      np.ndarray: sorted IDs.
+    """
+    if race_years is None:
+      race_years = self.race_years
+    if min_years is None:
+      min_years = len(race_years)
+    arr_counts = np.bincount(
+      np.concatenate([np.unique(self._year_ids[year]) for year in race_years]),
+      minlength=len(self.names))
+    return np.flatnonzero(arr_counts >= min_years)
+
+  def get_column_positions(self, ids, race_year):
+    """Column position of each ID in `race_year`, -1 if absent."""
+    return self._get_year_positions(race_year)[np.asarray(ids, dtype='int64')]
+
+  def dfs_split_secs(self, ids, race_years=None, results_store=None):
+    """Split seconds for the same athletes in several years, aligned.
+
+    Args:
+      ids (array-like): athlete IDs, in the column order wanted.
+      race_years (list): defaults to every indexed year.
+      results_store (io.ResultsStore): read from the store rather than
+        each year's clean directory.
+    Returns:
+      dict: race year -> nullable-int (`Int32`) DataFrame, splits x
+        `ids`, all NA for athletes without a result that year.
+    """
+    ids = np.asarray(ids, dtype='int64')
+    dfs = {}
+    for race_year in race_years or self.race_years:
+      results = _load_race_results(race_year, results_store)
+      self.check_columns(race_year, results.columns)
+      ix_pos = self.get_column_positions(ids, race_year)
+      has_result = ix_pos >= 0
+      ix_safe = np.maximum(ix_pos, 0)
+      df = RaceResults(
+        np.asfortranarray(results.secs[:, ix_safe]),
+        np.asfortranarray(results.mask[:, ix_safe] | ~has_result),
+        results.index, ids,
+      ).to_df_split_secs()
+      df.columns.name = 'athlete_id'
+      dfs[race_year] = df
+    return dfs
+
+  def df_split_secs_by_year(self, ids, label=None, race_years=None,
+                            results_store=None):
+    """Seconds at one split for the same athletes across years.
+
+    Args:
+      label (str): split label; defaults to each year's last split
+        (the finish).
+    Returns:
+      pd.DataFrame: nullable-int, `ids` x years.
+    """
+    dfs = self.dfs_split_secs(ids, race_years=race_years,
+      results_store=results_store)
+    df = pd.DataFrame({
+      race_year: df_year.iloc[-1] if label is None else df_year.loc[label]
+      for race_year, df_year in dfs.items()
+    })
+    df.index.name = 'athlete_id'
+    df.insert(0, 'name', [self.names[athlete_id] for athlete_id in df.index])
+    return df
+
+  def to_dict(self):
+    return {
+      'names': self.names,
+      'years': {
+        str(race_year): arr_ids.tolist()
+        for race_year, arr_ids in sorted(self._year_ids.items())
+      },
+      'year_hashes': {
+        str(race_year): labels_hash
+        for race_year, labels_hash in sorted(self._year_hashes.items())
+      },
+    }
+
+  @classmethod
+  def from_dict(cls, index_dict):
+    index = cls()
+    index.names = list(index_dict['names'])
+    # Earlier IDs win if two stored names normalize the same.
+    for athlete_id in range(len(index.names) - 1, -1, -1):
+      index._ids[normalize_name(index.names[athlete_id])] = athlete_id
+    index._year_ids = {
+      int(race_year): np.array(arr_ids, dtype='int64')
+      for race_year, arr_ids in index_dict['years'].items()
+    }
+    # (missing from indexes saved before hashes were kept, so those
+    # years fail the check until re-indexed)
+    index._year_hashes = {
+      int(race_year): labels_hash
+      for race_year, labels_hash in index_dict.get('year_hashes', {}).items()
+    }
+    return index
+
+  def save(self, fname=None):
+    fname = fname or get_athlete_index_fname()
+    # Write then rename, so a crash never leaves a half-written index.
+    with open(fname + '.tmp', 'w') as f:
+      json.dump(self.to_dict(), f)
+    os.replace(fname + '.tmp', fname)
+
+  @classmethod
+  def load(cls, fname=None):
+    """The saved index, or an empty one if none is saved yet."""
+    fname = fname or get_athlete_index_fname()
+    if not os.path.exists(fname):
+      return cls()
+    with open(fname, 'r') as f:
+      return cls.from_dict(json.load(f))
+
+
+def _load_race_results(race_year, results_store=None):
+  if results_store is None:
+    return RaceResults.from_clean(race_year)
+  return RaceResults.from_results_store(results_store, race_year)
+
+
+def update_athlete_index(race_years=None, results_store=None, fname=None):
+  """Add (or re-index) years in the saved index, keeping existing IDs.
+
+  Args:
+    race_years (list): defaults to every year in `results_store`, or
+      else every year in `race_urls.json` with clean data saved.
+    results_store (io.ResultsStore): read athlete labels from the store
+      rather than each year's clean data.
+  Returns:
+    AthleteIndex: the updated, saved index.
+  """
+  if race_years is None:
+    race_years = (
+      [
+        race_year for race_year in io.get_race_years()
+        if os.path.exists(io.get_split_secs_clean_fname(race_year))
+      ]
+      if results_store is None else results_store.race_years
+    )
+  index = AthleteIndex.load(fname)
+  for race_year in race_years:
+    if results_store is None:
+      _, _, _, columns = io.load_arrays_secs_clean(race_year)
+    else:
+      _, columns = results_store.get_labels(race_year)
+    index.add_year(race_year, columns)
+  index.save(fname)
+  return index
@@ -0,0 +1,192 @@
+"""Bootstrap confidence intervals for split stats and time stats.
+
+Athletes (columns) are resampled with replacement, and the statistics
+of `analysis.df_split_stats` and `analysis.stats_df` recomputed for
+every replicate. Replicates are made in batches: one (batch x athletes)
+index array picks every replicate's athletes at once, and each batch's
+statistics come from array operations over the whole batch, never a
+DataFrame per sample.
+
+Batches are spread over a process pool. The input array is put in
+shared memory once, so workers read it without pickling a copy per
+batch. Each batch draws from its own child of one `np.random.SeedSequence`,
+so with a `seed` the results are the same for any number of workers.
+
+CIs are percentile intervals.
+"""
+import concurrent.futures
+from multiprocessing import shared_memory
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from processing import analysis
+
+
+N_REPLICATES = 2000
+BATCH_SIZE = 100
+SPLIT_STATS_COLUMNS = [
+  'num_athletes_to_split',
+  'num_athletes_dnf_after_split',
+  'gross_dnf_rate_after_split',
+  'net_dnf_rate_after_split',
+]
+STATS_COLUMNS = ['median', 'mean', 'std', 'min', 'max']
+
+
+def _replicates_split_stats(arr_last_valid, n_splits):
+  """`df_split_stats` columns for each row of resampled last-valid positions.
+
+  Returns:
+    np.ndarray: float, replicates x splits x columns.
+  """
+  n_replicates = len(arr_last_valid)
+  arr_flat = np.arange(n_replicates)[:, np.newaxis] * n_splits + arr_last_valid
+  arr_stopped = np.bincount(arr_flat.ravel(),
+    minlength=n_replicates * n_splits).reshape(n_replicates, n_splits)
+  arr_through = arr_stopped[:, ::-1].cumsum(axis=1)[:, ::-1]
+  with np.errstate(divide='ignore', invalid='ignore'):
+    arr_gross = 100 * arr_stopped / arr_stopped.sum(axis=1, keepdims=True)
+    arr_net = 100 * arr_stopped / arr_through
+  return np.stack([arr_through, arr_stopped, arr_gross, arr_net], axis=-1)
+
+
+def _replicates_stats(arr_secs):
+  """`stats_df` columns for resampled splits x replicates x athletes secs.
+
+  Returns:
+    np.ndarray: float, replicates x splits x columns.
+  """
+  with warnings.catch_warnings():
+    # Splits nobody in a replicate reached are all-NaN.
+    warnings.simplefilter('ignore', category=RuntimeWarning)
+    arr_stats = np.stack([
+      np.nanmedian(arr_secs, axis=-1),
+      np.nanmean(arr_secs, axis=-1),
+      np.nanstd(arr_secs, axis=-1, ddof=1),
+      np.nanmin(arr_secs, axis=-1),
+      np.nanmax(arr_secs, axis=-1),
+    ], axis=-1)
+  return arr_stats.transpose(1, 0, 2)
+
+
+STATISTICS = {
+  'split_stats': _replicates_split_stats,
+  'stats': _replicates_stats,
+}
+
+
+def _run_batch(statistic, arr, seed_seq, n_replicates, kwargs):
+  n_athletes = arr.shape[-1]
+  rng = np.random.default_rng(seed_seq)
+  ix_resample = rng.integers(0, n_athletes, size=(n_replicates, n_athletes))
+  return STATISTICS[statistic](arr[..., ix_resample], **kwargs)
+
+
+def _run_batch_shared(statistic, shm_name, shape, dtype, seed_seq,
+                      n_replicates, kwargs):
+  shm = shared_memory.SharedMemory(name=shm_name)
+  try:
+    return _run_batch(statistic,
+      np.ndarray(shape, dtype=dtype, buffer=shm.buf),
+      seed_seq, n_replicates, kwargs)
+  finally:
+    shm.close()
+
+
+def array_bootstrap_replicates(statistic, arr, n_replicates=N_REPLICATES,
+                               batch_size=BATCH_SIZE, seed=None,
+                               max_workers=None, **kwargs):
+  """Statistic for every bootstrap replicate, resampling the last axis.
+
+  Args:
+    statistic (str): a key of `STATISTICS`.
+    arr (np.ndarray): input, athletes along the last axis.
+    n_replicates (int): number of bootstrap samples.
+    batch_size (int): replicates per batch (and per index array).
+    seed (int): for reproducible replicates; None for fresh entropy.
+    max_workers (int): process pool size. 1 runs batches in this
+      process. Defaults to the number of CPUs.
+    kwargs: passed to the statistic.
+  Returns:
+    np.ndarray: replicates x rows x columns.
+  """
+  batch_sizes = [batch_size] * (n_replicates // batch_size)
+  if n_replicates % batch_size:
+    batch_sizes.append(n_replicates % batch_size)
+  seed_seqs = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+
+  if max_workers == 1 or len(batch_sizes) == 1:
+    return np.concatenate([
+      _run_batch(statistic, arr, seed_seq, size, kwargs)
+      for seed_seq, size in zip(seed_seqs, batch_sizes)
+    ])
+
+  arr = np.ascontiguousarray(arr)
+  shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+  try:
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+      futures = [
+        executor.submit(_run_batch_shared, statistic, shm.name, arr.shape,
+          arr.dtype.str, seed_seq, size, kwargs)
+        for seed_seq, size in zip(seed_seqs, batch_sizes)
+      ]
+      # In submission order, so results don't depend on scheduling.
+      return np.concatenate([future.result() for future in futures])
+  finally:
+    shm.close()
+    shm.unlink()
+
+
+def df_bootstrap_ci(arr_estimate, arr_replicates, index, columns, alpha=0.05):
+  """Point estimates with percentile CIs.
+
+  Returns:
+    pd.DataFrame: indexed like the statistic, with a column MultiIndex:
+      (statistic column, 'estimate' | 'lower' | 'upper').
+  """
+  with warnings.catch_warnings():
+    warnings.simplefilter('ignore', category=RuntimeWarning)
+    arr_lower, arr_upper = np.nanpercentile(arr_replicates,
+      [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+  arr = np.stack([arr_estimate, arr_lower, arr_upper], axis=-1)
+  return pd.DataFrame(arr.reshape(len(index), -1), index=index,
+    columns=pd.MultiIndex.from_product([columns, ['estimate', 'lower', 'upper']]))
+
+
+def df_split_stats_ci(df_split_times, alpha=0.05, **kwargs):
+  """`analysis.df_split_stats`, with bootstrap CIs for every column.
+
+  Athletes with no valid splits are left out, as in `df_split_stats`.
+  Rates aren't rounded.
+
+  Args:
+    df_split_times (pd.DataFrame or RaceResults): split times.
+    kwargs: passed to `array_bootstrap_replicates`.
+  """
+  arr_last_valid = analysis.array_last_valid_split_position(df_split_times)
+  arr_last_valid = arr_last_valid[arr_last_valid >= 0]
+  n_splits = len(df_split_times.index)
+  arr_estimate = _replicates_split_stats(arr_last_valid[np.newaxis],
+    n_splits)[0]
+  arr_replicates = array_bootstrap_replicates('split_stats', arr_last_valid,
+    n_splits=n_splits, **kwargs)
+  return df_bootstrap_ci(arr_estimate, arr_replicates, df_split_times.index,
+    SPLIT_STATS_COLUMNS, alpha=alpha)
+
+
+def stats_df_ci(df, alpha=0.05, **kwargs):
+  """`analysis.stats_df`, with bootstrap CIs for every column.
+
+  Args:
+    df (pd.DataFrame or RaceResults): split or segment data, rows x
+      athletes. Timedeltas are in seconds, and so are the results.
+    kwargs: passed to `array_bootstrap_replicates`.
+  """
+  arr_secs = analysis.array_split_secs(df)
+  arr_estimate = _replicates_stats(arr_secs[:, np.newaxis, :])[0]
+  arr_replicates = array_bootstrap_replicates('stats', arr_secs, **kwargs)
+  return df_bootstrap_ci(arr_estimate, arr_replicates, df.index,
+    STATS_COLUMNS, alpha=alpha)
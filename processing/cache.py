@@ -0,0 +1,301 @@
+"""Content-addressed cache of processing results, for report builds.
+
+Rendering a notebook reloads, cleans and summarizes every year from
+scratch, even when nothing upstream changed. Functions wrapped with
+`memoize` save their results as pickled artifacts, keyed by a hash of:
+
+* the function's name, source and explicit `version`,
+* the source of every module in this package, since a change to any
+  helper a function calls can change its result,
+* its arguments (DataFrames and arrays by content),
+* the contents of any input files it reads.
+
+A re-scraped file with the same contents has the same hash, so a fresh
+checkout with a restored artifact directory still hits. Raw athletes
+are hashed item by item, in sorted order, so that holds even for files
+saved in the order a crawl happened to finish them.
+
+The artifact directory is kept under `max_bytes` by evicting the
+least recently used artifacts (by file mtime, touched on every hit).
+
+The module-level wrappers below cover the usual notebook entry points:
+
+  from processing import cache
+  df_split_times = cache.sort_df_split_data(
+    cache.load_df_split_times_raw(2019), df_split_info)
+"""
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from processing import analysis, cleaners, io, util
+from processing.results import RaceResults
+
+
+ARTIFACT_DIRNAME = 'artifacts'
+MAX_BYTES = 512 * 2 ** 20
+ARTIFACT_EXT = '.pkl'
+
+# (fname, mtime_ns, size) -> content hash, so unchanged files are
+# only read once per process.
+_file_hashes = {}
+
+
+def get_artifact_dir():
+  # Looked up on each call, so it follows `io.DATA_DIR`.
+  return os.path.join(io.DATA_DIR, ARTIFACT_DIRNAME)
+
+
+def hash_file(fname, chunk_size=1 << 20):
+  """Content hash of a file (remembered until it is modified)."""
+  stat = os.stat(fname)
+  stat_key = (os.path.realpath(fname), stat.st_mtime_ns, stat.st_size)
+  if stat_key not in _file_hashes:
+    h = hashlib.blake2b(digest_size=16)
+    with open(fname, 'rb') as f:
+      for chunk in iter(lambda: f.read(chunk_size), b''):
+        h.update(chunk)
+    _file_hashes[stat_key] = h.hexdigest()
+  return _file_hashes[stat_key]
+
+
+def hash_json_array_unordered(fname):
+  """Content hash of a json array file, whatever order its items are in."""
+  stat = os.stat(fname)
+  stat_key = (os.path.realpath(fname), stat.st_mtime_ns, stat.st_size,
+    'unordered')
+  if stat_key not in _file_hashes:
+    with open(fname, 'r') as f:
+      item_strs = sorted(json.dumps(item, sort_keys=True)
+        for item in io.iter_json_array_items(f))
+    h = hashlib.blake2b(digest_size=16)
+    for item_str in item_strs:
+      h.update(item_str.encode())
+      h.update(b'\n')
+    _file_hashes[stat_key] = h.hexdigest()
+  return _file_hashes[stat_key]
+
+
+def _array_for_hash(df):
+  # Split data frames are one dtype, athletes wide: hashing their values
+  # as one array is far faster than pandas' column-by-column hash.
+  dtypes = set(df.dtypes)
+  if len(dtypes) == 1:
+    dtype = dtypes.pop()
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biufmM':
+      return df.to_numpy()
+    if dtype.kind in 'iuf':
+      # Nullable ints and floats.
+      return df.to_numpy(dtype='float64', na_value=np.nan)
+  return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def hash_value(value):
+  """Content hash of an argument: frames and arrays by their data."""
+  if isinstance(value, pd.Series):
+    value = value.to_frame()
+  if isinstance(value, pd.DataFrame):
+    return util.hash_array_labels(_array_for_hash(value), value.index,
+      value.columns, pd.Index(value.dtypes.astype(str)))
+  if isinstance(value, RaceResults):
+    return util.hash_array_labels(np.where(value.mask, -1, value.secs),
+      value.index, value.columns, pd.Index(value.distance_mi),
+      pd.Index(value.cutoff_hr))
+  if isinstance(value, np.ndarray):
+    return util.hash_array_labels(value)
+  return repr(value)
+
+
+@functools.lru_cache(maxsize=None)
+def _hash_package_source():
+  package_dir = os.path.dirname(os.path.realpath(__file__))
+  h = hashlib.blake2b(digest_size=16)
+  for fname in sorted(os.listdir(package_dir)):
+    if fname.endswith('.py'):
+      h.update(fname.encode())
+      with open(os.path.join(package_dir, fname), 'rb') as f:
+        h.update(f.read())
+  return h.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _hash_source(func):
+  try:
+    return hashlib.blake2b(inspect.getsource(func).encode(),
+      digest_size=16).hexdigest()
+  except (OSError, TypeError):
+    return ''
+
+
+class ArtifactCache:
+  """Pickled results in one directory, with size-based LRU eviction.
+
+  Args:
+    artifact_dir (str): defaults to `get_artifact_dir()` at each use.
+    max_bytes (int): total artifact size to keep.
+  """
+  def __init__(self, artifact_dir=None, max_bytes=MAX_BYTES):
+    self.artifact_dir = artifact_dir
+    self.max_bytes = max_bytes
+
+  def get_dir(self):
+    return self.artifact_dir or get_artifact_dir()
+
+  def _get_fname(self, key):
+    return os.path.join(self.get_dir(), key + ARTIFACT_EXT)
+
+  def load(self, key):
+    """Returns: tuple(bool, object): whether it was found, and the value."""
+    fname = self._get_fname(key)
+    try:
+      with open(fname, 'rb') as f:
+        value = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+      return False, None
+    # Mark as recently used.
+    os.utime(fname)
+    return True, value
+
+  def save(self, key, value):
+    os.makedirs(self.get_dir(), exist_ok=True)
+    fname = self._get_fname(key)
+    # Write then rename, so a crash never leaves a half-written artifact.
+    with open(fname + '.tmp', 'wb') as f:
+      pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(fname + '.tmp', fname)
+    self.evict()
+
+  def _scan(self):
+    if not os.path.isdir(self.get_dir()):
+      return []
+    return [
+      entry for entry in os.scandir(self.get_dir())
+      if entry.name.endswith(ARTIFACT_EXT)
+    ]
+
+  def size_bytes(self):
+    return sum(entry.stat().st_size for entry in self._scan())
+
+  def evict(self, max_bytes=None):
+    """Remove least recently used artifacts until under `max_bytes`.
+
+    Returns:
+      int: number of artifacts removed.
+    """
+    if max_bytes is None:
+      max_bytes = self.max_bytes
+    entries = sorted(
+      ((entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+       for entry in self._scan()),
+      reverse=True)
+    total = sum(size for _, size, _ in entries)
+    n_removed = 0
+    while entries and total > max_bytes:
+      _, size, fname = entries.pop()
+      os.remove(fname)
+      total -= size
+      n_removed += 1
+    return n_removed
+
+  def clear(self):
+    return self.evict(max_bytes=0)
+
+
+default_cache = ArtifactCache()
+
+
+def memoize(func=None, *, version=0, input_fnames=None, hash_input=hash_file,
+            cache=None):
+  """Cache a function's results as artifacts.
+
+  Args:
+    version (int): bump when the function's behavior changes in a way
+      no source in this package shows (eg. a pandas upgrade).
+    input_fnames (callable): takes the function's arguments by name,
+      returns the files its result depends on. If any is missing, the
+      function runs uncached (and raises its own error).
+    hash_input (callable): content hash of one input file.
+    cache (ArtifactCache): defaults to `default_cache`.
+  Returns:
+    The wrapped function; the original is its `uncached` attribute.
+  """
+  if func is None:
+    return functools.partial(memoize, version=version,
+      input_fnames=input_fnames, hash_input=hash_input, cache=cache)
+  signature = inspect.signature(func)
+
+  @functools.wraps(func)
+  def wrapper(*args, **kwargs):
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr((func.__module__, func.__qualname__, version,
+      _hash_source(func), _hash_package_source())).encode())
+    for name, value in bound.arguments.items():
+      h.update(repr((name, hash_value(value))).encode())
+    if input_fnames is not None:
+      try:
+        for fname in input_fnames(**bound.arguments):
+          h.update(hash_input(fname).encode())
+      except FileNotFoundError:
+        return func(*args, **kwargs)
+
+    key = h.hexdigest()
+    artifact_cache = cache or default_cache
+    found, value = artifact_cache.load(key)
+    if not found:
+      value = func(*args, **kwargs)
+      artifact_cache.save(key, value)
+    return value
+
+  wrapper.uncached = func
+  return wrapper
+
+
+def _raw_info_fnames(race_year):
+  return [os.path.join(io.get_raw_race_data_dir(race_year), 'metadata.json')]
+
+
+def _raw_fnames(race_year):
+  return _raw_info_fnames(race_year) + [
+    os.path.join(io.get_raw_race_data_dir(race_year), io.ATHLETE_DATA_FNAME)]
+
+
+def _hash_raw_input(fname):
+  # Athletes from older crawls are in the order they finished.
+  if os.path.basename(fname) == io.ATHLETE_DATA_FNAME:
+    return hash_json_array_unordered(fname)
+  return hash_file(fname)
+
+
+def _clean_info_fnames(race_year):
+  return [os.path.join(io.get_clean_race_data_dir(race_year),
+    io.SPLIT_INFO_FNAME)]
+
+
+def _clean_times_fnames(race_year, fmt=None):
+  return io.get_split_secs_fnames(io.get_split_secs_clean_fname(race_year,
+    fmt=fmt))
+
+
+load_df_split_info_raw = memoize(io.load_df_split_info_raw,
+  input_fnames=_raw_info_fnames)
+load_df_split_times_raw = memoize(io.load_df_split_times_raw,
+  input_fnames=_raw_fnames, hash_input=_hash_raw_input)
+load_df_split_info_clean = memoize(io.load_df_split_info_clean,
+  input_fnames=_clean_info_fnames)
+load_df_split_times_clean = memoize(io.load_df_split_times_clean,
+  input_fnames=_clean_times_fnames)
+load_df_split_secs_clean = memoize(io.load_df_split_secs_clean,
+  input_fnames=_clean_times_fnames)
+sort_df_split_data = memoize(cleaners.sort_df_split_data)
+df_split_stats = memoize(analysis.df_split_stats)
+df_segment_times = memoize(analysis.df_segment_times)
+df_segment_times_valid = memoize(analysis.df_segment_times_valid)
+df_segment_pace_valid = memoize(analysis.df_segment_pace_valid)
@@ -1,5 +1,15 @@
+import collections
+
+import numpy as np
 import pandas as pd
 
+from processing import util
+
+
+COLUMN_ORDER_CACHE_SIZE = 16
+
+_column_order_cache = collections.OrderedDict()
+
 
 def process_df_split_info(df_split_info):
   df_split_info['distance_mi'] = (df_split_info['distance_m'] / 1609.34
@@ -35,19 +45,74 @@ def sort_df_split_data_rows(df_split_data, df_split_info):
   return df_split_data.loc[df_split_info.index]
 
 
-def sort_df_split_data_columns(df_split_data, df_split_info=None):
+def _array_sort_keys(df_split_data):
+  """Split data as sortable numbers, with missing values sorting last."""
+  arr = df_split_data.to_numpy()
+  if arr.dtype.kind == 'm':
+    return np.where(np.isnat(arr), np.iinfo('int64').max, arr.view('int64'))
+  arr = df_split_data.to_numpy(dtype='float64', na_value=np.nan)
+  return np.where(np.isnan(arr), np.inf, arr)
+
+
+def get_column_order(df_split_data, df_split_info=None):
+  """Column positions, in the order `sort_df_split_data_columns` sorts them.
+
+  Found with a single `np.lexsort`, keyed on every split with the
+  furthest split as the primary key and missing values sorting last.
+  That puts finishers first by finish time, then DNFs by furthest split
+  reached and time there, with any ties broken by earlier splits. It is
+  the same order as the pandas multi-key sort, without the transpose.
+
+  Orders are cached by content, and can be reused to sort any other
+  frame with the same athletes (ranks, segment times, ...). They are
+  positions rather than labels, so athletes sharing a name stay
+  distinct.
+
+  Returns:
+    np.ndarray: read-only int positions of `df_split_data`'s columns,
+      sorted.
+  """
+  row_labels = df_split_data.index if df_split_info is None else df_split_info.index
+  arr_keys = _array_sort_keys(df_split_data.loc[row_labels])
+  key = util.hash_array_labels(arr_keys, df_split_data.columns)
+  if key in _column_order_cache:
+    _column_order_cache.move_to_end(key)
+  else:
+    # lexsort's last key is the primary one.
+    arr_order = np.lexsort(arr_keys)
+    arr_order.flags.writeable = False
+    _column_order_cache[key] = arr_order
+    if len(_column_order_cache) > COLUMN_ORDER_CACHE_SIZE:
+      _column_order_cache.popitem(last=False)
+  return _column_order_cache[key]
+
+
+def sort_df_split_data_columns(df_split_data, df_split_info=None,
+                               column_order=None, method='lexsort'):
   """
   Args:
     df_split (pd.DataFrame): split data that's sortable. Could be
       cumulative time to each split (seconds, timedeltas, etc),
       rankings, or whatever. Needs to have row labels contained in
       `df_split_info.index`.
+    column_order (np.ndarray): column positions from
+      `get_column_order`, to sort this frame the same way as another one.
+    method (str): 'lexsort' (see `get_column_order`), or 'sort_values'
+      for the original pandas multi-key sort. Both give the same order.
   Returns:
     pd.DataFrame: split data sorted by the value of the split data
       at the furthest split each athlete reached.
       eg for split times, the last athlete to finish will come before
       all athletes who DNFed. 
   """
+  if column_order is not None:
+    return df_split_data.iloc[:, column_order]
+
+  if method == 'lexsort':
+    return df_split_data.iloc[:, get_column_order(df_split_data, df_split_info)]
+  if method != 'sort_values':
+    raise ValueError(f'Unknown sort method: {method}')
+
   row_labels_to_sort_by = df_split_data.index if df_split_info is None else df_split_info.index
 
   return df_split_data.sort_values(
@@ -0,0 +1,227 @@
+"""Command line interface: `python -m processing <command> ...`
+
+Commands:
+  scrape       fetch Athlinks results for some or all years, with the
+               Scrapy spider or the asyncio backend (`fetch`)
+  clean        raw -> clean data for every year that changed
+  stats        print DNF stats by split from clean data
+  export       convert clean split times to csv/npy, or build the
+               multi-year results store or cross-year athlete index
+  cache        show the size of, or clear, cached processing artifacts
+  import-time  check how long importing the package takes
+
+Heavy dependencies (pandas, Scrapy, IPython) are imported inside the
+command that needs them, so starting the CLI, or importing `io` and
+`analysis` in a batch job, never pays for the rest.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+
+# Seconds allowed to import each module in a fresh interpreter.
+IMPORT_TIME_BUDGET_S = {
+  'processing.cli': 0.1,
+  'processing.io': 1.5,
+  'processing.analysis': 1.5,
+}
+# Modules that must never be pulled in by importing the modules above.
+HEAVY_MODULES = ['IPython', 'scrapy', 'scrapy_athlinks', 'plotly']
+
+
+def measure_import_time(module):
+  """Import `module` in a fresh interpreter.
+
+  Returns:
+    tuple(float, list): cumulative import time in seconds (from
+      `python -X importtime`), and which `HEAVY_MODULES` got imported.
+  """
+  result = subprocess.run(
+    [
+      sys.executable, '-X', 'importtime', '-c',
+      f'import sys, {module}; '
+      f'print(*[m for m in {HEAVY_MODULES!r} if m in sys.modules])',
+    ],
+    capture_output=True, text=True,
+    # So `processing` is importable no matter where we're run from.
+    cwd=os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+  if result.returncode != 0:
+    raise ImportError(f'Could not import {module}:\n{result.stderr.splitlines()[-1]}')
+  # Lines look like: "import time:  self [us] | cumulative | imported package"
+  cumulative_us = 0
+  for line in result.stderr.splitlines():
+    match = re.match(r'import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*(\S+)$', line)
+    if match and match.group(2) == module:
+      cumulative_us = int(match.group(1))
+  return cumulative_us / 1e6, result.stdout.split()
+
+
+def check_import_time(budgets=None):
+  """Whether every module imports within budget and without heavy deps.
+
+  Returns:
+    tuple(bool, dict): overall pass/fail, and per-module
+      (seconds, budget, heavy modules imported).
+  """
+  if budgets is None:
+    budgets = IMPORT_TIME_BUDGET_S
+  report = {}
+  for module, budget in budgets.items():
+    seconds, heavy = measure_import_time(module)
+    report[module] = (seconds, budget, heavy)
+  ok = all(
+    seconds <= budget and not heavy
+    for seconds, budget, heavy in report.values())
+  return ok, report
+
+
+def _get_race_years(args):
+  return None if args.all or not args.year else args.year
+
+
+def scrape(args):
+  if args.backend == 'async':
+    from processing import fetch
+
+    counts = fetch.fetch_race_years(_get_race_years(args),
+      concurrency=args.concurrency, requests_per_sec=args.rate)
+    for race_year, n_athletes in counts.items():
+      print(f'{race_year}: {n_athletes} athletes')
+    return
+
+  from processing.scrapers import run_spiders_pandas
+
+  # The reactor can only start once per process, so every year
+  # has to be queued in the same crawl.
+  run_spiders_pandas(_get_race_years(args),
+    concurrent_requests=args.concurrency,
+    concurrent_requests_per_domain=args.per_domain,
+    incremental=args.incremental, refresh_patterns=args.refresh)
+
+
+def clean(args):
+  from processing import pipeline
+
+  results = pipeline.run_pipeline(_get_race_years(args),
+    max_workers=args.jobs, force=args.force, fmt=args.fmt)
+  for race_year, status in results.items():
+    print(f'{race_year}: {status}')
+
+
+def stats(args):
+  from processing import analysis, io
+
+  for race_year in _get_race_years(args) or io.get_race_years():
+    print(race_year)
+    print(analysis.df_split_stats(io.load_df_split_times_clean(race_year)))
+
+
+def export(args):
+  from processing import io
+
+  race_years = _get_race_years(args)
+  if args.store:
+    io.save_results_store(race_years)
+    return
+  if args.athlete_index:
+    from processing import athletes
+
+    index = athletes.update_athlete_index(race_years)
+    print(f'{len(index)} athletes in {", ".join(map(str, index.race_years))}')
+    return
+  for race_year in race_years or io.get_race_years():
+    io.save_df_split_times_clean(io.load_df_split_times_clean(race_year),
+      race_year, fmt=args.fmt)
+
+
+def cache(args):
+  from processing import cache
+
+  if args.clear:
+    print(f'Removed {cache.default_cache.clear()} artifacts')
+  elif args.max_mb is not None:
+    n_removed = cache.default_cache.evict(max_bytes=int(args.max_mb * 2 ** 20))
+    print(f'Removed {n_removed} artifacts')
+  print(f'{cache.default_cache.get_dir()}: '
+    f'{cache.default_cache.size_bytes() / 2 ** 20:.1f}MB')
+
+
+def import_time(args):
+  ok, report = check_import_time()
+  for module, (seconds, budget, heavy) in report.items():
+    print(f'{module:25s} {seconds:6.3f}s (budget {budget:.3f}s)'
+      + (f'  imports {", ".join(heavy)}' if heavy else ''))
+  return 0 if ok else 1
+
+
+def create_parser():
+  parser = argparse.ArgumentParser(prog='python -m processing')
+  subparsers = parser.add_subparsers(dest='command', required=True)
+
+  def add_year_args(subparser):
+    subparser.add_argument('-y', '--year', type=int, action='append',
+      help='race year; repeat for several (default: every year)')
+    subparser.add_argument('-a', '--all', action='store_true',
+      help='every year in race_urls.json')
+
+  subparser = subparsers.add_parser('scrape', help='run the Athlinks spider')
+  add_year_args(subparser)
+  subparser.add_argument('-c', '--concurrency', type=int, default=16,
+    help='concurrent requests, across every year (default 16)')
+  subparser.add_argument('-d', '--per-domain', type=int, default=8,
+    help='concurrent requests to any one domain, across every year '
+      '(scrapy backend only) (default 8)')
+  subparser.add_argument('-i', '--incremental', action='store_true',
+    help='cached, resumable crawl (scrapy backend only)')
+  subparser.add_argument('--refresh', metavar='PATTERN', action='append',
+    help='URL regex to always re-fetch in an incremental crawl; repeat for '
+      'several (default: the results listing)')
+  subparser.add_argument('-b', '--backend', choices=['scrapy', 'async'],
+    default='scrapy', help='Scrapy spider, or asyncio fetch (default scrapy)')
+  subparser.add_argument('--rate', type=float, default=None,
+    help='max requests per second (async backend only)')
+  subparser.set_defaults(func=scrape)
+
+  subparser = subparsers.add_parser('clean', help='raw -> clean data')
+  add_year_args(subparser)
+  subparser.add_argument('-f', '--force', action='store_true',
+    help='reprocess years even if their raw data is unchanged, or their '
+      'clean data was made by hand')
+  subparser.add_argument('-j', '--jobs', type=int, default=None,
+    help='worker processes (default: number of CPUs)')
+  subparser.add_argument('--fmt', choices=['csv', 'npy'], default='csv')
+  subparser.set_defaults(func=clean)
+
+  subparser = subparsers.add_parser('stats', help='DNF stats by split')
+  add_year_args(subparser)
+  subparser.set_defaults(func=stats)
+
+  subparser = subparsers.add_parser('export', help='convert clean data')
+  add_year_args(subparser)
+  subparser.add_argument('--fmt', choices=['csv', 'npy'], default='csv')
+  subparser.add_argument('--store', action='store_true',
+    help='build the multi-year results store instead')
+  subparser.add_argument('--athlete-index', action='store_true',
+    help='add years to the cross-year athlete index instead')
+  subparser.set_defaults(func=export)
+
+  subparser = subparsers.add_parser('cache',
+    help='show or clear cached processing artifacts')
+  subparser.add_argument('--clear', action='store_true',
+    help='remove every artifact')
+  subparser.add_argument('--max-mb', type=float, default=None,
+    help='evict least recently used artifacts down to this size')
+  subparser.set_defaults(func=cache)
+
+  subparser = subparsers.add_parser('import-time',
+    help='check package import times against their budget')
+  subparser.set_defaults(func=import_time)
+
+  return parser
+
+
+def execute(argv=None):
+  args = create_parser().parse_args(argv)
+  return args.func(args)
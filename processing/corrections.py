@@ -0,0 +1,104 @@
+"""Hand-made, year-specific corrections to scraped data.
+
+These are the fixes the year notebooks make after eyeballing each
+race (see the notebooks for how each one was found), kept as data so
+`pipeline` can apply them too:
+
+* splits to drop from the split info (and so from the split times),
+* cutoffs, which aren't scraped, found elsewhere on the web,
+* split times that are clearly wrong: cleared, or moved to the split
+  they belong to.
+
+Time corrections are keyed by split label and athlete name, so they
+can be applied before or after sorting.
+"""
+import numpy as np
+import pandas as pd
+
+
+# (present in 2021, gone in 2022, and never very useful)
+DROP_SPLITS = ['Kick to Finish 0.8 Miles Left']
+
+# By split position, after `DROP_SPLITS` are dropped.
+_CUTOFF_HR = [3.75, 6., 7.5, 9.5, 12., 14., None, 18., 21.25, 23., 26.5, 30.]
+CUTOFF_HR = {2019: _CUTOFF_HR, 2021: _CUTOFF_HR, 2022: _CUTOFF_HR}
+
+# Each correction is one of:
+#   ('clear', athlete, label): the time at `label` is bogus.
+#   ('clear', athlete, label_st, label_ed): so is every time in between.
+#   ('move', athlete, label_from, label_to): the time at `label_from`
+#     belongs at `label_to`.
+TIME_CORRECTIONS = {
+  2019: [
+    ('clear', 'Charles Corfield', 'Full Course'),
+    ('clear', 'Vineer Bhansali', 'Full Course'),
+    ('clear', 'Willie Stewart', '87.8mi_Start to May Queen In', 'Full Course'),
+    ('clear', 'Chavet Breslin', 'Full Course'),
+    ('clear', 'Harry Harcrow', 'Full Course'),
+    ('clear', 'Jared Conlin', 'Full Course'),
+    ('move', 'Max Fulton', '43.5mi_Start to Hope Pass Out',
+     '56.5mi_Start to Hope Pass In'),
+  ],
+  2021: [
+    ('clear', 'Matthew DuBois', '37.9mi_Start to Twin Lakes Out'),
+  ],
+  2022: [
+    ('clear', 'Mickey Davis', 'Full Course'),
+    ('clear', 'Sean Bartlett', 'Full Course'),
+    ('clear', 'Adrian Macdonald', '29.3mi_Start to Half Pipe Out'),
+    ('clear', 'Timothy Weng', '76.9mi_Start to Outward Bound In'),
+    ('move', 'Kris Rugloski', '43.5mi_Start to Hope Pass Out',
+     '56.5mi_Start to Hope Pass In'),
+  ],
+}
+
+
+def get_corrections(race_year):
+  """Everything applied to one year, eg. to hash into a manifest."""
+  return {
+    'drop_splits': DROP_SPLITS,
+    'cutoff_hr': CUTOFF_HR.get(race_year),
+    'time_corrections': TIME_CORRECTIONS.get(race_year, []),
+  }
+
+
+def correct_df_split_info(df_split_info, race_year):
+  """Drop unwanted splits and add cutoffs (NaN where none are known).
+
+  Returns:
+    pd.DataFrame: a corrected copy.
+  """
+  df_split_info = df_split_info.drop(index=DROP_SPLITS, errors='ignore')
+  cutoff_hr = CUTOFF_HR.get(race_year)
+  if cutoff_hr is None:
+    if 'cutoff_hr' not in df_split_info.columns:
+      df_split_info['cutoff_hr'] = np.nan
+    return df_split_info
+  if len(cutoff_hr) != len(df_split_info):
+    raise ValueError(
+      f'{race_year} has {len(df_split_info)} splits, but {len(cutoff_hr)} '
+      f'cutoffs are on record.')
+  df_split_info['cutoff_hr'] = np.array(cutoff_hr, dtype='float64')
+  return df_split_info
+
+
+def correct_df_split_times(df_split_times, race_year):
+  """Apply a year's time corrections.
+
+  Returns:
+    pd.DataFrame: a corrected copy.
+  """
+  df_split_times = df_split_times.copy()
+  for correction in TIME_CORRECTIONS.get(race_year, []):
+    action, athlete, *labels = correction
+    if action == 'clear':
+      label_st, label_ed = labels[0], labels[-1]
+      df_split_times.loc[label_st:label_ed, athlete] = pd.NaT
+    elif action == 'move':
+      label_from, label_to = labels
+      df_split_times.loc[label_to, athlete] = df_split_times.loc[
+        label_from, athlete]
+      df_split_times.loc[label_from, athlete] = pd.NaT
+    else:
+      raise ValueError(f'Unknown correction: {correction}')
+  return df_split_times
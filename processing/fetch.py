@@ -0,0 +1,383 @@
+"""Fetch race results from Athlinks with asyncio, without Scrapy.
+
+`scrapers.LeadvilleScraper` crawls inside Scrapy's `CrawlerProcess`,
+which blocks, owns the Twisted reactor, and can only start once per
+process. This module makes the same requests as `scrapy_athlinks`'
+`RaceSpider`, from coroutines that run in any event loop (including a
+notebook's), and writes the same `athletes.json` and `metadata.json`,
+so `io.load_df_split_info_raw` and `io.load_df_split_times_raw` work
+unchanged.
+
+Only the standard library is used:
+
+* HTTP/1.1 keep-alive connections are pooled and reused, so hundreds
+  of athlete requests share a handful of TLS handshakes.
+* At most `concurrency` requests are in flight, across every year.
+* Requests can be spaced to a maximum rate.
+* Connection errors, timeouts, 429s and 5xxs are retried with
+  exponential backoff.
+
+Point `base_url` at a local stub server (eg. `http://127.0.0.1:8000`)
+to run against recorded responses.
+
+Usage:
+  fetch.fetch_race_years([2019, 2021])
+  # or, inside a running loop (eg. Jupyter):
+  await fetch.fetch_race_years_async([2019, 2021])
+"""
+import asyncio
+import gzip
+import json
+import os
+import re
+import ssl
+import zlib
+from urllib.parse import urlencode, urlsplit
+
+from processing import io
+
+
+ATHLINKS_URL = 'https://results.athlinks.com'
+MAX_RESULT_LIMIT = 100  # As high as Athlinks will accept
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_ERRORS = (OSError, EOFError, asyncio.TimeoutError)
+
+
+class HttpError(OSError):
+  """Non-200 response."""
+  def __init__(self, status, target):
+    super().__init__(f'HTTP {status} for {target}')
+    self.status = status
+
+
+async def _read_response(reader):
+  """Status, body, and whether the connection can be reused."""
+  status_line = await reader.readline()
+  if not status_line:
+    # The server closed an idle keep-alive connection.
+    raise ConnectionResetError('Connection closed by server')
+  status = int(status_line.split()[1])
+
+  headers = {}
+  while True:
+    line = await reader.readline()
+    if line in (b'\r\n', b'\n', b''):
+      break
+    key, _, value = line.decode('latin-1').partition(':')
+    headers[key.strip().lower()] = value.strip()
+
+  keep_alive = headers.get('connection', '').lower() != 'close'
+  if headers.get('transfer-encoding', '').lower() == 'chunked':
+    chunks = []
+    while True:
+      size = int((await reader.readline()).split(b';')[0], 16)
+      if size == 0:
+        # Skip any trailers.
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+          pass
+        break
+      chunks.append(await reader.readexactly(size))
+      await reader.readexactly(2)
+    body = b''.join(chunks)
+  elif 'content-length' in headers:
+    body = await reader.readexactly(int(headers['content-length']))
+  else:
+    body = await reader.read()
+    keep_alive = False
+
+  encoding = headers.get('content-encoding', '').lower()
+  if encoding == 'gzip':
+    body = gzip.decompress(body)
+  elif encoding == 'deflate':
+    body = zlib.decompress(body)
+  return status, body, keep_alive
+
+
+class ConnectionPool:
+  """Keep-alive HTTP/1.1 connections to one host.
+
+  Must be created inside the event loop that uses it.
+
+  Args:
+    base_url (str): scheme, host and optional port (and path prefix).
+    max_connections (int): connections open at once; also the most
+      requests in flight.
+    timeout_secs (float): per request, from sending to the full body.
+  """
+  def __init__(self, base_url, max_connections=8, timeout_secs=30):
+    parts = urlsplit(base_url)
+    self.host = parts.hostname
+    self.use_ssl = parts.scheme == 'https'
+    self.port = parts.port or (443 if self.use_ssl else 80)
+    self.prefix = parts.path.rstrip('/')
+    self.timeout_secs = timeout_secs
+    self._host_header = parts.netloc
+    self._idle = []
+    self._slots = asyncio.Semaphore(max_connections)
+
+  async def _open(self):
+    return await asyncio.wait_for(
+      asyncio.open_connection(self.host, self.port,
+        ssl=ssl.create_default_context() if self.use_ssl else None),
+      self.timeout_secs)
+
+  async def _request(self, conn, target):
+    reader, writer = conn
+    writer.write((
+      f'GET {target} HTTP/1.1\r\n'
+      f'Host: {self._host_header}\r\n'
+      f'Accept: application/json\r\n'
+      f'Accept-Encoding: gzip, deflate\r\n'
+      f'Connection: keep-alive\r\n'
+      f'\r\n'
+    ).encode('latin-1'))
+    await writer.drain()
+    return await asyncio.wait_for(_read_response(reader), self.timeout_secs)
+
+  async def get(self, path, params=None):
+    """GET `path` (relative to `base_url`).
+
+    Returns:
+      tuple(int, bytes): status and decoded body.
+    """
+    target = self.prefix + path + (f'?{urlencode(params)}' if params else '')
+    async with self._slots:
+      conn = self._idle.pop() if self._idle else None
+      try:
+        if conn is not None:
+          try:
+            status, body, keep_alive = await self._request(conn, target)
+          except (ConnectionError, EOFError):
+            # Stale keep-alive connection; one retry on a fresh one.
+            conn[1].close()
+            conn = None
+        if conn is None:
+          conn = await self._open()
+          status, body, keep_alive = await self._request(conn, target)
+      except BaseException:
+        if conn is not None:
+          conn[1].close()
+        raise
+      if keep_alive:
+        self._idle.append(conn)
+      else:
+        conn[1].close()
+      return status, body
+
+  async def close(self):
+    while self._idle:
+      _, writer = self._idle.pop()
+      writer.close()
+      try:
+        await writer.wait_closed()
+      except RETRY_ERRORS:
+        pass
+
+
+class RateLimiter:
+  """Spaces calls to `wait` at most `rate` per second (None: no limit)."""
+  def __init__(self, rate=None):
+    self.interval = 1 / rate if rate else 0.0
+    self._next = 0.0
+
+  async def wait(self):
+    if not self.interval:
+      return
+    now = asyncio.get_running_loop().time()
+    # Reserve a slot before sleeping, so concurrent callers queue up.
+    t_slot = max(now, self._next)
+    self._next = t_slot + self.interval
+    if t_slot > now:
+      await asyncio.sleep(t_slot - now)
+
+
+class AthlinksClient:
+  """JSON requests to Athlinks over pooled connections, with retries.
+
+  Use as an async context manager, inside the loop that runs it:
+
+    async with AthlinksClient(concurrency=16) as client:
+      race_item, athlete_items = await fetch_race(client, race_url)
+
+  Args:
+    base_url (str): Athlinks results API, or a stub server.
+    concurrency (int): requests in flight (and connections) at once.
+    requests_per_sec (float): rate limit; None for none.
+    retries (int): extra attempts after a connection error, timeout,
+      429 or 5xx.
+    backoff_secs (float): delay before the first retry, doubled for
+      each one after.
+    timeout_secs (float): per attempt.
+  """
+  def __init__(self, base_url=ATHLINKS_URL, concurrency=8,
+               requests_per_sec=None, retries=3, backoff_secs=0.5,
+               timeout_secs=30):
+    self.base_url = base_url
+    self.concurrency = concurrency
+    self.requests_per_sec = requests_per_sec
+    self.retries = retries
+    self.backoff_secs = backoff_secs
+    self.timeout_secs = timeout_secs
+    self._pool = None
+    self._limiter = None
+
+  async def __aenter__(self):
+    self._pool = ConnectionPool(self.base_url,
+      max_connections=self.concurrency, timeout_secs=self.timeout_secs)
+    self._limiter = RateLimiter(self.requests_per_sec)
+    return self
+
+  async def __aexit__(self, *exc_info):
+    await self._pool.close()
+
+  async def get_json(self, path, params=None):
+    """Parsed json body, or None if the body is empty."""
+    for attempt in range(self.retries + 1):
+      await self._limiter.wait()
+      try:
+        status, body = await self._pool.get(path, params)
+      except RETRY_ERRORS as e:
+        error = e
+      else:
+        if status == 200:
+          return json.loads(body) if body.strip() else None
+        error = HttpError(status, path)
+        if status not in RETRY_STATUSES:
+          raise error
+      if attempt < self.retries:
+        await asyncio.sleep(self.backoff_secs * 2 ** attempt)
+    raise error
+
+
+def extract_event_id(race_url):
+  """Athlinks event ID, as `scrapy_athlinks` reads it from a race url."""
+  match = re.search(r'/event/(\d+)/results/Event/(\d+)', race_url or '')
+  if match is None:
+    raise ValueError(f'Could not extract IDs from race url: {race_url}')
+  return int(match.group(2))
+
+
+def json_to_race_item(jsonresponse):
+  """Same fields as `scrapy_athlinks.items.RaceItem`."""
+  course = jsonresponse['eventCourseMetadata'][0]
+  return {
+    'name': jsonresponse['eventName'],
+    'event_id': jsonresponse['eventId'],
+    'event_course_id': course['eventCourseId'],
+    'distance_m': course['distance'],
+    'split_info': [
+      {'name': split['name'], 'distance_m': split['distance']}
+      for split in course['metadata']['intervals']
+    ],
+    'date_utc_ms': jsonresponse['eventStartDateTime']['timeInMillis'],
+  }
+
+
+def json_to_athlete_item(jsonresponse):
+  """Same fields as `scrapy_athlinks.items.AthleteItem`."""
+  return {
+    'name': jsonresponse['displayName'],
+    'split_data': [
+      {
+        'name': split['intervalName'],
+        'number': split['intervalOrder'],
+        'time_ms': split['pace']['time']['timeInMillis'],
+        'distance_m': split['pace']['distance']['distanceInMeters'],
+        'time_with_penalties_ms': split['timeWithPenalties']['timeInMillis'],
+      }
+      for split in jsonresponse['intervals']
+    ],
+  }
+
+
+async def fetch_race(client, race_url):
+  """Race metadata and every athlete's results.
+
+  Results pages are walked in order; each page's athletes are requested
+  as soon as the page arrives, while the next page is fetched.
+
+  Returns:
+    tuple(dict, list): the race item and athlete items, in results order.
+  """
+  event_id = extract_event_id(race_url)
+  race_item = json_to_race_item(
+    await client.get_json(f'/metadata/event/{event_id}'))
+
+  tasks = []
+  try:
+    first_result_num = 0
+    while True:
+      page = await client.get_json(f'/event/{event_id}',
+        {'limit': MAX_RESULT_LIMIT, 'from': first_result_num})
+      if not page or not page[0]['interval']['intervalResults']:
+        break
+      for athlete_data in page[0]['interval']['intervalResults']:
+        tasks.append(asyncio.ensure_future(client.get_json('/individual', {
+          'bib': athlete_data['bib'],
+          'eventId': event_id,
+          'eventCourseId': race_item['event_course_id'],
+        })))
+      first_result_num += MAX_RESULT_LIMIT
+    athlete_items = [json_to_athlete_item(jsonresponse)
+      for jsonresponse in await asyncio.gather(*tasks)]
+  except BaseException:
+    for task in tasks:
+      task.cancel()
+    raise
+  return race_item, athlete_items
+
+
+def _dump_json_atomic(obj, fname):
+  # Write then rename, so a crash never leaves a half-written file.
+  with open(fname + '.tmp', 'w') as f:
+    json.dump(obj, f)
+  os.replace(fname + '.tmp', fname)
+
+
+def save_race_raw(race_year, race_item, athlete_items):
+  """Write items in the layout of `LeadvilleScraper.run_spider_pandas`.
+
+  Athletes are saved in name order, like the spider's, so the same
+  results make the same file however they were fetched.
+  """
+  dir_out = io.get_raw_race_data_dir(race_year)
+  os.makedirs(dir_out, exist_ok=True)
+  _dump_json_atomic(sorted(athlete_items, key=lambda item: item['name']),
+    os.path.join(dir_out, io.ATHLETE_DATA_FNAME))
+  # A single-item list, like the Scrapy feed.
+  _dump_json_atomic([race_item], os.path.join(dir_out, 'metadata.json'))
+
+
+async def fetch_race_year(client, race_year):
+  """Fetch one year and save its raw data."""
+  race_item, athlete_items = await fetch_race(client,
+    io.get_race_url(race_year))
+  save_race_raw(race_year, race_item, athlete_items)
+  return len(athlete_items)
+
+
+async def fetch_race_years_async(race_years=None, **kwargs):
+  """Fetch many years at once, sharing one client's connections and limits.
+
+  Each year is saved as soon as it is complete.
+
+  Args:
+    race_years (list): defaults to every year in `race_urls.json`.
+    kwargs: passed to `AthlinksClient`.
+  Returns:
+    dict: race year -> number of athletes saved.
+  """
+  if race_years is None:
+    race_years = io.get_race_years()
+  async with AthlinksClient(**kwargs) as client:
+    counts = await asyncio.gather(*[
+      fetch_race_year(client, race_year) for race_year in race_years])
+  return dict(zip(race_years, counts))
+
+
+def fetch_race_years(race_years=None, **kwargs):
+  """Blocking `fetch_race_years_async`, in a new event loop.
+
+  Unlike a Scrapy crawl, can be called any number of times.
+  """
+  return asyncio.run(fetch_race_years_async(race_years, **kwargs))
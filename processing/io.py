@@ -1,9 +1,11 @@
+import glob
 import json
 import os
+import uuid
 
+import numpy as np
 import pandas as pd
 
-from processing import cleaners
 from processing import util
 
 
@@ -13,13 +15,29 @@ SPLIT_INFO_FNAME = 'metadata.json'
 ATHLETE_DATA_FNAME = 'athletes.json'
 RACE_URLS_FNAME = 'race_urls.json'
 SPLIT_SECS_FNAME = 'times.csv'
+SPLIT_SECS_FNAMES = {
+  'csv': SPLIT_SECS_FNAME,
+  'npy': 'times.npy',
+}
 SPLIT_INFO_FNAME = 'splits.csv'
+STORE_DIRNAME = 'store'
+# Each save writes a new generation of arrays, named in `index.json`.
+STORE_SECS_FNAME = 'secs.{generation}.npy'
+STORE_MASK_FNAME = 'mask.{generation}.npy'
+STORE_INDEX_FNAME = 'index.json'
+
+
+def load_race_urls():
+  with open(os.path.join(DATA_DIR, RACE_URLS_FNAME), 'r') as f:
+    return json.load(f)
 
 
 def get_race_url(race_year):
-  with open(os.path.join(DATA_DIR, 'race_urls.json'), 'r') as f:
-    dict_race_years = json.load(f)
-  return dict_race_years[str(race_year)]
+  return load_race_urls()[str(race_year)]
+
+
+def get_race_years():
+  return sorted(int(race_year) for race_year in load_race_urls())
 
 
 def get_race_data_dir(race_year):
@@ -34,6 +52,15 @@ def get_clean_race_data_dir(race_year):
   return os.path.join(get_race_data_dir(race_year), 'clean')
 
 
+def get_cache_race_data_dir(race_year):
+  return os.path.join(get_race_data_dir(race_year), 'cache')
+
+
+def get_store_dir():
+  # Looked up on each call, so it follows `DATA_DIR`.
+  return os.path.join(DATA_DIR, STORE_DIRNAME)
+
+
 def load_df_split_info_raw(race_year):
   """Assumes we're working with single json object.
 
@@ -137,6 +164,130 @@ def load_df_split_ms_raw(data_dir):
   return load_df_split_ms_json_simple_raw(data_dir)
 
 
+def iter_json_array_items(f, chunk_size=1 << 16):
+  """Yield the items of a top-level json array one at a time.
+
+  Reads `f` in chunks, so only the current item (plus one chunk) is
+  ever held in memory as text.
+  """
+  decoder = json.JSONDecoder()
+  buf = ''
+  eof = False
+  while not buf.lstrip():
+    chunk = f.read(chunk_size)
+    if not chunk:
+      raise ValueError('Expected a json array, got an empty file.')
+    buf += chunk
+  buf = buf.lstrip()
+  if not buf.startswith('['):
+    raise ValueError('Expected a json array.')
+  buf = buf[1:]
+  while True:
+    buf = buf.lstrip(' \t\r\n,')
+    if buf.startswith(']'):
+      return
+    try:
+      item, end = decoder.raw_decode(buf)
+    except json.JSONDecodeError:
+      item, end = None, None
+    # An item running right up to the end of the buffer may be cut off.
+    if end is None or (end == len(buf) and not eof):
+      if eof:
+        raise ValueError('Unexpected end of json array.')
+      chunk = f.read(chunk_size)
+      eof = not chunk
+      buf += chunk
+      continue
+    yield item
+    buf = buf[end:]
+
+
+def iter_athlete_items_raw(data_dir, fmt='json'):
+  """Yield raw athlete items without loading the whole file.
+
+  Args:
+    fmt (str): 'json' for the simple `athletes.json` list (Option 3
+      above), 'jl' for json lines (Option 1).
+  """
+  if fmt == 'jl':
+    with open(os.path.join(data_dir, 'athletes.jl'), 'r') as f:
+      for line in f:
+        if line.strip():
+          yield json.loads(line)
+  elif fmt == 'json':
+    with open(os.path.join(data_dir, ATHLETE_DATA_FNAME), 'r') as f:
+      yield from iter_json_array_items(f)
+  else:
+    raise ValueError(f'Unsupported raw athlete format: {fmt}')
+
+
+def load_split_names_raw(data_dir):
+  """Split names in the order the spider saved them in `metadata.json`."""
+  fname = os.path.join(data_dir, 'metadata.json')
+  if not os.path.exists(fname):
+    return []
+  with open(fname, 'r') as f:
+    raw_json = json.load(f)
+  return [split['name'] for split in raw_json[0]['split_info']]
+
+
+def load_arrays_split_ms_raw(data_dir, fmt='json', init_size=1024):
+  """Stream raw athlete items into a preallocated ms matrix and mask.
+
+  Split names are mapped to columns using `metadata.json`, and Athlinks'
+  -1 (missing) goes straight into the mask, so no dict-of-dicts or
+  intermediate DataFrame is built. The matrix grows in place by
+  doubling, so peak memory stays near the size of the final matrix.
+
+  Like the dict-based loaders above, an athlete name seen twice keeps
+  its first position and its last data. Split names missing from the
+  metadata get a new column.
+
+  Returns:
+    tuple(np.ndarray, np.ndarray, list, list): athletes x splits int64
+      ms and bool missing mask, then split names and athlete names.
+  """
+  split_names = load_split_names_raw(data_dir)
+  split_pos = {name: j for j, name in enumerate(split_names)}
+  athlete_names = []
+  athlete_pos = {}
+  arr_ms = np.zeros((init_size, len(split_names)), dtype='int64')
+  arr_missing = np.ones((init_size, len(split_names)), dtype=bool)
+
+  for item in iter_athlete_items_raw(data_dir, fmt=fmt):
+    i = athlete_pos.get(item['name'])
+    if i is None:
+      i = athlete_pos[item['name']] = len(athlete_names)
+      athlete_names.append(item['name'])
+      if i == len(arr_ms):
+        new_shape = (max(2 * i, 1), arr_ms.shape[1])
+        arr_ms.resize(new_shape, refcheck=False)
+        arr_missing.resize(new_shape, refcheck=False)
+        arr_missing[i:] = True
+    else:
+      arr_ms[i] = 0
+      arr_missing[i] = True
+
+    for split in item['split_data']:
+      j = split_pos.get(split['name'])
+      if j is None:
+        j = split_pos[split['name']] = len(split_names)
+        split_names.append(split['name'])
+        arr_ms = np.pad(arr_ms, ((0, 0), (0, 1)))
+        arr_missing = np.pad(arr_missing, ((0, 0), (0, 1)),
+          constant_values=True)
+      time_ms = split['time_ms']
+      if time_ms is None or time_ms == -1:
+        continue
+      arr_ms[i, j] = time_ms
+      arr_missing[i, j] = False
+
+  new_shape = (len(athlete_names), arr_ms.shape[1])
+  arr_ms.resize(new_shape, refcheck=False)
+  arr_missing.resize(new_shape, refcheck=False)
+  return arr_ms, arr_missing, split_names, athlete_names
+
+
 def load_df_split_times_raw(race_year):
   """
   For now, just assume all splits are chip time, so everyone was on
@@ -147,9 +298,14 @@ def load_df_split_times_raw(race_year):
   # df_athlete_split_secs = load_athlete_split_secs(clean=clean)
 
   raw_data_dir = get_raw_race_data_dir(race_year)
-  df_athlete_split_times = cleaners.process_df_ms(
-    load_df_split_ms_raw(raw_data_dir)
-  ).apply(pd.to_timedelta, axis=0, unit='ms')
+  # Streamed straight into arrays; replaces `cleaners.process_df_ms`
+  # and the per-column `pd.to_timedelta` on a dict-built DataFrame.
+  arr_ms, arr_missing, split_names, athlete_names = load_arrays_split_ms_raw(
+    raw_data_dir)
+  df_athlete_split_times = pd.DataFrame(
+    array_to_array_td(arr_ms, arr_missing, unit='ms').T,
+    index=pd.Index(split_names),
+    columns=pd.Index(athlete_names))
   
   # if include_start:
   #   return pd.concat(
@@ -175,65 +331,415 @@ def load_df_split_times_raw(race_year):
   return df_athlete_split_times
 
 
-def save_df_split_times_clean(df_split_times, race_year):
+def get_split_secs_clean_fname(race_year, fmt=None):
+  """Path to a year's clean split times in the given storage format.
+
+  If no format is given, use the one saved most recently: both can
+  exist (eg. after exporting), and only the newest is sure to be current.
+  """
+  data_dir = get_clean_race_data_dir(race_year)
+  if fmt is None:
+    fnames = [
+      os.path.join(data_dir, fname) for fname in SPLIT_SECS_FNAMES.values()]
+    fnames_found = [fname for fname in fnames if os.path.exists(fname)]
+    if not fnames_found:
+      return fnames[0]
+    # (`max` keeps the first on a tie, so list npy first)
+    return max(reversed(fnames_found), key=lambda f: os.stat(f).st_mtime_ns)
+  return os.path.join(data_dir, SPLIT_SECS_FNAMES[fmt])
+
+
+def save_df_split_times_clean(df_split_times, race_year, fmt='csv'):
   dir_out = get_clean_race_data_dir(race_year)
   if not os.path.exists(dir_out):
     os.makedirs(dir_out)
-  df_td_to_csv(df_split_times, 
-    os.path.join(dir_out, SPLIT_SECS_FNAME))
+  df_td_to_file(df_split_times, get_split_secs_clean_fname(race_year, fmt=fmt))
 
 
-def load_df_split_secs_clean(race_year):
-  data_dir = get_clean_race_data_dir(race_year)
-  return pd.read_csv(
-    os.path.join(data_dir, SPLIT_SECS_FNAME),
-    index_col=INDEX_NAME
-  ).astype('Int64')
+def load_df_split_secs_clean(race_year, fmt=None):
+  return load_df_secs_from_file(get_split_secs_clean_fname(race_year, fmt=fmt))
 
 
-def load_df_split_times_clean(race_year):
+def load_df_split_times_clean(race_year, fmt=None):
   """
   For now, just assume all splits are chip time, so everyone was on
   the starting line at 0:00:00 on their chip.
   I could put this in the scraper file and re-scrape all athlete pages
   to find the actual chip start time (eg. 4:00:45).
   """
-  # df_athlete_split_secs = load_athlete_split_secs(clean=clean)
+  return load_df_td_from_file(get_split_secs_clean_fname(race_year, fmt=fmt))
 
-  data_dir = get_clean_race_data_dir(race_year)
 
-  df_athlete_split_times = load_df_split_secs_clean(data_dir
-    ).apply(pd.to_timedelta, axis=0, unit='s')
-  
-  # if include_start:
-    # return pd.concat(
-    #   [
-    #     pd.DataFrame(
-    #       data=pd.to_timedelta(0, unit='s'),
-    #       index=pd.Index(['Start'], name=df_athlete_split_times.index.name),
-    #       columns=df_athlete_split_times.columns,
-    #     ),
-    #     # pd.DataFrame(
-    #     #   # data=[0 for _ in range(len(all_athlete_split_times.columns))],
-    #     #   index=['Start'],
-    #     #   columns=all_athlete_split_times.columns,
-    #     #   dtype='timedelta64[ns]',
-    #     # ),
-    #     df_athlete_split_times
-    #   ],
-    #   # axis='columns',
-    #   axis='index',
-    #   # ignore_index=True,
-    # )
+def _get_fmt(fname):
+  ext = os.path.splitext(fname)[1].lstrip('.')
+  if ext not in SPLIT_SECS_FNAMES:
+    raise ValueError(f'Unsupported split data file extension: {fname}')
+  return ext
+
+
+def df_td_to_file(df, fname):
+  """Save a timedelta DataFrame in the format implied by `fname`."""
+  if _get_fmt(fname) == 'npy':
+    df_td_to_npy(df, fname)
+  else:
+    df_td_to_csv(df, fname)
+
+
+def load_df_secs_from_file(fname):
+  if _get_fmt(fname) == 'npy':
+    return load_df_secs_from_npy(fname)
+  return load_df_secs_from_csv(fname)
+
+
+def load_df_td_from_file(fname):
+  if _get_fmt(fname) == 'npy':
+    return load_df_td_from_npy(fname)
+  return load_df_td_from_csv(fname)
 
-  return df_athlete_split_times
-  
 
 def df_td_to_csv(df, fname):
-  df.apply(util.td_to_secs).to_csv(fname)
+  df.apply(util.td_to_secs).to_csv(fname + '.tmp')
+  os.replace(fname + '.tmp', fname)
+
+
+def load_df_secs_from_csv(fname):
+  return pd.read_csv(fname, index_col=INDEX_NAME).astype('Int64')
 
 
 def load_df_td_from_csv(fname):
   return pd.read_csv(fname, index_col=INDEX_NAME
     ).astype('Int64'
-    ).apply(pd.to_timedelta, axis=0, unit='s')
\ No newline at end of file
+    ).apply(pd.to_timedelta, axis=0, unit='s')
+
+
+# Binary store: a `.npy` seconds matrix, plus a `.npy` null mask and a
+# json file of labels sitting next to it. Both arrays are stored
+# athletes x splits, so each athlete's column is one contiguous block.
+
+def _get_npy_mask_fname(fname):
+  return os.path.splitext(fname)[0] + '.mask.npy'
+
+
+def _get_npy_labels_fname(fname):
+  return os.path.splitext(fname)[0] + '.labels.json'
+
+
+def get_split_secs_fnames(fname):
+  """Every file making up stored split data: for npy, the mask and labels too."""
+  if _get_fmt(fname) == 'npy':
+    return [fname, _get_npy_mask_fname(fname), _get_npy_labels_fname(fname)]
+  return [fname]
+
+
+def df_td_to_array_secs(df_td):
+  """Whole seconds (rounded down) and null mask, in one vectorized pass.
+
+  Returns:
+    tuple(np.ndarray, np.ndarray): int64 seconds and bool mask, both
+      shaped like `df_td`. Null seconds are stored as 0.
+  """
+  arr_ns = df_td.to_numpy(dtype='timedelta64[ns]')
+  arr_mask = np.isnat(arr_ns)
+  arr_secs = np.where(arr_mask, 0, arr_ns.view('int64') // 10 ** 9)
+  return arr_secs, arr_mask
+
+
+def array_to_array_td(arr, arr_mask, unit='s'):
+  """Integer seconds (or ms, or ns) and null mask to a timedelta64[ns] array.
+
+  NaT wherever the mask is set.
+  """
+  ns_per_unit = {'s': 10 ** 9, 'ms': 10 ** 6, 'ns': 1}[unit]
+  return np.where(arr_mask, np.iinfo('int64').min,
+    np.asarray(arr, dtype='int64') * ns_per_unit).view('timedelta64[ns]')
+
+
+def _save_npy_atomic(fname, arr):
+  """Write to a temp file, then rename: the old file is never truncated,
+  so anyone with it memory-mapped keeps a valid map."""
+  with open(fname + '.tmp', 'wb') as f:
+    np.save(f, arr)
+  os.replace(fname + '.tmp', fname)
+
+
+def df_td_to_npy(df, fname):
+  """Save athletes-major int32 seconds, mask and labels.
+
+  int32, like `ResultsStore`, so `RaceResults` can use the memory-mapped
+  file as is, rather than converting a copy.
+  """
+  arr_secs, arr_mask = df_td_to_array_secs(df)
+  _save_npy_atomic(_get_npy_mask_fname(fname), np.ascontiguousarray(arr_mask.T))
+  fname_labels = _get_npy_labels_fname(fname)
+  with open(fname_labels + '.tmp', 'w') as f:
+    json.dump({
+      INDEX_NAME: df.index.to_list(),
+      'athletes': df.columns.to_list(),
+    }, f)
+  os.replace(fname_labels + '.tmp', fname_labels)
+  # Last, so its modification time marks the save as complete.
+  _save_npy_atomic(fname, np.ascontiguousarray(arr_secs.T, dtype='int32'))
+
+
+def load_arrays_secs_from_npy(fname, mmap_mode='c'):
+  """Memory-map the stored seconds and mask, and read the labels.
+
+  The default copy-on-write mode means edits to the loaded data never
+  reach the file.
+
+  Returns:
+    tuple(np.ndarray, np.ndarray, pd.Index, pd.Index): athletes x splits
+      seconds and mask, then split labels and athlete labels.
+  """
+  arr_secs = np.load(fname, mmap_mode=mmap_mode)
+  arr_mask = np.load(_get_npy_mask_fname(fname), mmap_mode=mmap_mode)
+  with open(_get_npy_labels_fname(fname), 'r') as f:
+    labels = json.load(f)
+  return (
+    arr_secs,
+    arr_mask,
+    pd.Index(labels[INDEX_NAME], name=INDEX_NAME),
+    pd.Index(labels['athletes']),
+  )
+
+
+def df_secs_from_arrays(arr_secs, arr_mask, index, columns, rows=None):
+  """Nullable-int DataFrame whose columns are views of athletes-major arrays.
+
+  Columns are built by position and labelled afterwards, so athletes
+  who share a name stay separate columns.
+
+  Args:
+    rows (list): row of the arrays for each of `columns`; defaults to
+      every row, in order.
+  """
+  if rows is None:
+    rows = range(len(columns))
+  df = pd.DataFrame(
+    {
+      i: pd.arrays.IntegerArray(arr_secs[row], arr_mask[row])
+      for i, row in enumerate(rows)
+    },
+    index=index,
+    copy=False,
+  )
+  df.columns = pd.Index(columns)
+  return df
+
+
+def load_df_secs_from_npy(fname):
+  """Nullable-int DataFrame whose columns are views of the stored data."""
+  arr_secs, arr_mask, index, columns = load_arrays_secs_from_npy(fname)
+  return df_secs_from_arrays(arr_secs, arr_mask, index, columns)
+
+
+def load_df_td_from_npy(fname):
+  arr_secs, arr_mask, index, columns = load_arrays_secs_from_npy(fname)
+  return pd.DataFrame(array_to_array_td(arr_secs, arr_mask).T,
+    index=index, columns=columns)
+
+
+def load_arrays_secs_clean(race_year, fmt=None):
+  """A year's clean split seconds as arrays, whichever format is stored.
+
+  Returns:
+    tuple(np.ndarray, np.ndarray, pd.Index, pd.Index): see
+      `load_arrays_secs_from_npy`.
+  """
+  fname = get_split_secs_clean_fname(race_year, fmt=fmt)
+  if _get_fmt(fname) == 'npy':
+    return load_arrays_secs_from_npy(fname)
+  df_secs = load_df_secs_from_csv(fname)
+  return (
+    df_secs.to_numpy(dtype='int32', na_value=0).T,
+    df_secs.isna().to_numpy().T,
+    df_secs.index,
+    df_secs.columns,
+  )
+
+
+def save_results_store(race_years=None, store_dir=None):
+  """Consolidate every year's clean split data into one on-disk store.
+
+  Each year is an athletes x splits int32 seconds matrix (plus null
+  mask), laid end to end in one flat file. `index.json` holds the
+  year/offset table, each year's split and athlete labels, and an
+  athlete index mapping each name to its (year, row) positions.
+
+  The store can be rewritten while others have it open. The arrays of
+  each save go to new files, and `index.json`, which names them, is
+  swapped in last: readers see the old store or the new one, and maps
+  of the old arrays stay valid after they are removed.
+
+  Args:
+    race_years (list): defaults to every year in `race_urls.json`
+      that has clean data saved.
+    store_dir (str): defaults to `get_store_dir()`.
+  """
+  if race_years is None:
+    race_years = [
+      race_year for race_year in get_race_years()
+      if os.path.exists(get_split_secs_clean_fname(race_year))
+    ]
+  store_dir = store_dir or get_store_dir()
+  if not os.path.exists(store_dir):
+    os.makedirs(store_dir)
+
+  year_arrays = {
+    race_year: load_arrays_secs_clean(race_year) for race_year in race_years}
+  total_size = sum(arr_secs.size for arr_secs, _, _, _ in year_arrays.values())
+
+  generation = uuid.uuid4().hex
+  secs_fname = STORE_SECS_FNAME.format(generation=generation)
+  mask_fname = STORE_MASK_FNAME.format(generation=generation)
+  arr_secs_out = np.lib.format.open_memmap(
+    os.path.join(store_dir, secs_fname), mode='w+', dtype='int32',
+    shape=(total_size,))
+  arr_mask_out = np.lib.format.open_memmap(
+    os.path.join(store_dir, mask_fname), mode='w+', dtype=bool,
+    shape=(total_size,))
+
+  index_years = {}
+  index_athletes = {}
+  offset = 0
+  for race_year, (arr_secs, arr_mask, index, columns) in year_arrays.items():
+    arr_secs_out[offset:offset + arr_secs.size] = arr_secs.ravel()
+    arr_mask_out[offset:offset + arr_mask.size] = arr_mask.ravel()
+    index_years[str(race_year)] = {
+      'offset': offset,
+      INDEX_NAME: index.to_list(),
+      'athletes': columns.to_list(),
+    }
+    for row, athlete in enumerate(columns):
+      index_athletes.setdefault(athlete, []).append([race_year, row])
+    offset += arr_secs.size
+
+  arr_secs_out.flush()
+  arr_mask_out.flush()
+  del arr_secs_out, arr_mask_out
+
+  fname = os.path.join(store_dir, STORE_INDEX_FNAME)
+  with open(fname + '.tmp', 'w') as f:
+    json.dump({
+      'secs': secs_fname,
+      'mask': mask_fname,
+      'years': index_years,
+      'athletes': index_athletes,
+    }, f)
+  os.replace(fname + '.tmp', fname)
+
+  # Older generations (and arrays left by failed saves).
+  for pattern in (STORE_SECS_FNAME, STORE_MASK_FNAME):
+    for fname_old in glob.glob(os.path.join(store_dir, pattern.format(
+        generation='*'))):
+      if os.path.basename(fname_old) not in (secs_fname, mask_fname):
+        os.remove(fname_old)
+
+
+class ResultsStore:
+  """Every year's clean split seconds, memory-mapped from one store.
+
+  Opening the store only maps the files and reads the label index, so
+  it is near-instant no matter how many years it holds. Read-only maps
+  are backed by the OS page cache, which means every notebook kernel or
+  worker process that opens the store shares the same memory.
+
+  All DataFrames returned are nullable-int (`Int32`), splits x
+  athletes, and each column is a view into the store.
+
+  Args:
+    store_dir (str): defaults to `get_store_dir()`.
+  """
+  def __init__(self, store_dir=None, mmap_mode='r'):
+    store_dir = store_dir or get_store_dir()
+    for n_tries_left in reversed(range(3)):
+      with open(os.path.join(store_dir, STORE_INDEX_FNAME), 'r') as f:
+        index = json.load(f)
+      try:
+        self._arr_secs = np.load(os.path.join(store_dir, index['secs']),
+          mmap_mode=mmap_mode)
+        self._arr_mask = np.load(os.path.join(store_dir, index['mask']),
+          mmap_mode=mmap_mode)
+        break
+      except FileNotFoundError:
+        # A newer save replaced the index since we read it.
+        if not n_tries_left:
+          raise
+    self._years = {
+      int(race_year): year_info
+      for race_year, year_info in index['years'].items()
+    }
+    self._athletes = index['athletes']
+
+  @property
+  def race_years(self):
+    return list(self._years)
+
+  def get_athlete_positions(self, athlete):
+    """(year, row) of each result the athlete has in the store."""
+    return [tuple(pos) for pos in self._athletes.get(athlete, [])]
+
+  def get_labels(self, race_year):
+    """Split labels and athlete labels for one year."""
+    year_info = self._years[race_year]
+    return (
+      pd.Index(year_info[INDEX_NAME], name=INDEX_NAME),
+      pd.Index(year_info['athletes']),
+    )
+
+  def arrays(self, race_year):
+    """Views of one year's athletes x splits seconds and null mask."""
+    year_info = self._years[race_year]
+    shape = (len(year_info['athletes']), len(year_info[INDEX_NAME]))
+    ix_st = year_info['offset']
+    ix_ed = ix_st + shape[0] * shape[1]
+    return (
+      self._arr_secs[ix_st:ix_ed].reshape(shape),
+      self._arr_mask[ix_st:ix_ed].reshape(shape),
+    )
+
+  def df_split_secs(self, race_year, athletes=None):
+    """One year's split seconds, optionally for a subset of athletes.
+
+    Athletes without a result that year are left out.
+    """
+    year_info = self._years[race_year]
+    if athletes is None:
+      rows = None
+      columns = year_info['athletes']
+    else:
+      rows, columns = [], []
+      for athlete in athletes:
+        for year, row in self.get_athlete_positions(athlete):
+          if year == race_year:
+            rows.append(row)
+            columns.append(athlete)
+    arr_secs, arr_mask = self.arrays(race_year)
+    return df_secs_from_arrays(arr_secs, arr_mask,
+      pd.Index(year_info[INDEX_NAME], name=INDEX_NAME), columns, rows=rows)
+
+  def dfs_split_secs(self, race_years=None, athletes=None):
+    """Split seconds for a set of years and/or athletes.
+
+    Years have different splits, so each gets its own DataFrame.
+
+    Returns:
+      dict: race year -> DataFrame, for each year with any matches.
+    """
+    if athletes is not None:
+      # Only visit the years these athletes actually appear in.
+      years_found = {
+        year
+        for athlete in athletes
+        for year, _ in self.get_athlete_positions(athlete)
+      }
+      race_years = [
+        race_year for race_year in (race_years or self.race_years)
+        if race_year in years_found
+      ]
+    elif race_years is None:
+      race_years = self.race_years
+    return {
+      race_year: self.df_split_secs(race_year, athletes=athletes)
+      for race_year in race_years
+    }
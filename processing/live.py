@@ -0,0 +1,230 @@
+"""Live race mode: split stats that update as results come in.
+
+Re-running the raw loaders, `cleaners.sort_df_split_data` and
+`analysis.df_split_stats` on every poll redoes the whole race each
+time. `LiveSplitStats` instead takes new (athlete, split, seconds)
+observations and updates only what they touch:
+
+* each athlete's furthest split, and so the athletes stopped at each
+  split (from which athletes through each split follow),
+* running per-split time stats (`streaming.StatsAccumulator`),
+* the athlete order of `cleaners.get_column_order`, kept as a sorted
+  list of keys that each observation moves one athlete within.
+
+Observations already seen are dropped, so a poll can hand over every
+result so far. A changed time for a split already seen (a timing
+correction) is applied too, at the cost of rebuilding the running stats.
+
+`replay` feeds a finished race back in timestamp order, one poll at a
+time, to test or demo the whole thing.
+"""
+import bisect
+
+import numpy as np
+import pandas as pd
+
+from processing import analysis, io, streaming
+from processing.results import RaceResults
+
+
+POLL_SECS = 300
+
+
+class LiveSplitStats:
+  """Split stats for a race in progress.
+
+  Args:
+    index (pd.Index): split labels, in course order. Observations of
+      any other split are ignored.
+    init_size (int): athletes to make room for up front; doubles as
+      needed.
+    kwargs: passed to `streaming.StatsAccumulator`.
+  """
+  def __init__(self, index, init_size=1024, **kwargs):
+    self.index = pd.Index(index, name=io.INDEX_NAME)
+    self.athletes = []
+    self.stopped = np.zeros(len(self.index), dtype='int64')
+    self.stats = streaming.StatsAccumulator(self.index, **kwargs)
+    self._stats_kwargs = kwargs
+    self._split_pos = {label: i for i, label in enumerate(self.index)}
+    self._athlete_pos = {}
+    # Athletes-major, like RaceResults.
+    self._secs = np.zeros((init_size, len(self.index)))
+    self._valid = np.zeros((init_size, len(self.index)), dtype=bool)
+    self._last_valid = np.full(init_size, -1, dtype='int64')
+    self._sort_keys = {}
+    self._sorted_keys = []
+
+  def _grow(self):
+    self._secs = np.concatenate([self._secs, np.zeros_like(self._secs)])
+    self._valid = np.concatenate([self._valid, np.zeros_like(self._valid)])
+    self._last_valid = np.concatenate([self._last_valid,
+      np.full(len(self._last_valid), -1, dtype='int64')])
+
+  def _get_athlete_pos(self, athlete):
+    pos = self._athlete_pos.get(athlete)
+    if pos is None:
+      pos = self._athlete_pos[athlete] = len(self.athletes)
+      self.athletes.append(athlete)
+      if pos == len(self._secs):
+        self._grow()
+    return pos
+
+  def _get_sort_key(self, pos):
+    # As in `cleaners.get_column_order`: furthest split first, missing
+    # sorting last, ties in order of arrival.
+    arr_keys = np.where(self._valid[pos], self._secs[pos], np.inf)
+    return tuple(arr_keys[::-1].tolist()) + (pos,)
+
+  def _resort(self, pos):
+    key_old = self._sort_keys.get(pos)
+    if key_old is not None:
+      del self._sorted_keys[bisect.bisect_left(self._sorted_keys, key_old)]
+    key = self._sort_keys[pos] = self._get_sort_key(pos)
+    bisect.insort(self._sorted_keys, key)
+
+  def _rebuild_stats(self):
+    n = len(self.athletes)
+    self.stats = streaming.StatsAccumulator(self.index, **self._stats_kwargs)
+    self.stats.update(np.where(self._valid[:n], self._secs[:n], np.nan).T)
+
+  def update(self, athletes, labels, secs):
+    """Add observations: `athletes[k]` reached `labels[k]` at `secs[k]`.
+
+    Returns:
+      int: number of new or changed observations applied.
+    """
+    ix_split = np.array([self._split_pos.get(label, -1) for label in labels],
+      dtype='int64')
+    arr_secs = np.asarray(secs, dtype='float64')
+    keep = (ix_split >= 0) & ~np.isnan(arr_secs)
+    ix_athlete = np.array([
+      self._get_athlete_pos(athlete)
+      for athlete, is_kept in zip(athletes, keep) if is_kept
+    ], dtype='int64')
+    ix_split, arr_secs = ix_split[keep], arr_secs[keep]
+
+    # Within a batch, the last observation of a split wins.
+    arr_flat = ix_athlete * len(self.index) + ix_split
+    _, ix_last = np.unique(arr_flat[::-1], return_index=True)
+    ix_last = len(arr_flat) - 1 - ix_last
+    ix_athlete, ix_split, arr_secs = (ix_athlete[ix_last], ix_split[ix_last],
+      arr_secs[ix_last])
+
+    is_seen = self._valid[ix_athlete, ix_split]
+    is_new = ~is_seen | (self._secs[ix_athlete, ix_split] != arr_secs)
+    ix_athlete, ix_split, arr_secs = (ix_athlete[is_new], ix_split[is_new],
+      arr_secs[is_new])
+    has_corrections = is_seen[is_new].any()
+    if not len(ix_athlete):
+      return 0
+
+    self._secs[ix_athlete, ix_split] = arr_secs
+    self._valid[ix_athlete, ix_split] = True
+
+    # Move each touched athlete from their old furthest split to the new one.
+    ix_touched = np.unique(ix_athlete)
+    arr_last_old = self._last_valid[ix_touched]
+    np.maximum.at(self._last_valid, ix_athlete, ix_split)
+    arr_last_new = self._last_valid[ix_touched]
+    np.subtract.at(self.stopped, arr_last_old[arr_last_old >= 0], 1)
+    np.add.at(self.stopped, arr_last_new, 1)
+
+    if has_corrections:
+      self._rebuild_stats()
+    else:
+      arr_values = np.full((len(self.index), len(arr_secs)), np.nan)
+      arr_values[ix_split, np.arange(len(arr_secs))] = arr_secs
+      self.stats.update(arr_values)
+
+    for pos in ix_touched:
+      self._resort(pos)
+    return len(arr_secs)
+
+  def update_df(self, df_observations):
+    """Add observations from a frame like `df_observations` makes."""
+    return self.update(df_observations['athlete'].to_numpy(),
+      df_observations['label'].to_numpy(), df_observations['seconds'].to_numpy())
+
+  def update_athlete_items(self, athlete_items):
+    """Add raw athlete items, as scraped or fetched (`fetch.fetch_race`).
+
+    Athlinks' -1 (missing) times are skipped.
+    """
+    athletes, labels, secs = [], [], []
+    for item in athlete_items:
+      for split in item['split_data']:
+        if split['time_ms'] != -1:
+          athletes.append(item['name'])
+          labels.append(split['name'])
+          secs.append(split['time_ms'] / 1000)
+    return self.update(athletes, labels, secs)
+
+  def array_number_stopped_by_split(self):
+    return self.stopped.copy()
+
+  def df_split_stats(self):
+    """The current `analysis.df_split_stats` table."""
+    return analysis._df_split_stats_from_stopped(self.stopped.copy(),
+      self.index)
+
+  def stats_df(self):
+    """The current per-split time stats, in seconds (median approximate)."""
+    return self.stats.stats_df()
+
+  def get_column_order(self):
+    """Positions in `athletes`, in `cleaners.get_column_order` order."""
+    return np.array([key[-1] for key in self._sorted_keys], dtype='int64')
+
+  def to_race_results(self, df_split_info=None):
+    """Everything so far, with athletes in sorted order."""
+    n = len(self.athletes)
+    return RaceResults.from_arrays_athletes_major(
+      np.rint(self._secs[:n]), ~self._valid[:n], self.index,
+      pd.Index(self.athletes), df_split_info=df_split_info,
+    ).take_columns(self.get_column_order())
+
+
+def df_observations(df_split_times):
+  """Every valid split as an observation, in the order they happened.
+
+  Returns:
+    pd.DataFrame: 'athlete', 'label' and 'seconds' columns, sorted by
+      seconds (the race clock).
+  """
+  arr_secs = analysis.array_split_secs(df_split_times)
+  ix_split, ix_athlete = np.nonzero(~np.isnan(arr_secs))
+  arr_obs_secs = arr_secs[ix_split, ix_athlete]
+  order = np.argsort(arr_obs_secs, kind='stable')
+  return pd.DataFrame({
+    'athlete': df_split_times.columns[ix_athlete[order]],
+    'label': df_split_times.index[ix_split[order]],
+    'seconds': arr_obs_secs[order],
+  })
+
+
+def replay(df_split_times, poll_secs=POLL_SECS, **kwargs):
+  """Feed a finished race back, one poll's worth of results at a time.
+
+  Args:
+    df_split_times (pd.DataFrame or RaceResults): a finished race.
+    poll_secs (float): race clock between polls.
+    kwargs: passed to `LiveSplitStats`.
+  Yields:
+    tuple(float, LiveSplitStats): race clock at each poll, and the
+      aggregator, updated in place. After the last poll it matches
+      the finished race.
+  """
+  df_obs = df_observations(df_split_times)
+  live = LiveSplitStats(df_split_times.index, **kwargs)
+  if not len(df_obs):
+    return
+  arr_t_poll = poll_secs * np.arange(1,
+    np.floor(df_obs['seconds'].iloc[-1] / poll_secs) + 2)
+  ix_ed = np.searchsorted(df_obs['seconds'].to_numpy(), arr_t_poll,
+    side='right')
+  ix_st = 0
+  for t_poll, ix in zip(arr_t_poll, ix_ed):
+    live.update_df(df_obs.iloc[ix_st:ix])
+    ix_st = ix
+    yield t_poll, live
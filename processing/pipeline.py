@@ -0,0 +1,156 @@
+"""Process raw scraped data into clean data for every race year.
+
+Chains the same steps the notebooks run by hand, one year at a time:
+load and clean the split info, load and sort the athlete split times,
+apply the year's hand-made corrections (see `corrections`), and save
+both to the year's clean directory.
+
+Each year's raw inputs and corrections are hashed, and the hash is
+recorded next to the clean outputs. Years whose inputs (and pipeline
+version) haven't changed since the last run are skipped, and the rest
+are processed in parallel across a process pool.
+
+Clean data with no manifest next to it wasn't made here (eg. it was
+saved from a notebook), so it is kept unless reprocessing is forced.
+"""
+import concurrent.futures
+import hashlib
+import json
+import os
+
+from processing import cleaners
+from processing import corrections
+from processing import io
+
+
+# Bump this when the processing steps change, so every year reprocesses.
+PIPELINE_VERSION = 2
+MANIFEST_FNAME = 'pipeline.json'
+RAW_INPUT_FNAMES = [io.ATHLETE_DATA_FNAME, 'metadata.json']
+
+
+def get_manifest_fname(race_year):
+  return os.path.join(io.get_clean_race_data_dir(race_year), MANIFEST_FNAME)
+
+
+def hash_raw_inputs(race_year, chunk_size=1 << 20):
+  """Content hash of a year's raw `athletes.json` and `metadata.json`."""
+  raw_data_dir = io.get_raw_race_data_dir(race_year)
+  h = hashlib.sha256()
+  for fname in RAW_INPUT_FNAMES:
+    h.update(fname.encode())
+    with open(os.path.join(raw_data_dir, fname), 'rb') as f:
+      for chunk in iter(lambda: f.read(chunk_size), b''):
+        h.update(chunk)
+  return h.hexdigest()
+
+
+def load_manifest(race_year):
+  fname = get_manifest_fname(race_year)
+  if not os.path.exists(fname):
+    return None
+  with open(fname, 'r') as f:
+    return json.load(f)
+
+
+def save_manifest(manifest, race_year):
+  with open(get_manifest_fname(race_year), 'w') as f:
+    json.dump(manifest, f)
+
+
+def hash_corrections(race_year):
+  corrections_json = json.dumps(
+    corrections.get_corrections(race_year), sort_keys=True)
+  return hashlib.sha256(corrections_json.encode()).hexdigest()
+
+
+def create_manifest(race_year, fmt):
+  return {
+    'pipeline_version': PIPELINE_VERSION,
+    'fmt': fmt,
+    'raw_hash': hash_raw_inputs(race_year),
+    'corrections_hash': hash_corrections(race_year),
+  }
+
+
+def is_up_to_date(race_year, fmt='csv'):
+  """Whether a year's clean data was built from its current raw data."""
+  manifest = load_manifest(race_year)
+  return (
+    manifest is not None
+    and manifest == create_manifest(race_year, fmt)
+    and os.path.exists(io.get_split_secs_clean_fname(race_year, fmt=fmt))
+  )
+
+
+def is_hand_made(race_year):
+  """Whether a year has clean data that this pipeline didn't make."""
+  clean_fnames = [
+    os.path.join(io.get_clean_race_data_dir(race_year), io.SPLIT_INFO_FNAME),
+    *(io.get_split_secs_clean_fname(race_year, fmt=fmt)
+      for fmt in io.SPLIT_SECS_FNAMES),
+  ]
+  return load_manifest(race_year) is None and any(
+    os.path.exists(fname) for fname in clean_fnames)
+
+
+def process_race_year(race_year, fmt='csv'):
+  """Raw -> clean for a single year, then record the inputs' hash."""
+  df_split_info = corrections.correct_df_split_info(
+    cleaners.process_df_split_info(io.load_df_split_info_raw(race_year)),
+    race_year)
+  io.save_df_split_info_clean(df_split_info, race_year)
+
+  # Corrections are by label, so they don't care about the order; sort
+  # after, since they change who got how far.
+  df_split_times = cleaners.sort_df_split_data(
+    corrections.correct_df_split_times(
+      io.load_df_split_times_raw(race_year), race_year),
+    df_split_info)
+  io.save_df_split_times_clean(df_split_times, race_year, fmt=fmt)
+
+  save_manifest(create_manifest(race_year, fmt), race_year)
+  return race_year
+
+
+def run_pipeline(race_years=None, max_workers=None, force=False, fmt='csv'):
+  """Process every year whose raw data changed, in parallel.
+
+  Args:
+    race_years (list): defaults to every year in `race_urls.json`.
+    max_workers (int): size of the process pool. Defaults to the
+      number of CPUs.
+    force (bool): reprocess years even if they are up to date, or
+      have hand-made clean data.
+    fmt (str): storage format for the clean split times.
+  Returns:
+    dict: race year -> 'processed', 'skipped' (up to date) or 'kept'
+      (hand-made clean data, left alone).
+  """
+  if race_years is None:
+    race_years = io.get_race_years()
+
+  results = {}
+  if not force:
+    for race_year in race_years:
+      if is_up_to_date(race_year, fmt=fmt):
+        results[race_year] = 'skipped'
+      elif is_hand_made(race_year):
+        results[race_year] = 'kept'
+  race_years_todo = [
+    race_year for race_year in race_years if race_year not in results]
+
+  if len(race_years_todo) == 1:
+    # Not worth spinning up a pool.
+    process_race_year(race_years_todo[0], fmt=fmt)
+    results[race_years_todo[0]] = 'processed'
+  elif race_years_todo:
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+      futures = [
+        executor.submit(process_race_year, race_year, fmt=fmt)
+        for race_year in race_years_todo
+      ]
+      for future in concurrent.futures.as_completed(futures):
+        results[future.result()] = 'processed'
+
+  return {race_year: results[race_year] for race_year in race_years}
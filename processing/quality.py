@@ -0,0 +1,149 @@
+"""Bulk data-quality checks for split data.
+
+Every check runs as array operations over a race's whole splits x
+athletes matrix at once, and the results come back as one compact,
+long-form report: a row per flagged (athlete, split, check).
+
+Checks:
+  non_monotonic          split time earlier than the previous valid split
+  too_fast               segment pace (from `distance_mi`) faster than
+                         `MIN_PACE_MIN_PER_MI`
+  past_cutoff            split time later than the split's `cutoff_hr`
+  missing_between_valid  missing split followed by a valid one
+  duplicate_name         athlete name appearing more than once
+"""
+import numpy as np
+import pandas as pd
+
+from processing import analysis, io, util
+from processing.results import RaceResults
+
+
+# Faster than any plausible 100-mile segment pace, even downhill.
+MIN_PACE_MIN_PER_MI = 5.0
+CHECKS = [
+  'non_monotonic',
+  'too_fast',
+  'past_cutoff',
+  'missing_between_valid',
+  'duplicate_name',
+]
+
+
+def _to_race_results(df_split_times, df_split_info=None):
+  if isinstance(df_split_times, RaceResults):
+    return df_split_times
+  return RaceResults.from_df_split_times(df_split_times,
+    df_split_info=df_split_info)
+
+
+def array_quality_flags(results, min_pace_min_per_mi=MIN_PACE_MIN_PER_MI):
+  """Boolean flags for every split-level check, splits x athletes.
+
+  Pace and cutoff checks are skipped for splits without a known
+  `distance_mi` or `cutoff_hr`.
+
+  Returns:
+    dict: check name -> bool np.ndarray.
+  """
+  arr_valid = ~results.mask
+  arr_secs = results.secs.astype('int64')
+  n_splits, n_athletes = arr_secs.shape
+
+  # Each valid split is compared with the last valid split before it
+  # (or the start line, at 0 miles and 0:00:00).
+  arr_pos_prev = util.array_prev_valid_position(arr_valid)
+  arr_has_prev = arr_pos_prev >= 0
+  arr_pos_prev = np.maximum(arr_pos_prev, 0)
+  arr_secs_prev = np.where(arr_has_prev,
+    arr_secs[arr_pos_prev, np.arange(n_athletes)], 0)
+  arr_mi_prev = np.where(arr_has_prev, results.distance_mi[arr_pos_prev], 0.0)
+
+  arr_segment_secs = arr_secs - arr_secs_prev
+  arr_segment_mi = results.distance_mi[:, np.newaxis] - arr_mi_prev
+  with np.errstate(divide='ignore', invalid='ignore'):
+    arr_pace = arr_segment_secs / 60 / arr_segment_mi
+
+  arr_last_valid = analysis.array_last_valid_split_position(results)
+
+  return {
+    'non_monotonic': arr_valid & arr_has_prev & (arr_segment_secs < 0),
+    # NaN distances compare False, so unknown distances never flag.
+    'too_fast': (arr_valid & (arr_segment_secs >= 0) & (arr_segment_mi > 0)
+      & (arr_pace < min_pace_min_per_mi)),
+    'past_cutoff': arr_valid & (
+      arr_secs > 3600 * results.cutoff_hr[:, np.newaxis]),
+    'missing_between_valid': ~arr_valid & (
+      np.arange(n_splits)[:, np.newaxis] < arr_last_valid),
+  }
+
+
+def df_quality_report(df_split_times, df_split_info=None,
+                      min_pace_min_per_mi=MIN_PACE_MIN_PER_MI):
+  """Every flagged split (and duplicate name) in one race.
+
+  Args:
+    df_split_times (pd.DataFrame or RaceResults): split times. Pace and
+      cutoff checks need `df_split_info` (or RaceResults split info).
+  Returns:
+    pd.DataFrame: one row per flag, with 'athlete', 'label', 'check'
+      and 'seconds' (the split time, if any) columns. Duplicate names
+      are flagged once per column, with no label.
+  """
+  results = _to_race_results(df_split_times, df_split_info=df_split_info)
+  dict_flags = array_quality_flags(results,
+    min_pace_min_per_mi=min_pace_min_per_mi)
+
+  list_ix_split, list_ix_athlete, list_checks = [], [], []
+  for check, arr_flags in dict_flags.items():
+    ix_split, ix_athlete = np.nonzero(arr_flags)
+    list_ix_split.append(ix_split)
+    list_ix_athlete.append(ix_athlete)
+    list_checks.append(np.full(len(ix_split), check, dtype=object))
+
+  ix_duplicate = np.nonzero(results.columns.duplicated(keep=False))[0]
+  list_ix_split.append(np.full(len(ix_duplicate), -1))
+  list_ix_athlete.append(ix_duplicate)
+  list_checks.append(np.full(len(ix_duplicate), 'duplicate_name', dtype=object))
+
+  ix_split = np.concatenate(list_ix_split)
+  ix_athlete = np.concatenate(list_ix_athlete)
+  # Position -1 (duplicate names) picks the trailing None.
+  arr_labels = np.array(results.index.to_list() + [None], dtype=object)
+  arr_seconds = np.where(
+    (ix_split >= 0) & ~results.mask[ix_split, ix_athlete],
+    results.secs[ix_split, ix_athlete], np.nan)
+
+  return pd.DataFrame({
+    'athlete': results.columns[ix_athlete],
+    'label': arr_labels[ix_split],
+    'check': pd.Categorical(np.concatenate(list_checks), categories=CHECKS),
+    'seconds': arr_seconds,
+  })
+
+
+def df_quality_report_years(race_years=None, results_store=None,
+                            min_pace_min_per_mi=MIN_PACE_MIN_PER_MI):
+  """Quality report for many years, stacked with a 'race_year' column.
+
+  Args:
+    race_years (list): defaults to every year in `results_store`, or
+      else every year in `race_urls.json`.
+    results_store (io.ResultsStore): read split data from the store
+      rather than each year's clean directory.
+  """
+  if race_years is None:
+    race_years = (io.get_race_years() if results_store is None
+      else results_store.race_years)
+
+  dfs = []
+  for race_year in race_years:
+    if results_store is None:
+      results = RaceResults.from_clean(race_year)
+    else:
+      results = RaceResults.from_results_store(results_store, race_year,
+        df_split_info=io.load_df_split_info_clean(race_year))
+    df = df_quality_report(results, min_pace_min_per_mi=min_pace_min_per_mi)
+    df.insert(0, 'race_year', race_year)
+    dfs.append(df)
+  return pd.concat(dfs, ignore_index=True)
@@ -0,0 +1,114 @@
+"""Compact, array-backed container for one race's split data.
+
+DataFrames with one nullable column per athlete pay per-column overhead
+on every operation. `RaceResults` instead holds a single int32 seconds
+matrix and a bool missing mask, plus the split metadata that goes with
+them, and converts to and from the usual DataFrame shape.
+"""
+import numpy as np
+import pandas as pd
+
+from processing import io
+
+
+class RaceResults:
+  """Split seconds for every athlete in a race, splits x athletes.
+
+  The matrix is stored athletes-major (Fortran order when viewed as
+  splits x athletes), the same layout as the `.npy` clean store and
+  `io.ResultsStore`. That way each athlete column is one contiguous
+  block, and both loading from the stores and converting to a
+  nullable-int DataFrame are zero-copy.
+
+  Attributes:
+    secs (np.ndarray): int32 seconds, splits x athletes. Values under
+      the mask are meaningless.
+    mask (np.ndarray): bool, True where a split is missing.
+    index (pd.Index): split labels.
+    columns (pd.Index): athlete names.
+    distance_mi (np.ndarray): float distance of each split, NaN if unknown.
+    cutoff_hr (np.ndarray): float cutoff at each split, NaN if none.
+  """
+  __slots__ = ('secs', 'mask', 'index', 'columns', 'distance_mi', 'cutoff_hr')
+
+  def __init__(self, secs, mask, index, columns, df_split_info=None):
+    self.secs = secs
+    self.mask = mask
+    self.index = pd.Index(index, name=io.INDEX_NAME)
+    self.columns = pd.Index(columns)
+    self.distance_mi = self._get_split_info_array(df_split_info, 'distance_mi')
+    self.cutoff_hr = self._get_split_info_array(df_split_info, 'cutoff_hr')
+
+  def _get_split_info_array(self, df_split_info, col):
+    if df_split_info is None or col not in df_split_info.columns:
+      return np.full(len(self.index), np.nan)
+    return df_split_info[col].reindex(self.index).to_numpy(dtype='float64')
+
+  @classmethod
+  def from_arrays_athletes_major(cls, arr_secs, arr_mask, index, columns,
+                                 df_split_info=None):
+    """From athletes x splits arrays, as the stores keep them."""
+    return cls(
+      np.ascontiguousarray(arr_secs, dtype='int32').T,
+      np.ascontiguousarray(arr_mask, dtype=bool).T,
+      index, columns, df_split_info=df_split_info)
+
+  @classmethod
+  def from_df_split_times(cls, df_split_times, df_split_info=None):
+    arr_secs, arr_mask = io.df_td_to_array_secs(df_split_times)
+    return cls.from_arrays_athletes_major(arr_secs.T, arr_mask.T,
+      df_split_times.index, df_split_times.columns,
+      df_split_info=df_split_info)
+
+  @classmethod
+  def from_df_split_secs(cls, df_split_secs, df_split_info=None):
+    return cls.from_arrays_athletes_major(
+      df_split_secs.to_numpy(dtype='int64', na_value=0).T,
+      df_split_secs.isna().to_numpy().T,
+      df_split_secs.index, df_split_secs.columns,
+      df_split_info=df_split_info)
+
+  @classmethod
+  def from_clean(cls, race_year, fmt=None):
+    """Load a year's clean split data, and its split info if saved."""
+    arr_secs, arr_mask, index, columns = io.load_arrays_secs_clean(race_year,
+      fmt=fmt)
+    try:
+      df_split_info = io.load_df_split_info_clean(race_year)
+    except FileNotFoundError:
+      df_split_info = None
+    return cls.from_arrays_athletes_major(arr_secs, arr_mask, index, columns,
+      df_split_info=df_split_info)
+
+  @classmethod
+  def from_results_store(cls, results_store, race_year, df_split_info=None):
+    """Zero-copy view of one year in an `io.ResultsStore`."""
+    arr_secs, arr_mask = results_store.arrays(race_year)
+    index, columns = results_store.get_labels(race_year)
+    return cls.from_arrays_athletes_major(arr_secs, arr_mask, index, columns,
+      df_split_info=df_split_info)
+
+  @property
+  def shape(self):
+    return self.secs.shape
+
+  def to_df_split_secs(self):
+    """Nullable-int DataFrame whose columns are views of `secs`."""
+    return io.df_secs_from_arrays(self.secs.T, self.mask.T, self.index,
+      self.columns)
+
+  def to_df_split_times(self):
+    return pd.DataFrame(io.array_to_array_td(self.secs, self.mask),
+      index=self.index, columns=self.columns)
+
+  def take_columns(self, positions):
+    """A new RaceResults with only the athletes at `positions`."""
+    results = RaceResults.__new__(RaceResults)
+    # Index the athletes-major arrays, so the layout is kept.
+    results.secs = self.secs.T[positions].T
+    results.mask = self.mask.T[positions].T
+    results.index = self.index
+    results.columns = self.columns[positions]
+    results.distance_mi = self.distance_mi
+    results.cutoff_hr = self.cutoff_hr
+    return results
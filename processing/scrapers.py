@@ -16,14 +16,34 @@ Refs:
   https://gitlab.com/gallaecio/versiontracker/blob/master/versiontracker/__init__.py#L212
  
 """
+import hashlib
+import json
 import os
+import re
+import shutil
+from urllib.parse import parse_qs, urlparse
+import uuid
 
-from scrapy.crawler import CrawlerProcess
+from scrapy import Request
+from scrapy.crawler import Crawler, CrawlerProcess
+from scrapy.extensions.httpcache import DummyPolicy
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet.defer import DeferredSemaphore
 from scrapy_athlinks import RaceSpider
 
 from processing import io
 
 
+# Results listing pages (on any host, so a stub server's too). They are
+# always re-fetched as results come in; athlete pages only when their
+# listing entry changes.
+REFRESH_PATTERNS = [r'^https?://[^/]+/event/\d+']
+
+# Where a cached athlete page records the listing entry it was fetched for.
+LISTING_HASH_META = 'listing_hash'
+LISTING_HASH_HEADER = 'X-Listing-Hash'
+
+
 class LeadvilleScraper:
   def __init__(self, race_year):
     self.spider = RaceSpider
@@ -33,16 +53,32 @@ class LeadvilleScraper:
   def _get_uri(self, fname):
     return os.path.join(self.dir_out, fname)
 
-  def run_spider(self, settings={}):
+  def _make_dir_out(self):
     if not os.path.exists(self.dir_out):
       os.makedirs(self.dir_out)
+
+  def run_spider(self, settings={}):
+    self._make_dir_out()
     process = CrawlerProcess(settings=settings)
     process.crawl(self.spider, io.get_race_url(self.race_year))
     process.start()
 
-  def run_spider_pandas(self):
-    """Saves items in the most pandas-available file formats."""
-    self.run_spider(settings={
+  def crawl(self, process, settings={}, spider=None):
+    """Queue this year's crawl in an existing `CrawlerProcess`.
+
+    The crawl gets its own settings (and so its own feeds), which is
+    what lets several years share one process and one reactor.
+
+    Args:
+      spider (type): defaults to `self.spider`.
+    """
+    self._make_dir_out()
+    crawler = Crawler(spider or self.spider, settings)
+    process.crawl(crawler, io.get_race_url(self.race_year))
+    return crawler
+
+  def get_settings_pandas(self):
+    return {
       # https://docs.scrapy.org/en/latest/topics/feed-exports.html#feeds
       'FEEDS': {
         # https://docs.scrapy.org/en/latest/topics/feed-exports.html#storage-uri-parameters
@@ -61,7 +97,95 @@ class LeadvilleScraper:
           # (Rather than a single-item list)
         },
       }
-    })
+    }
+
+  def run_spider_pandas(self):
+    """Saves items in the most pandas-available file formats."""
+    self.run_spider(settings=self.get_settings_pandas())
+    self.finish_pandas()
+
+  def finish_pandas(self):
+    """Put athletes in name order, rather than the order they finished.
+
+    That way re-scraping unchanged results leaves an identical file.
+    """
+    sort_json_feed(self._get_uri('athletes.json'), key='name')
+
+  def _get_cache_dir(self, name):
+    return os.path.join(io.get_cache_race_data_dir(self.race_year), name)
+
+  def get_settings_incremental(self, refresh_patterns=None,
+                               expiration_secs=0, url_rewrites=None):
+    """Settings for a crawl that can resume, and skips what it has seen.
+
+    * Every response is kept in an on-disk HTTP cache, so athletes
+      fetched by an earlier run are read from disk, not re-fetched.
+      URLs matching `refresh_patterns` (by default, the results
+      listing) are always re-fetched, so new entries are picked up,
+      and so is any athlete whose listing entry changed since their
+      page was cached (eg. a new time, or a corrected one). Server
+      errors are never cached, so they are retried next run.
+    * Scheduler state and request fingerprints persist in a job
+      directory, so an interrupted crawl resumes where it stopped.
+    * Items are appended to `.jl` feeds, which survive a crash, and
+      merged into `athletes.json`/`metadata.json` afterwards.
+
+    Args:
+      refresh_patterns (list): regexes; defaults to `REFRESH_PATTERNS`.
+      expiration_secs (int): also re-fetch any page cached longer ago
+        than this, listing entry changed or not. 0 never expires them.
+      url_rewrites (dict): URL prefix -> replacement, eg. to point the
+        spider at a local stub server of recorded Athlinks responses.
+    """
+    settings = {
+      'JOBDIR': self._get_cache_dir('job'),
+      'HTTPCACHE_ENABLED': True,
+      'HTTPCACHE_DIR': self._get_cache_dir('http'),
+      'HTTPCACHE_EXPIRATION_SECS': expiration_secs,
+      'HTTPCACHE_POLICY': 'processing.scrapers.RefreshPatternCachePolicy',
+      'HTTPCACHE_REFRESH_PATTERNS': list(REFRESH_PATTERNS
+        if refresh_patterns is None else refresh_patterns),
+      'HTTPCACHE_IGNORE_HTTP_CODES': list(range(500, 600)),
+      'FEEDS': {
+        self._get_uri('athletes.jl'): {
+          'format': 'jsonlines',
+          'overwrite': False,
+          'item_classes': ['scrapy_athlinks.items.AthleteItem'],
+        },
+        self._get_uri('metadata.jl'): {
+          'format': 'jsonlines',
+          'overwrite': False,
+          'item_classes': ['scrapy_athlinks.items.RaceItem'],
+        },
+      },
+    }
+    if url_rewrites:
+      settings['URL_PREFIX_REWRITES'] = url_rewrites
+      settings['DOWNLOADER_MIDDLEWARES'] = {
+        'processing.scrapers.UrlPrefixRewriteMiddleware': 50,
+      }
+    return settings
+
+  def finish_incremental(self, crawler):
+    """Merge the appended feeds, and forget the job if it completed."""
+    merge_jl_feed(self._get_uri('athletes.jl'), self._get_uri('athletes.json'),
+      key='name')
+    merge_jl_feed(self._get_uri('metadata.jl'), self._get_uri('metadata.json'))
+    if crawler.stats.get_value('finish_reason') == 'finished':
+      # Otherwise the next run would filter every request as a duplicate.
+      shutil.rmtree(self._get_cache_dir('job'), ignore_errors=True)
+
+  def run_spider_incremental(self, settings={}, **kwargs):
+    """Resumable crawl that only fetches what isn't already cached.
+
+    See `get_settings_incremental` for kwargs.
+    """
+    process = CrawlerProcess(settings=settings)
+    crawler = self.crawl(process, settings={
+      **settings, **self.get_settings_incremental(**kwargs)},
+      spider=ResumableRaceSpider)
+    process.start()
+    self.finish_incremental(crawler)
 
   def run_spider_athlete_results_jl(self):
     """Scrape a race's results and output athlete items as a jl file"""
@@ -93,4 +217,266 @@ class LeadvilleScraper:
           'overwrite': True,
         },
       }
-    })
\ No newline at end of file
+    })
+
+
+def run_spiders_pandas(race_years=None, concurrent_requests=16,
+                       concurrent_requests_per_domain=8, incremental=False,
+                       refresh_patterns=None, settings={}):
+  """Crawl many years at once, in one `CrawlerProcess` and one reactor.
+
+  Each year still writes its feeds to its own `raw/` directory, as with
+  `LeadvilleScraper.run_spider_pandas`.
+
+  Args:
+    race_years (list): defaults to every year in `race_urls.json`.
+    concurrent_requests (int): concurrent requests, across every
+      year's crawl.
+    concurrent_requests_per_domain (int): concurrent requests to any
+      one domain, across every year's crawl. Every year lives on
+      athlinks.com, so this is usually the one that matters.
+    incremental (bool): use `LeadvilleScraper.get_settings_incremental`
+      so each year's crawl is cached and resumable.
+    refresh_patterns (list): URL regexes to always re-fetch in an
+      incremental crawl; defaults to `REFRESH_PATTERNS`.
+    settings (dict): any other Scrapy settings, applied to every crawl.
+  """
+  if race_years is None:
+    race_years = io.get_race_years()
+  scrapers = [LeadvilleScraper(race_year) for race_year in race_years]
+
+  # Download slots belong to each crawler, not the process, so the caps
+  # are enforced by a middleware every crawl shares.
+  settings_shared = {
+    'SHARED_CONCURRENCY_GROUP': uuid.uuid4().hex,
+    'SHARED_CONCURRENT_REQUESTS': concurrent_requests,
+    'SHARED_CONCURRENT_REQUESTS_PER_DOMAIN': concurrent_requests_per_domain,
+  }
+
+  process = CrawlerProcess(settings=settings)
+  crawlers = []
+  for scraper in scrapers:
+    settings_scraper = (
+      scraper.get_settings_incremental(refresh_patterns=refresh_patterns)
+      if incremental else scraper.get_settings_pandas())
+    crawlers.append(scraper.crawl(process, settings={
+      **settings,
+      'CONCURRENT_REQUESTS': concurrent_requests,
+      'CONCURRENT_REQUESTS_PER_DOMAIN': concurrent_requests_per_domain,
+      **settings_scraper,
+      **settings_shared,
+      'DOWNLOADER_MIDDLEWARES': {
+        **settings.get('DOWNLOADER_MIDDLEWARES', {}),
+        **settings_scraper.get('DOWNLOADER_MIDDLEWARES', {}),
+        # After the HTTP cache (900), so cached responses don't count.
+        'processing.scrapers.SharedConcurrencyMiddleware': 950,
+      },
+    }, spider=ResumableRaceSpider if incremental else None))
+  process.start()
+
+  for scraper, crawler in zip(scrapers, crawlers):
+    if incremental:
+      scraper.finish_incremental(crawler)
+    else:
+      scraper.finish_pandas()
+
+
+class ResumableRaceSpider(RaceSpider):
+  """`RaceSpider` that can resume from a job directory.
+
+  A resumed crawl keeps the fingerprints of every request already
+  made, so the metadata request would be dropped as a duplicate and
+  `event_course_id` (which athlete requests need) never set. It is
+  always made here; in an incremental crawl it comes from the HTTP cache.
+
+  Each athlete request also carries a hash of the athlete's entry in
+  the results listing, so `RefreshPatternCachePolicy` can tell when a
+  cached athlete page is out of date.
+  """
+  def start_requests(self):
+    yield Request(
+      url=f'https://results.athlinks.com/metadata/event/{self.event_id}',
+      callback=self.parse_metadata,
+      dont_filter=True,
+    )
+
+  def parse(self, response):
+    listing_hashes = {}
+    if response.text:
+      for page in json.loads(response.text)[:1]:
+        for athlete_data in page['interval']['intervalResults']:
+          listing_hashes[str(athlete_data['bib'])] = hash_listing_entry(
+            athlete_data)
+    for request in super().parse(response):
+      bib = parse_qs(urlparse(request.url).query).get('bib')
+      if bib and bib[0] in listing_hashes:
+        request.meta[LISTING_HASH_META] = listing_hashes[bib[0]]
+      yield request
+
+
+def hash_listing_entry(athlete_data):
+  """Fingerprint of an athlete's entry in the results listing."""
+  return hashlib.sha256(
+    json.dumps(athlete_data, sort_keys=True).encode()).hexdigest()
+
+
+def merge_jl_feed(fname_jl, fname_json, key=None):
+  """Fold items appended to a `.jl` feed into a json list file.
+
+  Items already in `fname_json` are kept unless a new item has the
+  same `key`, in which case the new one replaces it, and the list is
+  saved in `key` order. Without a key, the newest item replaces the
+  whole list. The `.jl` file is removed once merged.
+  """
+  if not os.path.exists(fname_jl):
+    return
+  with open(fname_jl, 'r') as f:
+    new_items = [json.loads(line) for line in f if line.strip()]
+  if not new_items:
+    os.remove(fname_jl)
+    return
+
+  if key is None:
+    items = new_items[-1:]
+  else:
+    items_by_key = {}
+    if os.path.exists(fname_json):
+      with open(fname_json, 'r') as f:
+        for item in io.iter_json_array_items(f):
+          items_by_key[item[key]] = item
+    for item in new_items:
+      items_by_key[item[key]] = item
+    items = [items_by_key[item_key] for item_key in sorted(items_by_key)]
+
+  _dump_json_atomic(items, fname_json)
+  os.remove(fname_jl)
+
+
+def sort_json_feed(fname, key):
+  """Sort the items of a json list file by `key`, in place."""
+  if not os.path.exists(fname):
+    return
+  with open(fname, 'r') as f:
+    items = list(io.iter_json_array_items(f))
+  _dump_json_atomic(sorted(items, key=lambda item: item[key]), fname)
+
+
+def _dump_json_atomic(obj, fname):
+  # Write then rename, so a crash never leaves a half-written file.
+  with open(fname + '.tmp', 'w') as f:
+    json.dump(obj, f)
+  os.replace(fname + '.tmp', fname)
+
+
+class RefreshPatternCachePolicy(DummyPolicy):
+  """Cache everything; only re-fetch URLs matching a refresh pattern,
+  or pages whose listing entry changed.
+
+  Patterns (regexes) come from the `HTTPCACHE_REFRESH_PATTERNS` setting.
+  A request with a listing hash in its meta (see `ResumableRaceSpider`)
+  has it stored with the response, as a header, and the cached response
+  only stays fresh while the hash matches.
+  """
+  def __init__(self, settings):
+    super().__init__(settings)
+    self.refresh_patterns = [
+      re.compile(pattern)
+      for pattern in settings.getlist('HTTPCACHE_REFRESH_PATTERNS')
+    ]
+
+  def _should_refresh(self, request):
+    return any(pattern.search(request.url) for pattern in self.refresh_patterns)
+
+  def _is_listing_current(self, cachedresponse, request):
+    listing_hash = request.meta.get(LISTING_HASH_META)
+    return listing_hash is None or cachedresponse.headers.get(
+      LISTING_HASH_HEADER, b'').decode() == listing_hash
+
+  def should_cache_response(self, response, request):
+    listing_hash = request.meta.get(LISTING_HASH_META)
+    if listing_hash is not None:
+      response.headers[LISTING_HASH_HEADER] = listing_hash
+    return super().should_cache_response(response, request)
+
+  def is_cached_response_fresh(self, cachedresponse, request):
+    return not self._should_refresh(request) and self._is_listing_current(
+      cachedresponse, request)
+
+  def is_cached_response_valid(self, cachedresponse, response, request):
+    return self.is_cached_response_fresh(cachedresponse, request)
+
+
+class UrlPrefixRewriteMiddleware:
+  """Downloader middleware that swaps URL prefixes before fetching.
+
+  Prefixes come from the `URL_PREFIX_REWRITES` setting, eg.
+  `{'https://results.athlinks.com': 'http://127.0.0.1:8000'}`.
+  """
+  def __init__(self, rewrites):
+    self.rewrites = rewrites
+
+  @classmethod
+  def from_crawler(cls, crawler):
+    return cls(crawler.settings.getdict('URL_PREFIX_REWRITES'))
+
+  def process_request(self, request, spider):
+    for prefix, replacement in self.rewrites.items():
+      if request.url.startswith(prefix):
+        return request.replace(url=replacement + request.url[len(prefix):])
+
+
+class SharedConcurrencyMiddleware:
+  """Downloader middleware capping concurrent downloads across crawls.
+
+  Each crawler has its own downloader, so `CONCURRENT_REQUESTS` and
+  `CONCURRENT_REQUESTS_PER_DOMAIN` only bound one crawl. Crawls in the
+  same process whose settings name the same `SHARED_CONCURRENCY_GROUP`
+  share these caps instead: `SHARED_CONCURRENT_REQUESTS` in all, and
+  `SHARED_CONCURRENT_REQUESTS_PER_DOMAIN` to any one domain. Requests
+  over a cap wait here, before reaching their crawl's download slot.
+  """
+  _groups = {}
+
+  def __init__(self, concurrent_requests, concurrent_requests_per_domain):
+    self.semaphore = DeferredSemaphore(concurrent_requests)
+    self.concurrent_requests_per_domain = concurrent_requests_per_domain
+    self.domain_semaphores = {}
+    self._held = {}
+
+  @classmethod
+  def from_crawler(cls, crawler):
+    settings = crawler.settings
+    group = settings.get('SHARED_CONCURRENCY_GROUP')
+    if group not in cls._groups:
+      cls._groups[group] = cls(
+        settings.getint('SHARED_CONCURRENT_REQUESTS',
+          settings.getint('CONCURRENT_REQUESTS')),
+        settings.getint('SHARED_CONCURRENT_REQUESTS_PER_DOMAIN',
+          settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN')))
+    return cls._groups[group]
+
+  def _get_domain_semaphore(self, request):
+    domain = urlparse_cached(request).hostname or ''
+    if domain not in self.domain_semaphores:
+      self.domain_semaphores[domain] = DeferredSemaphore(
+        self.concurrent_requests_per_domain)
+    return self.domain_semaphores[domain]
+
+  def process_request(self, request, spider):
+    # Always domain first, then the total, so waiters can't deadlock.
+    semaphores = [self._get_domain_semaphore(request), self.semaphore]
+    d = semaphores[0].acquire()
+    d.addCallback(lambda _: semaphores[1].acquire())
+    d.addCallback(lambda _: self._held.__setitem__(request, semaphores))
+    return d
+
+  def _release(self, request):
+    for semaphore in self._held.pop(request, []):
+      semaphore.release()
+
+  def process_response(self, request, response, spider):
+    self._release(request)
+    return response
+
+  def process_exception(self, request, exception, spider):
+    self._release(request)
@@ -0,0 +1,152 @@
+"""Statistics that can be fed athletes a chunk (or a year) at a time.
+
+`analysis.stats_df` needs the whole matrix in memory and makes a
+separate pass for each statistic. `StatsAccumulator` instead keeps, for
+every row (split or segment):
+
+* count, mean and variance, updated exactly with the parallel
+  (Chan et al.) form of Welford's algorithm,
+* exact min and max,
+* a fixed-width histogram, which gives the median and any other
+  percentile to within one bin.
+
+Every piece is mergeable: two accumulators fed different athletes merge
+into the same state as one fed both. So per-split statistics can cover
+every year and every event without building one big DataFrame.
+
+Refs:
+  https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Parallel_algorithm
+"""
+import numpy as np
+import pandas as pd
+
+from processing import analysis
+
+
+# Quantiles are accurate to within one bin; 10 seconds is plenty for
+# split and segment times. Values past the last bin count toward it.
+BIN_WIDTH_SECS = 10.0
+MAX_VALUE_SECS = 48 * 3600.0
+
+
+class StatsAccumulator:
+  """Mergeable per-row statistics over any number of athletes.
+
+  Args:
+    index (pd.Index): row labels (split labels, segment labels...).
+      Data fed in is matched to these by label; other rows are ignored.
+    bin_width (float): histogram resolution, in the data's units.
+    max_value (float): top of the histogram range.
+  """
+  def __init__(self, index, bin_width=BIN_WIDTH_SECS, max_value=MAX_VALUE_SECS):
+    self.index = pd.Index(index)
+    self.bin_width = float(bin_width)
+    self.n_bins = int(np.ceil(max_value / self.bin_width)) + 1
+    n_rows = len(self.index)
+    self.count = np.zeros(n_rows, dtype='int64')
+    self.mean = np.zeros(n_rows)
+    self.m2 = np.zeros(n_rows)
+    self.min = np.full(n_rows, np.inf)
+    self.max = np.full(n_rows, -np.inf)
+    self.hist = np.zeros((n_rows, self.n_bins), dtype='int64')
+
+  def _combine_moments(self, count_b, mean_b, m2_b):
+    count = self.count + count_b
+    delta = mean_b - self.mean
+    count_safe = np.maximum(count, 1)
+    self.mean = self.mean + delta * count_b / count_safe
+    self.m2 = self.m2 + m2_b + delta ** 2 * self.count * count_b / count_safe
+    self.count = count
+
+  def update(self, arr_values):
+    """Add a chunk of athletes.
+
+    Args:
+      arr_values (np.ndarray): float, rows x athletes, aligned with
+        `self.index`. NaN where missing.
+    """
+    arr_valid = ~np.isnan(arr_values)
+    count_b = arr_valid.sum(axis=1)
+    arr_filled = np.where(arr_valid, arr_values, 0.0)
+    mean_b = arr_filled.sum(axis=1) / np.maximum(count_b, 1)
+    m2_b = (np.where(arr_valid, arr_values - mean_b[:, np.newaxis], 0.0) ** 2
+      ).sum(axis=1)
+    self._combine_moments(count_b, mean_b, m2_b)
+
+    self.min = np.fmin(self.min,
+      np.where(arr_valid, arr_values, np.inf).min(axis=1, initial=np.inf))
+    self.max = np.fmax(self.max,
+      np.where(arr_valid, arr_values, -np.inf).max(axis=1, initial=-np.inf))
+
+    ix_row, ix_col = np.nonzero(arr_valid)
+    ix_bin = np.clip(np.floor(arr_values[ix_row, ix_col] / self.bin_width),
+      0, self.n_bins - 1).astype('int64')
+    self.hist += np.bincount(ix_row * self.n_bins + ix_bin,
+      minlength=self.hist.size).reshape(self.hist.shape)
+    return self
+
+  def update_df(self, df_split_data):
+    """Add athletes from a DataFrame (or RaceResults), matched by row label.
+
+    Timedeltas are counted in seconds.
+    """
+    arr_src = analysis.array_split_secs(df_split_data)
+    ix_dst = self.index.get_indexer(df_split_data.index)
+    arr_values = np.full((len(self.index), arr_src.shape[1]), np.nan)
+    arr_values[ix_dst[ix_dst >= 0]] = arr_src[ix_dst >= 0]
+    return self.update(arr_values)
+
+  def merge(self, other):
+    """Fold in another accumulator's athletes (same rows and bins)."""
+    if not (self.index.equals(other.index)
+            and self.bin_width == other.bin_width
+            and self.n_bins == other.n_bins):
+      raise ValueError('Can only merge accumulators with the same rows and bins.')
+    self._combine_moments(other.count, other.mean, other.m2)
+    self.min = np.fmin(self.min, other.min)
+    self.max = np.fmax(self.max, other.max)
+    self.hist += other.hist
+    return self
+
+  def quantile(self, q):
+    """Approximate q-th quantile (0 <= q <= 1) of each row.
+
+    Interpolated within the histogram bin, then clipped to the exact
+    min and max, so q=0 and q=1 are exact.
+    """
+    arr_cum = self.hist.cumsum(axis=1)
+    arr_target = np.maximum(q * self.count, 0.5)
+    ix_bin = np.minimum((arr_cum < arr_target[:, np.newaxis]).sum(axis=1),
+      self.n_bins - 1)
+    ix_row = np.arange(len(self.index))
+    arr_in_bin = np.maximum(self.hist[ix_row, ix_bin], 1)
+    arr_before = arr_cum[ix_row, ix_bin] - self.hist[ix_row, ix_bin]
+    arr_q = self.bin_width * (ix_bin + (arr_target - arr_before) / arr_in_bin)
+    arr_q = np.clip(arr_q, self.min, self.max)
+    return pd.Series(np.where(self.count > 0, arr_q, np.nan), index=self.index)
+
+  def df_quantiles(self, qs=(0.1, 0.25, 0.5, 0.75, 0.9)):
+    return pd.DataFrame({q: self.quantile(q) for q in qs})
+
+  def stats_df(self):
+    """Same columns as `analysis.stats_df`, in the data's units.
+
+    `std` uses ddof=1, like pandas. Median is approximate.
+    """
+    has_data = self.count > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+      arr_std = np.sqrt(self.m2 / (self.count - 1))
+    return pd.DataFrame(
+      {
+        'median': self.quantile(0.5),
+        'mean': np.where(has_data, self.mean, np.nan),
+        'std': np.where(self.count > 1, arr_std, np.nan),
+        'min': np.where(has_data, self.min, np.nan),
+        'max': np.where(has_data, self.max, np.nan),
+      },
+      index=self.index,
+    )
+
+  def stats_df_td(self):
+    """`stats_df` of seconds, in hours (like `analysis.stats_df_td`)."""
+    return self.stats_df() / 3600
@@ -0,0 +1,252 @@
+"""Kaplan-Meier survival curves for DNFs, over distance or elapsed time.
+
+`analysis.series_net_dnf_rate_after_split` gives the hazard at each aid
+station. Here the same athlete matrix gives full survival curves:
+
+* over distance: each athlete's duration is the `distance_mi` of their
+  last valid split. Non-finishers are events; finishers are censored at
+  the finish.
+* over time: the duration is the elapsed time (hours) at the last valid
+  split, so a drop is dated when the athlete was last seen.
+
+Curves come with pointwise confidence bands (Greenwood's variance, on
+the log(-log) scale so bands stay within [0, 1]), and can be split into
+strata such as years or cohorts. Every stratum comes out of the same
+sort and cumulative pass over flat arrays.
+
+Refs:
+  https://en.wikipedia.org/wiki/Kaplan%E2%80%93Meier_estimator
+"""
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from processing import analysis, io
+from processing.results import RaceResults
+
+
+OVER_UNITS = {'distance': 'distance_mi', 'time': 'elapsed_hr'}
+
+
+def _to_race_results(df_split_times, df_split_info=None):
+  if isinstance(df_split_times, RaceResults):
+    return df_split_times
+  return RaceResults.from_df_split_times(df_split_times,
+    df_split_info=df_split_info)
+
+
+def arrays_dnf_durations(df_split_times, df_split_info=None, over='distance'):
+  """How far (or long) each athlete got, and whether they dropped.
+
+  Args:
+    over (str): 'distance' (miles, needs `distance_mi` split info) or
+      'time' (hours).
+  Returns:
+    tuple(np.ndarray, np.ndarray): float durations, NaN for athletes
+      with no valid splits (or an unknown distance), and bool events,
+      True for athletes who didn't reach the last split.
+  """
+  if over not in OVER_UNITS:
+    raise ValueError(f'`over` must be one of {list(OVER_UNITS)}.')
+  results = _to_race_results(df_split_times, df_split_info=df_split_info)
+  arr_pos = analysis.array_last_valid_split_position(results)
+  has_data = arr_pos >= 0
+  arr_pos_safe = np.maximum(arr_pos, 0)
+
+  if over == 'distance':
+    arr_t = results.distance_mi[arr_pos_safe]
+  else:
+    arr_t = results.secs[arr_pos_safe, np.arange(len(arr_pos))] / 3600
+  arr_t = np.where(has_data, arr_t, np.nan)
+  return arr_t, arr_pos < results.shape[0] - 1
+
+
+def array_kaplan_meier(arr_t, arr_event, arr_strata=None, alpha=0.05):
+  """Kaplan-Meier estimate at every distinct duration in every stratum.
+
+  One lexsort puts athletes in (stratum, duration) order; deaths and
+  numbers at risk then come from `reduceat` and cumulative sums, and
+  the product-limit survival from a cumulative sum of log terms, reset
+  at each stratum's start.
+
+  Args:
+    arr_t (np.ndarray): float duration for each athlete.
+    arr_event (np.ndarray): bool, True for an event (DNF), False if
+      censored at `arr_t`.
+    arr_strata (np.ndarray): int stratum code for each athlete, or None
+      for one stratum (0).
+    alpha (float): confidence bands are 100 * (1 - alpha)%.
+  Returns:
+    dict: equal-length arrays, one entry per (stratum, duration), sorted:
+      'stratum', 't', 'at_risk', 'events', 'censored', 'survival',
+      'ci_lower', 'ci_upper'. Survival is just after events at 't'.
+  """
+  n = len(arr_t)
+  if arr_strata is None:
+    arr_strata = np.zeros(n, dtype='int64')
+  if n == 0:
+    return {key: np.array([]) for key in ('stratum', 't', 'at_risk',
+      'events', 'censored', 'survival', 'ci_lower', 'ci_upper')}
+
+  order = np.lexsort((arr_t, arr_strata))
+  arr_t = arr_t[order]
+  arr_s = arr_strata[order]
+  arr_d = arr_event[order].astype('int64')
+
+  # Groups of tied (stratum, duration).
+  is_new = np.ones(n, dtype=bool)
+  is_new[1:] = (arr_t[1:] != arr_t[:-1]) | (arr_s[1:] != arr_s[:-1])
+  ix_group_st = np.flatnonzero(is_new)
+  n_group = np.diff(np.append(ix_group_st, n))
+  n_events = np.add.reduceat(arr_d, ix_group_st)
+  group_s = arr_s[ix_group_st]
+
+  # Each group's stratum, and where that stratum's groups begin.
+  is_new_stratum = np.ones(len(ix_group_st), dtype=bool)
+  is_new_stratum[1:] = group_s[1:] != group_s[:-1]
+  ix_stratum_st = np.flatnonzero(is_new_stratum)
+  ix_stratum = np.cumsum(is_new_stratum) - 1
+
+  def cumsum_by_stratum(arr):
+    arr_cum = np.cumsum(arr)
+    return arr_cum - (arr_cum - arr)[ix_stratum_st][ix_stratum]
+
+  n_at_risk = n_group[::-1].cumsum()[::-1]  # athletes in this group or later
+  n_at_risk = n_at_risk - np.append(n_at_risk[ix_stratum_st[1:]], 0)[ix_stratum]
+
+  arr_hazard = n_events / n_at_risk
+  # Once everyone left at risk drops, survival is 0 for the rest of
+  # the stratum; log(0) is kept out of the sums.
+  is_zero = cumsum_by_stratum(arr_hazard >= 1) > 0
+  with np.errstate(divide='ignore', invalid='ignore'):
+    arr_log_s = cumsum_by_stratum(
+      np.where(arr_hazard < 1, np.log1p(-arr_hazard), 0.0))
+    arr_greenwood = cumsum_by_stratum(np.where(n_at_risk > n_events,
+      n_events / (n_at_risk * (n_at_risk - n_events)), 0.0))
+    arr_survival = np.where(is_zero, 0.0, np.exp(arr_log_s))
+
+    # log(-log) bands: S ** exp(+-z * sigma).
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+    arr_sigma = np.sqrt(arr_greenwood) / np.abs(arr_log_s)
+    arr_lower = np.exp(arr_log_s * np.exp(z * arr_sigma))
+    arr_upper = np.exp(arr_log_s * np.exp(-z * arr_sigma))
+  # No events yet: S is exactly 1.
+  no_events = arr_log_s == 0
+  arr_lower = np.where(is_zero, 0.0, np.where(no_events, 1.0, arr_lower))
+  arr_upper = np.where(is_zero, 0.0, np.where(no_events, 1.0, arr_upper))
+
+  return {
+    'stratum': group_s,
+    't': arr_t[ix_group_st],
+    'at_risk': n_at_risk,
+    'events': n_events,
+    'censored': n_group - n_events,
+    'survival': arr_survival,
+    'ci_lower': arr_lower,
+    'ci_upper': arr_upper,
+  }
+
+
+def df_kaplan_meier_from_arrays(arr_t, arr_event, strata=None, over='distance',
+                                alpha=0.05):
+  """`array_kaplan_meier` as a long-form DataFrame.
+
+  Athletes with a NaN duration or missing stratum are left out.
+
+  Args:
+    strata (array-like): stratum of each athlete, any sortable values
+      (years, cohort labels...), or None.
+  Returns:
+    pd.DataFrame: one row per (stratum, duration), with a 'stratum'
+      column (if `strata` given), the duration (named as in
+      `OVER_UNITS`), and the other `array_kaplan_meier` columns.
+  """
+  keep = ~np.isnan(arr_t)
+  arr_codes = None
+  if strata is not None:
+    arr_codes, uniques = pd.factorize(np.asarray(strata), sort=True)
+    keep &= arr_codes >= 0
+    arr_codes = arr_codes[keep]
+
+  dict_km = array_kaplan_meier(arr_t[keep], np.asarray(arr_event)[keep],
+    arr_strata=arr_codes, alpha=alpha)
+  stratum_codes = dict_km.pop('stratum').astype('int64')
+  df = pd.DataFrame(dict_km).rename(columns={'t': OVER_UNITS[over]})
+  if strata is not None:
+    df.insert(0, 'stratum', uniques[stratum_codes])
+  return df
+
+
+def df_kaplan_meier(df_split_times, df_split_info=None, over='distance',
+                    strata=None, alpha=0.05):
+  """DNF survival curves for one race.
+
+  Args:
+    df_split_times (pd.DataFrame or RaceResults): split times. Curves
+      over distance need `df_split_info` (or RaceResults split info).
+    strata (array-like): stratum of each athlete (column), eg. from
+      `array_split_time_cohorts`. NaN strata are left out.
+  """
+  arr_t, arr_event = arrays_dnf_durations(df_split_times,
+    df_split_info=df_split_info, over=over)
+  return df_kaplan_meier_from_arrays(arr_t, arr_event, strata=strata,
+    over=over, alpha=alpha)
+
+
+def array_split_time_cohorts(df_split_times, label=None, n_cohorts=4):
+  """Cohort of each athlete by elapsed time at one split.
+
+  Non-finishers have no finish time, so cohorts are quantiles of the
+  time at an early split, which predicts it: cohort 0 is the fastest.
+
+  Args:
+    label (str): split to bin on; defaults to the first split.
+    n_cohorts (int): number of equal-sized cohorts.
+  Returns:
+    np.ndarray: float cohort for each athlete, NaN if they have no time
+      at `label`.
+  """
+  arr_secs = analysis.array_split_secs(df_split_times)
+  pos = 0 if label is None else df_split_times.index.get_loc(label)
+  arr_t = arr_secs[pos]
+  has_time = ~np.isnan(arr_t)
+  if not has_time.any():
+    return np.full(len(arr_t), np.nan)
+  arr_edges = np.quantile(arr_t[has_time], np.linspace(0, 1, n_cohorts + 1))
+  arr_cohort = np.searchsorted(arr_edges[1:-1], arr_t, side='right')
+  return np.where(has_time, arr_cohort, np.nan)
+
+
+def df_kaplan_meier_years(race_years=None, over='distance', results_store=None,
+                          alpha=0.05):
+  """DNF survival curves for many years, stratified by year.
+
+  Every year's athletes go through one `array_kaplan_meier` call.
+
+  Args:
+    race_years (list): defaults to every year in `results_store`, or
+      else every year in `race_urls.json`.
+    results_store (io.ResultsStore): read split data from the store
+      rather than each year's clean directory.
+  """
+  if race_years is None:
+    race_years = (io.get_race_years() if results_store is None
+      else results_store.race_years)
+
+  list_t, list_event, list_year = [], [], []
+  for race_year in race_years:
+    if results_store is None:
+      results = RaceResults.from_clean(race_year)
+    else:
+      results = RaceResults.from_results_store(results_store, race_year,
+        df_split_info=io.load_df_split_info_clean(race_year))
+    arr_t, arr_event = arrays_dnf_durations(results, over=over)
+    list_t.append(arr_t)
+    list_event.append(arr_event)
+    list_year.append(np.full(len(arr_t), race_year))
+
+  df = df_kaplan_meier_from_arrays(np.concatenate(list_t),
+    np.concatenate(list_event), strata=np.concatenate(list_year), over=over,
+    alpha=alpha)
+  return df.rename(columns={'stratum': 'race_year'})
@@ -0,0 +1,107 @@
+"""Generate synthetic race results shaped like the scraped Leadville data.
+
+Useful for benchmarking and for trying things out at field sizes far
+beyond a real race. Everything is seeded, so a given set of arguments
+always generates the same race.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from processing import io
+
+
+def create_split_labels(n_splits):
+  return [f'{i:02d}_Split' for i in range(n_splits - 1)] + ['Full Course']
+
+
+def create_df_split_info(n_splits=12, distance_mi=100.0):
+  """Evenly spaced splits, with cutoffs at a 30-hour finish pace."""
+  arr_distance_mi = distance_mi * np.arange(1, n_splits + 1) / n_splits
+  df_split_info = pd.DataFrame(
+    {
+      'distance_m': (arr_distance_mi * 1609.34).round(),
+      'distance_mi': arr_distance_mi.round(decimals=1),
+      'cutoff_hr': (30.0 * arr_distance_mi / distance_mi).round(decimals=2),
+    },
+    index=pd.Index(create_split_labels(n_splits), name=io.INDEX_NAME),
+  )
+  return df_split_info
+
+
+def create_arrays_split_secs(n_athletes, n_splits=12, dnf_rate=0.4,
+                             missing_rate=0.02, seed=0):
+  """Cumulative split seconds and missing mask, splits x athletes.
+
+  Args:
+    dnf_rate (float): fraction of athletes stopping before the finish,
+      at a uniformly random split.
+    missing_rate (float): chance of any split before an athlete's last
+      one failing to record.
+  """
+  rng = np.random.default_rng(seed)
+  # Finish times between ~17 and ~30 hours, with a little noise per segment.
+  arr_pace = rng.uniform(17, 30, size=n_athletes) * 3600 / n_splits
+  arr_segment_secs = arr_pace * rng.lognormal(0, 0.15, size=(n_splits, n_athletes))
+  arr_secs = arr_segment_secs.cumsum(axis=0).round().astype('int64')
+
+  arr_last = np.full(n_athletes, n_splits - 1)
+  arr_dnf = rng.random(n_athletes) < dnf_rate
+  arr_last[arr_dnf] = rng.integers(0, max(n_splits - 1, 1), size=arr_dnf.sum())
+
+  arr_pos = np.arange(n_splits)[:, np.newaxis]
+  arr_mask = (arr_pos > arr_last) | (
+    (rng.random((n_splits, n_athletes)) < missing_rate) & (arr_pos < arr_last))
+  return arr_secs, arr_mask
+
+
+def create_df_split_times(n_athletes, n_splits=12, dnf_rate=0.4,
+                          missing_rate=0.02, seed=0):
+  """Timedelta split data, in the shape `io.load_df_split_times_raw` returns.
+
+  Athletes are unsorted, like the spider's output.
+  """
+  arr_secs, arr_mask = create_arrays_split_secs(n_athletes, n_splits=n_splits,
+    dnf_rate=dnf_rate, missing_rate=missing_rate, seed=seed)
+  return pd.DataFrame(
+    io.array_to_array_td(arr_secs, arr_mask),
+    index=pd.Index(create_split_labels(n_splits), name=io.INDEX_NAME),
+    columns=pd.Index([f'Athlete {i}' for i in range(n_athletes)]),
+  )
+
+
+def save_race_raw(race_year, n_athletes, n_splits=12, dnf_rate=0.4,
+                  missing_rate=0.02, seed=0):
+  """Write a synthetic race in the spider's raw `athletes.json` and
+  `metadata.json` layout, under `io.DATA_DIR`.
+  """
+  df_split_info = create_df_split_info(n_splits)
+  arr_secs, arr_mask = create_arrays_split_secs(n_athletes, n_splits=n_splits,
+    dnf_rate=dnf_rate, missing_rate=missing_rate, seed=seed)
+  # Athlinks uses -1 for missing data.
+  arr_ms = np.where(arr_mask, -1, arr_secs * 1000).T.tolist()
+  split_labels = df_split_info.index.to_list()
+
+  raw_data_dir = io.get_raw_race_data_dir(race_year)
+  if not os.path.exists(raw_data_dir):
+    os.makedirs(raw_data_dir)
+  with open(os.path.join(raw_data_dir, 'metadata.json'), 'w') as f:
+    json.dump([{
+      'split_info': [
+        {'name': label, 'distance_m': distance_m}
+        for label, distance_m in df_split_info['distance_m'].items()
+      ]
+    }], f)
+  with open(os.path.join(raw_data_dir, io.ATHLETE_DATA_FNAME), 'w') as f:
+    json.dump([
+      {
+        'name': f'Athlete {i}',
+        'split_data': [
+          {'name': label, 'time_ms': time_ms}
+          for label, time_ms in zip(split_labels, athlete_ms)
+        ],
+      }
+      for i, athlete_ms in enumerate(arr_ms)
+    ], f)
@@ -1,6 +1,14 @@
+import collections
+import hashlib
+
 import numpy as np
 import pandas as pd
-from IPython.display import display
+
+
+NS_PER_SEC = 10 ** 9
+TD_FMT_CACHE_SIZE = 32
+
+_td_fmt_cache = collections.OrderedDict()
 
 
 def float64_to_int64(series_float_na):
@@ -36,19 +44,98 @@ def scalar_td_fmt(td):
   return td_fmt(td.total_seconds())
 
 
+def array_td_fmt(arr_td):
+  """Format a timedelta64 array of any shape as HH:MM:SS, in bulk.
+
+  Hours, minutes and seconds come from integer array arithmetic, and
+  the strings are assembled as fixed-width bytes, rather than calling
+  `td_fmt` per element. Values outside 00:00:00-99:59:59 are rare and
+  fall back to `td_fmt`.
+
+  Returns:
+    np.ndarray: object array of str, None wherever the input is NaT.
+  """
+  arr_td = np.asarray(arr_td, dtype='timedelta64[ns]')
+  arr_null = np.isnat(arr_td)
+  arr_ns = np.where(arr_null, 0, arr_td.view('int64'))
+  hours, rem = np.divmod(arr_ns, 3600 * NS_PER_SEC)
+  minutes, rem = np.divmod(rem, 60 * NS_PER_SEC)
+  # Round the leftover seconds, the same as `td_fmt`'s format spec.
+  seconds = np.round(rem / NS_PER_SEC).astype('int64')
+
+  arr_chars = np.empty(arr_ns.shape + (8,), dtype='uint8')
+  for i, field in zip((0, 3, 6), (hours, minutes, seconds)):
+    arr_chars[..., i] = ord('0') + field // 10 % 10
+    arr_chars[..., i + 1] = ord('0') + field % 10
+  arr_chars[..., [2, 5]] = ord(':')
+  arr_out = arr_chars.view('S8')[..., 0].astype('U8').astype(object)
+
+  arr_out[arr_null] = None
+  arr_fallback = ~arr_null & ((hours < 0) | (hours > 99))
+  if arr_fallback.any():
+    arr_out[arr_fallback] = [
+      td_fmt(ns / NS_PER_SEC) for ns in arr_ns[arr_fallback]]
+  return arr_out
+
+
 def series_td_fmt(series_td):
-  return series_td.dt.total_seconds(
-    ).apply(td_fmt
-    ).astype('string')
+  return pd.Series(
+    array_td_fmt(series_td.to_numpy(dtype='timedelta64[ns]')),
+    index=series_td.index,
+    name=series_td.name,
+  ).astype('string')
+
 
+def hash_array_labels(arr, *indexes):
+  """Content hash of an array's bytes and some labels, for cache keys."""
+  h = hashlib.blake2b(digest_size=16)
+  arr = np.ascontiguousarray(arr)
+  h.update(repr((arr.dtype.str, arr.shape)).encode())
+  h.update(arr.view('uint8'))
+  h.update(repr([index.to_list() for index in indexes]).encode())
+  return h.hexdigest()
 
-def df_td_fmt(df_td):
-  return df_td.apply(series_td_fmt)
 
+def clear_td_fmt_cache():
+  _td_fmt_cache.clear()
 
-def print_td(obj):
+
+def df_td_fmt(df_td, cache=False):
+  """Format a whole timedelta DataFrame as HH:MM:SS strings at once.
+
+  Args:
+    cache (bool): If True, remember the output for frames with the same
+      values and labels, so re-displaying a frame is just a lookup.
+      The most recent `TD_FMT_CACHE_SIZE` frames are kept.
+  """
+  arr_td = df_td.to_numpy(dtype='timedelta64[ns]')
+  if cache:
+    key = hash_array_labels(arr_td.view('int64'), df_td.index, df_td.columns)
+    if key in _td_fmt_cache:
+      _td_fmt_cache.move_to_end(key)
+      return _td_fmt_cache[key].copy()
+
+  # Each column's strings go straight into a `StringArray`: converting
+  # an object frame with `.astype('string')` re-checks every value.
+  arr_out = array_td_fmt(arr_td.T)
+  arr_out[np.isnat(arr_td.T)] = pd.NA
+  df_out = pd.DataFrame(
+    {i: pd.arrays.StringArray(arr_col) for i, arr_col in enumerate(arr_out)},
+    index=df_td.index,
+    copy=False,
+  )
+  df_out.columns = df_td.columns
+
+  if cache:
+    _td_fmt_cache[key] = df_out.copy()
+    if len(_td_fmt_cache) > TD_FMT_CACHE_SIZE:
+      _td_fmt_cache.popitem(last=False)
+  return df_out
+
+
+def print_td(obj, cache=False):
   if isinstance(obj, pd.DataFrame):
-    print(df_td_fmt(obj))
+    print(df_td_fmt(obj, cache=cache))
   elif isinstance(obj, pd.Series):
     print(series_td_fmt(obj))
   elif isinstance(obj, pd.Timedelta):
@@ -77,6 +164,9 @@ def full_df_to_file(df, fname):
 
 
 def display_full_df(df):
+  # Only notebooks need IPython, so don't make every import pay for it.
+  from IPython.display import display
+
   pd.set_option('display.max_columns', 1000)
   pd.set_option('display.width', 1000000000000)
   display(df)
@@ -88,7 +178,32 @@ def get_column_context(df, col_label):
   return df.iloc[:, ix-5:ix+5]
 
 
+def array_prev_valid_position(arr_valid):
+  """Row of the last valid value strictly before each row, per column.
+
+  A forward-fill of valid row positions down the whole matrix at once.
+  -1 where there is no earlier valid value.
+  """
+  n_rows, n_cols = arr_valid.shape
+  arr_pos = np.where(arr_valid, np.arange(n_rows)[:, np.newaxis], -1)
+  return np.vstack([
+    np.full((1, n_cols), -1),
+    np.maximum.accumulate(arr_pos, axis=0)[:-1],
+  ])
+
+
 def get_df_negative_timedelta(df_split_times):
-  series_athlete_has_negative_timedelta = df_split_times.apply(
-    lambda col: (col[col.notnull()].dt.total_seconds().diff() < 0).any())
-  return df_split_times.loc[:, series_athlete_has_negative_timedelta]
\ No newline at end of file
+  """Athletes with a split time earlier than the one before it.
+
+  Compares each valid split with the previous valid split, for every
+  athlete in one pass (rather than a `.diff()` per column).
+  """
+  arr_td = df_split_times.to_numpy(dtype='timedelta64[ns]')
+  arr_valid = ~np.isnat(arr_td)
+  arr_ns = arr_td.view('int64')
+  arr_pos_prev = array_prev_valid_position(arr_valid)
+  arr_ns_prev = arr_ns[np.maximum(arr_pos_prev, 0),
+    np.arange(arr_ns.shape[1])]
+  arr_athlete_has_negative_timedelta = (
+    arr_valid & (arr_pos_prev >= 0) & (arr_ns < arr_ns_prev)).any(axis=0)
+  return df_split_times.loc[:, arr_athlete_has_negative_timedelta]
\ No newline at end of file
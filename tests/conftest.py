@@ -0,0 +1,176 @@
+"""Shared fixtures: a local stand-in for the Athlinks results API."""
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+
+class AthlinksStub:
+  """Athlinks-shaped responses for one event, served from memory.
+
+  Attributes:
+    n_athletes (int): athletes in the results listing; raise it between
+      crawls to simulate new results coming in.
+    fail_bibs (dict): bib -> number of 503s to send before succeeding.
+    time_offsets_ms (dict): bib -> ms added to each of the athlete's
+      splits (and their listed time); change it between crawls to
+      simulate corrected results.
+    delay_secs (float): how long each response takes.
+    chunked (bool): send athlete bodies with chunked transfer encoding.
+    requests (collections.Counter): (path, bib) -> requests received.
+    peak_active (int): most requests ever being handled at once.
+    n_connections (int): connections opened so far.
+    peak_connections (int): most connections ever open at once.
+  """
+  EVENT_COURSE_ID = 7
+  SPLITS = [('Start', 0), ('Halfway', 80000), ('Full Course', 160000)]
+
+  def __init__(self, n_athletes=250):
+    self.n_athletes = n_athletes
+    self.fail_bibs = {}
+    self.time_offsets_ms = {}
+    self.delay_secs = 0
+    self.chunked = False
+    self.requests = collections.Counter()
+    self.active = 0
+    self.peak_active = 0
+    self.connections = 0
+    self.n_connections = 0
+    self.peak_connections = 0
+    self.lock = threading.Lock()
+    self.url = None
+
+  def get_time_ms(self, bib, i):
+    i %= len(self.SPLITS)
+    return 1000 * (bib + 1) * i + self.time_offsets_ms.get(bib, 0) * (i > 0)
+
+  def get_body(self, path, query):
+    if path.startswith('/metadata/event/'):
+      return {
+        'eventName': 'Stub 100',
+        'eventId': int(path.rsplit('/', 1)[-1]),
+        'eventStartDateTime': {'timeInMillis': 0},
+        'eventCourseMetadata': [{
+          'eventCourseId': self.EVENT_COURSE_ID,
+          'distance': self.SPLITS[-1][1],
+          'metadata': {'intervals': [
+            {'name': name, 'distance': distance}
+            for name, distance in self.SPLITS
+          ]},
+        }],
+      }
+    if path.startswith('/event/'):
+      first = int(query.get('from', ['0'])[0])
+      bibs = range(first, min(first + int(query['limit'][0]), self.n_athletes))
+      if not len(bibs):
+        return []
+      return [{'interval': {'intervalResults': [
+        {'bib': bib, 'time': {'timeInMillis': self.get_time_ms(bib, -1)}}
+        for bib in bibs
+      ]}}]
+    if path == '/individual':
+      if query['eventCourseId'] != [str(self.EVENT_COURSE_ID)]:
+        return None
+      bib = int(query['bib'][0])
+      return {
+        'displayName': f'Athlete {bib}',
+        'intervals': [
+          {
+            'intervalName': name,
+            'intervalOrder': i,
+            'pace': {
+              'time': {'timeInMillis': self.get_time_ms(bib, i)},
+              'distance': {'distanceInMeters': distance},
+            },
+            'timeWithPenalties': {'timeInMillis': self.get_time_ms(bib, i)},
+          }
+          for i, (name, distance) in enumerate(self.SPLITS)
+        ],
+      }
+    return None
+
+  def handle(self, handler):
+    url = urlparse(handler.path)
+    query = parse_qs(url.query)
+    bib = int(query['bib'][0]) if 'bib' in query else None
+    with self.lock:
+      self.requests[(url.path, bib)] += 1
+      if self.fail_bibs.get(bib, 0) > 0:
+        self.fail_bibs[bib] -= 1
+        return 503, b''
+    body = self.get_body(url.path, query)
+    if body is None:
+      return 404, b''
+    return 200, json.dumps(body).encode()
+
+  def create_handler_class(self):
+    stub = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+      # Headers and body go out in separate writes.
+      disable_nagle_algorithm = True
+
+      def log_message(self, *args):
+        pass
+
+      def setup(self):
+        super().setup()
+        with stub.lock:
+          stub.connections += 1
+          stub.n_connections += 1
+          stub.peak_connections = max(stub.peak_connections, stub.connections)
+
+      def finish(self):
+        super().finish()
+        with stub.lock:
+          stub.connections -= 1
+
+      def do_GET(self):
+        with stub.lock:
+          stub.active += 1
+          stub.peak_active = max(stub.peak_active, stub.active)
+        try:
+          time.sleep(stub.delay_secs)
+          status, data = stub.handle(self)
+          self.send_response(status)
+          self.send_header('Content-Type', 'application/json')
+          if stub.chunked and self.path.startswith('/individual') and data:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            half = len(data) // 2
+            for chunk in (data[:half], data[half:], b''):
+              self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+          else:
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+          with stub.lock:
+            stub.active -= 1
+
+    return Handler
+
+
+class QuietServer(ThreadingHTTPServer):
+  daemon_threads = True
+
+  def handle_error(self, request, client_address):
+    # Clients dropping keep-alive connections isn't worth a traceback.
+    pass
+
+
+@pytest.fixture
+def athlinks_stub():
+  stub = AthlinksStub()
+  server = QuietServer(('127.0.0.1', 0), stub.create_handler_class())
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  stub.url = f'http://127.0.0.1:{server.server_port}'
+  yield stub
+  server.shutdown()
+  server.server_close()
@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from processing import analysis, synthetic
+
+
+@pytest.fixture
+def df_split_times():
+  return synthetic.create_df_split_times(300, 6, seed=2)
+
+
+def test_df_split_stats_chunked_matches_in_memory(df_split_times):
+  chunks = [df_split_times.iloc[:, :100], df_split_times.iloc[:, 100:]]
+  pd.testing.assert_frame_equal(analysis.df_split_stats_chunked(chunks),
+    analysis.df_split_stats(df_split_times))
+
+
+def test_df_split_stats_chunked_empty(df_split_times):
+  df = analysis.df_split_stats_chunked(iter([]), index=df_split_times.index)
+  assert df.index.equals(df_split_times.index)
+  assert (df['num_athletes_to_split'] == 0).all()
+  assert analysis.df_split_stats_chunked(iter([])).empty
+
+
+@pytest.mark.filterwarnings('error')
+def test_stats_df_chunked_empty(df_split_times):
+  df = analysis.stats_df_chunked(iter([]), segments=True,
+    index=df_split_times.index)
+  assert df.index.equals(df_split_times.index)
+  assert df.isna().all().all()
+
+
+# The original pandas definitions, from before the one-pass rewrite.
+
+def baseline_group_athletes_by_last_valid_split(df_split_times):
+  return (
+    (
+      split_label,
+      df_split_times.loc[
+        :split_label,
+        df_split_times.apply(pd.Series.last_valid_index) == split_label
+      ]
+    )
+    for split_label in df_split_times.index
+  )
+
+
+def baseline_series_number_stopped_by_split(df_split_times):
+  return pd.Series({
+    split_name: len(df_split_times_stn.columns)
+    for split_name, df_split_times_stn
+    in baseline_group_athletes_by_last_valid_split(df_split_times)
+  })
+
+
+def baseline_series_athletes_through_each_split(df_split_times):
+  s = baseline_series_number_stopped_by_split(df_split_times)
+  return s.sum() - s.cumsum().shift(1, fill_value=0)
+
+
+def baseline_df_split_stats(df_split_times):
+  s_stopped = baseline_series_number_stopped_by_split(df_split_times)
+  s_through = baseline_series_athletes_through_each_split(df_split_times)
+  return pd.DataFrame({
+    'num_athletes_to_split': s_through,
+    'num_athletes_dnf_after_split': s_stopped,
+    'gross_dnf_rate_after_split': (100 * s_stopped / s_stopped.sum()).round(1),
+    'net_dnf_rate_after_split': (100 * s_stopped.div(s_through)).round(1),
+  }).convert_dtypes()
+
+
+@pytest.mark.parametrize('n_splits', [2, 6, 12])
+@pytest.mark.parametrize('missing_rate', [0, 0.1])
+def test_df_split_stats_matches_baseline(n_splits, missing_rate):
+  df_split_times = synthetic.create_df_split_times(400, n_splits,
+    dnf_rate=0.4, missing_rate=missing_rate, seed=n_splits)
+  pd.testing.assert_frame_equal(analysis.df_split_stats(df_split_times),
+    baseline_df_split_stats(df_split_times), check_names=False)
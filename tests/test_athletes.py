@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from processing import athletes, io, synthetic
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+  monkeypatch.setattr(io, 'DATA_DIR', str(tmp_path))
+  for i, race_year in enumerate([2019, 2021]):
+    df_split_times = synthetic.create_df_split_times(40, 6, seed=i)
+    if race_year == 2021:
+      # Returning athletes, in another order and spelling.
+      df_split_times = df_split_times.iloc[:, ::-1].rename(
+        columns={'Athlete 3': '  athlete   3 '})
+    io.save_df_split_times_clean(df_split_times, race_year, fmt='npy')
+  return tmp_path
+
+
+def test_ids_are_stable(data_dir):
+  index = athletes.update_athlete_index([2019])
+  ids_2019 = index.get_year_ids(2019).copy()
+  index = athletes.update_athlete_index([2021])
+  assert athletes.AthleteIndex.load().to_dict() == index.to_dict()
+  assert np.array_equal(index.get_year_ids(2019), ids_2019)
+  assert len(index) == 40
+  assert index.get_id('ATHLETE 3') == index.get_id('Athlete 3') == 3
+  assert index.get_positions(3) == [(2019, 3), (2021, 36)]
+
+
+def test_dfs_split_secs_aligned(data_dir):
+  index = athletes.update_athlete_index([2019, 2021])
+  ids = index.get_returning_ids()
+  dfs = index.dfs_split_secs(ids)
+  for race_year, df in dfs.items():
+    df_year = io.load_df_split_secs_clean(race_year)
+    df_year.columns = index.get_ids(df_year.columns)
+    pd.testing.assert_frame_equal(df, df_year[ids].astype('Int32'),
+      check_names=False)
+
+
+def test_dfs_split_secs_rejects_changed_columns(data_dir):
+  index = athletes.update_athlete_index([2019, 2021])
+  df_split_times = io.load_df_split_times_clean(2019)
+  io.save_df_split_times_clean(df_split_times.iloc[:, 1:], 2019, fmt='npy')
+
+  with pytest.raises(ValueError, match='2019'):
+    index.dfs_split_secs([0, 1])
+  index = athletes.update_athlete_index([2019])
+  assert index.dfs_split_secs([0, 1], race_years=[2019])[2019][0].isna().all()
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from processing import cleaners, synthetic
+
+
+@pytest.mark.parametrize('n_splits', [2, 3, 12])
+@pytest.mark.parametrize('seed', [0, 1])
+def test_lexsort_matches_sort_values(n_splits, seed):
+  df_split_times = synthetic.create_df_split_times(300, n_splits,
+    dnf_rate=0.4, missing_rate=0.1, seed=seed)
+  # Ties at every split, so they're broken by the earlier splits.
+  df_split_times = df_split_times.apply(lambda col: col.dt.round('1H'))
+  df_split_info = synthetic.create_df_split_info(n_splits)
+  assert df_split_times.isna().any(axis=None)
+
+  for df in (df_split_times, df_split_times / pd.Timedelta(seconds=1)):
+    df_lexsort = cleaners.sort_df_split_data_columns(df, df_split_info)
+    df_sort_values = cleaners.sort_df_split_data_columns(df, df_split_info,
+      method='sort_values')
+    pd.testing.assert_frame_equal(df_lexsort, df_sort_values)
+
+
+def test_column_order_keeps_duplicate_names():
+  df_split_times = synthetic.create_df_split_times(50, 4, seed=3)
+  df_split_times.columns = ['Same Name'] * 50
+  arr_order = cleaners.get_column_order(df_split_times)
+  assert np.array_equal(np.sort(arr_order), np.arange(50))
+  df_sorted = cleaners.sort_df_split_data_columns(df_split_times)
+  assert df_sorted.shape == df_split_times.shape
+
+
+def test_sort_df_split_data_columns_rejects_unknown_method():
+  df_split_times = synthetic.create_df_split_times(5, 3)
+  with pytest.raises(ValueError):
+    cleaners.sort_df_split_data_columns(df_split_times, method='quicksort')
@@ -0,0 +1,77 @@
+import pytest
+
+from processing import cli
+
+
+def test_check_import_time():
+  ok, report = cli.check_import_time()
+  assert ok, report
+  assert set(report) == set(cli.IMPORT_TIME_BUDGET_S)
+
+
+def parse(*argv):
+  return cli.create_parser().parse_args(argv)
+
+
+def test_parse_scrape():
+  args = parse('scrape', '-y', '2019', '-y', '2021', '-c', '4', '-d', '2',
+    '-i', '--refresh', 'a', '--refresh', 'b')
+  assert args.func is cli.scrape
+  assert args.year == [2019, 2021]
+  assert (args.concurrency, args.per_domain) == (4, 2)
+  assert args.incremental
+  assert args.refresh == ['a', 'b']
+  assert args.backend == 'scrapy'
+
+  args = parse('scrape', '-a', '-b', 'async', '--rate', '2.5')
+  assert args.all
+  assert cli._get_race_years(args) is None
+  assert (args.backend, args.rate) == ('async', 2.5)
+  assert args.refresh is None
+
+
+def test_parse_clean():
+  args = parse('clean', '-y', '2019', '-f', '-j', '2', '--fmt', 'npy')
+  assert args.func is cli.clean
+  assert cli._get_race_years(args) == [2019]
+  assert (args.force, args.jobs, args.fmt) == (True, 2, 'npy')
+
+  args = parse('clean')
+  assert (args.force, args.jobs, args.fmt) == (False, None, 'csv')
+
+
+def test_parse_stats():
+  args = parse('stats', '-y', '2022')
+  assert args.func is cli.stats
+  assert args.year == [2022]
+
+
+def test_parse_export():
+  args = parse('export', '--fmt', 'npy')
+  assert args.func is cli.export
+  assert (args.fmt, args.store, args.athlete_index) == ('npy', False, False)
+  assert parse('export', '--store').store
+  assert parse('export', '--athlete-index').athlete_index
+
+
+def test_parse_cache():
+  args = parse('cache', '--max-mb', '64')
+  assert args.func is cli.cache
+  assert (args.clear, args.max_mb) == (False, 64.0)
+  assert parse('cache', '--clear').clear
+
+
+def test_parse_import_time():
+  assert parse('import-time').func is cli.import_time
+
+
+@pytest.mark.parametrize('argv', [
+  [],
+  ['unknown'],
+  ['scrape', '-b', 'ftp'],
+  ['clean', '--fmt', 'xlsx'],
+  ['cache', '--max-mb', 'lots'],
+])
+def test_parse_rejects(argv):
+  with pytest.raises(SystemExit):
+    cli.create_parser().parse_args(argv)
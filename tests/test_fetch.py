@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import pytest
+
+from processing import fetch, io
+
+
+RACE_YEAR = 2099
+EVENT_ID = 1000
+RACE_URL = (
+  f'https://www.athlinks.com/event/1/results/Event/{EVENT_ID}/Course/7/Results')
+
+
+def fetch_race(stub, **kwargs):
+  async def run():
+    async with fetch.AthlinksClient(base_url=stub.url, **kwargs) as client:
+      return await fetch.fetch_race(client, RACE_URL)
+  return asyncio.run(run())
+
+
+def test_fetch_race_items(athlinks_stub):
+  athlinks_stub.chunked = True
+  race_item, athlete_items = fetch_race(athlinks_stub)
+
+  assert race_item == {
+    'name': 'Stub 100',
+    'event_id': EVENT_ID,
+    'event_course_id': athlinks_stub.EVENT_COURSE_ID,
+    'distance_m': 160000,
+    'split_info': [
+      {'name': name, 'distance_m': distance}
+      for name, distance in athlinks_stub.SPLITS
+    ],
+    'date_utc_ms': 0,
+  }
+  assert [item['name'] for item in athlete_items] == [
+    f'Athlete {bib}' for bib in range(athlinks_stub.n_athletes)]
+  assert athlete_items[4]['split_data'][1] == {
+    'name': 'Halfway',
+    'number': 1,
+    'time_ms': 5000,
+    'distance_m': 80000,
+    'time_with_penalties_ms': 5000,
+  }
+
+
+def test_fetch_race_retries_503(athlinks_stub):
+  athlinks_stub.fail_bibs = {3: 2, 40: 1}
+  _, athlete_items = fetch_race(athlinks_stub, retries=2, backoff_secs=0.01)
+  assert len(athlete_items) == athlinks_stub.n_athletes
+  assert athlinks_stub.requests[('/individual', 3)] == 3
+  assert athlinks_stub.requests[('/individual', 40)] == 2
+  assert athlinks_stub.requests[('/individual', 41)] == 1
+
+
+def test_fetch_race_gives_up_after_retries(athlinks_stub):
+  athlinks_stub.fail_bibs = {3: 10}
+  with pytest.raises(fetch.HttpError) as excinfo:
+    fetch_race(athlinks_stub, retries=2, backoff_secs=0.01)
+  assert excinfo.value.status == 503
+  assert athlinks_stub.requests[('/individual', 3)] == 3
+
+
+def test_fetch_race_connection_limit(athlinks_stub):
+  athlinks_stub.delay_secs = 0.005
+  fetch_race(athlinks_stub, concurrency=3)
+  assert 1 < athlinks_stub.peak_active <= 3
+  assert athlinks_stub.peak_connections <= 3
+  # Keep-alive: a few connections serve every request.
+  assert athlinks_stub.n_connections <= 3
+  assert sum(athlinks_stub.requests.values()) > athlinks_stub.n_athletes
+
+
+def test_fetch_race_years_saves_raw(athlinks_stub, tmp_path, monkeypatch):
+  monkeypatch.setattr(io, 'DATA_DIR', str(tmp_path))
+  with open(tmp_path / 'race_urls.json', 'w') as f:
+    json.dump({str(RACE_YEAR): RACE_URL}, f)
+
+  counts = fetch.fetch_race_years(base_url=athlinks_stub.url, concurrency=4)
+  assert counts == {RACE_YEAR: athlinks_stub.n_athletes}
+  with open(tmp_path / str(RACE_YEAR) / 'raw' / io.ATHLETE_DATA_FNAME) as f:
+    names = [item['name'] for item in json.load(f)]
+  assert names == sorted(names)
+
+  df_split_times = io.load_df_split_times_raw(RACE_YEAR)
+  assert df_split_times.shape == (
+    len(athlinks_stub.SPLITS), athlinks_stub.n_athletes)
+  assert df_split_times.index.to_list() == [
+    name for name, _ in athlinks_stub.SPLITS]
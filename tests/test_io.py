@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from processing import io, synthetic
+from processing.results import RaceResults
+
+
+def test_results_store_rewrite_keeps_readers(tmp_path, monkeypatch):
+  monkeypatch.setattr(io, 'DATA_DIR', str(tmp_path))
+  df_split_times = synthetic.create_df_split_times(50, 6, seed=1)
+  io.save_df_split_times_clean(df_split_times, 2019, fmt='npy')
+  io.save_results_store([2019])
+  store_old = io.ResultsStore()
+  df_old = store_old.df_split_secs(2019)
+
+  df_split_times = synthetic.create_df_split_times(80, 4, seed=2)
+  io.save_df_split_times_clean(df_split_times, 2019, fmt='npy')
+  io.save_results_store([2019])
+  store_new = io.ResultsStore()
+
+  # Mapped before the rewrite: still the old data, with matching labels.
+  pd.testing.assert_frame_equal(store_old.df_split_secs(2019), df_old)
+  assert store_new.df_split_secs(2019).shape == (4, 80)
+  assert np.array_equal(store_new.arrays(2019)[0],
+    io.load_arrays_secs_clean(2019)[0])
+  # Only the current generation is left on disk.
+  assert len(os.listdir(io.get_store_dir())) == 3
+
+
+def test_split_times_clean_formats_coexist(tmp_path, monkeypatch):
+  monkeypatch.setattr(io, 'DATA_DIR', str(tmp_path))
+  df_split_times = synthetic.create_df_split_times(30, 5, seed=3)
+  io.save_df_split_times_clean(df_split_times, 2019, fmt='npy')
+  io.save_df_split_times_clean(df_split_times, 2019, fmt='csv')
+
+  assert io.get_split_secs_clean_fname(2019) == io.get_split_secs_clean_fname(
+    2019, fmt='csv')
+  for fmt in io.SPLIT_SECS_FNAMES:
+    pd.testing.assert_frame_equal(
+      io.load_df_split_times_clean(2019, fmt=fmt), df_split_times)
+
+  # The newest save wins, so a stale copy never shadows it.
+  df_split_times = synthetic.create_df_split_times(20, 5, seed=4)
+  io.save_df_split_times_clean(df_split_times, 2019, fmt='npy')
+  pd.testing.assert_frame_equal(
+    io.load_df_split_times_clean(2019), df_split_times)
+
+
+def test_split_times_clean_npy_rewrite_keeps_readers(tmp_path, monkeypatch):
+  monkeypatch.setattr(io, 'DATA_DIR', str(tmp_path))
+  df_split_times = synthetic.create_df_split_times(500, 12, seed=5)
+  io.save_df_split_times_clean(df_split_times, 2019, fmt='npy')
+  df_old = io.load_df_split_secs_clean(2019, fmt='npy')
+
+  # Smaller, so truncating the mapped file in place would fault below.
+  io.save_df_split_times_clean(df_split_times.iloc[:, :10], 2019, fmt='npy')
+  assert df_old.shape == (12, 500)
+  assert df_old.sum().sum() > 0
+
+
+def test_race_results_from_clean_npy_is_zero_copy(tmp_path, monkeypatch):
+  monkeypatch.setattr(io, 'DATA_DIR', str(tmp_path))
+  df_split_times = synthetic.create_df_split_times(50, 6, seed=6)
+  io.save_df_split_times_clean(df_split_times, 2019, fmt='npy')
+
+  arr_secs, arr_mask, index, columns = io.load_arrays_secs_clean(2019)
+  assert arr_secs.dtype == np.int32
+  results = RaceResults.from_arrays_athletes_major(arr_secs, arr_mask, index,
+    columns)
+  assert np.shares_memory(results.secs, arr_secs)
+  assert np.shares_memory(results.mask, arr_mask)
+  pd.testing.assert_frame_equal(
+    RaceResults.from_clean(2019).to_df_split_times(), df_split_times)
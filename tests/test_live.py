@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from processing import analysis, cleaners, live, synthetic
+
+
+STATS_EXACT = ['mean', 'std', 'min', 'max']
+
+
+@pytest.fixture
+def df_split_times():
+  return synthetic.create_df_split_times(400, 6, seed=5)
+
+
+def get_live_columns(live_stats):
+  return pd.Index(live_stats.athletes)[live_stats.get_column_order()]
+
+
+def assert_matches_batch(live_stats, df_split_times):
+  pd.testing.assert_frame_equal(live_stats.df_split_stats(),
+    analysis.df_split_stats(df_split_times))
+  assert get_live_columns(live_stats).equals(
+    df_split_times.columns[cleaners.get_column_order(df_split_times)])
+  pd.testing.assert_frame_equal(live_stats.stats_df()[STATS_EXACT],
+    analysis.stats_df(df_split_times / pd.Timedelta(seconds=1))[STATS_EXACT])
+
+
+def test_replay_matches_batch(df_split_times):
+  arr_secs = analysis.array_split_secs(df_split_times)
+  for t_poll, live_stats in live.replay(df_split_times, poll_secs=3600):
+    # Everything reported by this poll, and nothing after.
+    df_so_far = df_split_times.where(arr_secs <= t_poll)
+    pd.testing.assert_frame_equal(live_stats.df_split_stats(),
+      analysis.df_split_stats(df_so_far))
+  assert_matches_batch(live_stats, df_split_times)
+  assert live_stats.to_race_results().columns.equals(
+    cleaners.sort_df_split_data_columns(df_split_times).columns)
+
+
+def test_repeated_observations_are_dropped(df_split_times):
+  *_, (_, live_stats) = live.replay(df_split_times, poll_secs=3600)
+  assert live_stats.update_df(live.df_observations(df_split_times)) == 0
+  assert_matches_batch(live_stats, df_split_times)
+
+
+def test_timing_correction(df_split_times):
+  *_, (_, live_stats) = live.replay(df_split_times, poll_secs=3600)
+
+  # The first finisher's finish time is corrected to the slowest.
+  df_corrected = df_split_times.copy()
+  arr_finish = analysis.array_split_secs(df_split_times)[-1]
+  j_first = np.nanargmin(arr_finish)
+  secs_new = np.nanmax(arr_finish) + 60
+  df_corrected.iloc[-1, j_first] = pd.Timedelta(seconds=secs_new)
+
+  n_applied = live_stats.update([df_split_times.columns[j_first]],
+    [df_split_times.index[-1]], [secs_new])
+  assert n_applied == 1
+  assert_matches_batch(live_stats, df_corrected)
+  assert get_live_columns(live_stats)[
+    live_stats.df_split_stats()['num_athletes_to_split'].iloc[-1] - 1
+  ] == df_split_times.columns[j_first]
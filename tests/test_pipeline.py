@@ -0,0 +1,79 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from processing import corrections, fetch, io, pipeline, synthetic
+
+
+RACE_YEAR = 2099
+RACE_URL = 'https://www.athlinks.com/event/1/results/Event/1000/Course/7/Results'
+
+
+@pytest.fixture
+def raw_data(athlinks_stub, tmp_path, monkeypatch):
+  monkeypatch.setattr(io, 'DATA_DIR', str(tmp_path))
+  with open(tmp_path / 'race_urls.json', 'w') as f:
+    json.dump({str(RACE_YEAR): RACE_URL}, f)
+  athlinks_stub.n_athletes = 20
+  fetch.fetch_race_years(base_url=athlinks_stub.url, concurrency=4)
+  return tmp_path
+
+
+def test_run_pipeline_skips_up_to_date(raw_data):
+  assert pipeline.run_pipeline(max_workers=1) == {RACE_YEAR: 'processed'}
+  assert pipeline.run_pipeline(max_workers=1) == {RACE_YEAR: 'skipped'}
+  assert pipeline.run_pipeline(max_workers=1, force=True) == {
+    RACE_YEAR: 'processed'}
+  assert io.load_df_split_info_clean(RACE_YEAR)['cutoff_hr'].isna().all()
+  assert io.load_df_split_times_clean(RACE_YEAR).shape == (3, 20)
+
+
+def test_run_pipeline_keeps_hand_made(raw_data):
+  pipeline.run_pipeline(max_workers=1)
+  os.remove(pipeline.get_manifest_fname(RACE_YEAR))
+  fname = io.get_split_secs_clean_fname(RACE_YEAR, fmt='csv')
+  with open(fname, 'a') as f:
+    f.write('# touched by hand\n')
+
+  assert pipeline.run_pipeline(max_workers=1) == {RACE_YEAR: 'kept'}
+  with open(fname) as f:
+    assert f.read().endswith('# touched by hand\n')
+  assert pipeline.run_pipeline(max_workers=1, force=True) == {
+    RACE_YEAR: 'processed'}
+
+
+def test_run_pipeline_applies_corrections(raw_data, monkeypatch):
+  monkeypatch.setitem(corrections.CUTOFF_HR, RACE_YEAR, [None, 15., 30.])
+  monkeypatch.setitem(corrections.TIME_CORRECTIONS, RACE_YEAR, [
+    ('clear', 'Athlete 19', 'Full Course'),
+    ('move', 'Athlete 18', 'Halfway', 'Full Course'),
+  ])
+  pipeline.run_pipeline(max_workers=1)
+
+  assert io.load_df_split_info_clean(RACE_YEAR)['cutoff_hr'].to_list()[1:] == [
+    15., 30.]
+  df_split_times = io.load_df_split_times_clean(RACE_YEAR)
+  assert df_split_times['Athlete 19'].isna().to_list() == [False, False, True]
+  assert df_split_times['Athlete 18'].isna().to_list() == [False, True, False]
+  # ...and athletes are sorted after the corrections.
+  assert df_split_times.columns[-1] == 'Athlete 19'
+
+  # Changing the corrections makes the year stale.
+  monkeypatch.setitem(corrections.TIME_CORRECTIONS, RACE_YEAR, [])
+  assert pipeline.run_pipeline(max_workers=1) == {RACE_YEAR: 'processed'}
+
+
+def test_correct_df_split_times_range(monkeypatch):
+  df_split_times = synthetic.create_df_split_times(5, 6, dnf_rate=0,
+    missing_rate=0)
+  labels = df_split_times.index
+  monkeypatch.setitem(corrections.TIME_CORRECTIONS, RACE_YEAR, [
+    ('clear', 'Athlete 2', labels[3], labels[-1])])
+
+  df_corrected = corrections.correct_df_split_times(df_split_times, RACE_YEAR)
+  assert df_corrected['Athlete 2'].isna().to_list() == [
+    False, False, False, True, True, True]
+  assert df_corrected.drop(columns='Athlete 2').notna().all(axis=None)
+  assert df_split_times.notna().all(axis=None)
@@ -0,0 +1,153 @@
+"""Incremental crawls against the stub server, each in its own process.
+
+The Twisted reactor only starts once per process, so every crawl runs
+in a fresh interpreter.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('scrapy')
+pytest.importorskip('scrapy_athlinks')
+
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir)
+RACE_YEAR = 2099
+RACE_URL = 'https://www.athlinks.com/event/1/results/Event/1000/Course/7/Results'
+CRAWL_SCRIPT = '''
+import json, sys
+from processing import io, scrapers
+io.DATA_DIR = sys.argv[1]
+scrapers.LeadvilleScraper(int(sys.argv[2])).run_spider_incremental(
+  settings=json.loads(sys.argv[4]),
+  url_rewrites={'https://results.athlinks.com': sys.argv[3]})
+'''
+CRAWL_YEARS_SCRIPT = '''
+import json, sys
+from processing import io, scrapers
+io.DATA_DIR = sys.argv[1]
+scrapers.run_spiders_pandas(**json.loads(sys.argv[2]), settings={
+  'LOG_LEVEL': 'WARNING',
+  # The cap has to hold on its own, not through throttling.
+  'AUTOTHROTTLE_ENABLED': False,
+  'URL_PREFIX_REWRITES': {'https://results.athlinks.com': sys.argv[3]},
+  'DOWNLOADER_MIDDLEWARES': {
+    'processing.scrapers.UrlPrefixRewriteMiddleware': 50,
+  },
+})
+'''
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+  with open(tmp_path / 'race_urls.json', 'w') as f:
+    json.dump({str(RACE_YEAR): RACE_URL}, f)
+  return tmp_path
+
+
+def run_crawl(data_dir, stub, **settings):
+  settings = {
+    'LOG_LEVEL': 'WARNING',
+    # Breadth-first, so an interrupted crawl has listing pages left.
+    'SCHEDULER_DISK_QUEUE': 'scrapy.squeues.PickleFifoDiskQueue',
+    'SCHEDULER_MEMORY_QUEUE': 'scrapy.squeues.FifoMemoryQueue',
+    **settings,
+  }
+  subprocess.run(
+    [sys.executable, '-c', CRAWL_SCRIPT, str(data_dir), str(RACE_YEAR),
+     stub.url, json.dumps(settings)],
+    cwd=REPO_DIR, check=True, timeout=120)
+
+
+def load_athlete_names(data_dir):
+  with open(data_dir / str(RACE_YEAR) / 'raw' / 'athletes.json', 'r') as f:
+    return [item['name'] for item in json.load(f)]
+
+
+def count_requests(stub, path):
+  return sum(n for (p, _), n in stub.requests.items() if p == path)
+
+
+def test_incremental_crawl_resumes_and_refreshes(athlinks_stub, data_dir):
+  job_dir = data_dir / str(RACE_YEAR) / 'cache' / 'job'
+  athlinks_stub.fail_bibs = {3: 1}
+
+  # Interrupted part way.
+  run_crawl(data_dir, athlinks_stub, CLOSESPIDER_ITEMCOUNT=50,
+    CONCURRENT_REQUESTS=1)
+  n_first = len(load_athlete_names(data_dir))
+  assert 0 < n_first < athlinks_stub.n_athletes
+  assert job_dir.exists()
+
+  # Resumed: the metadata is read again (from cache), so athlete
+  # requests carry the right eventCourseId, and nothing is re-fetched.
+  run_crawl(data_dir, athlinks_stub)
+  names = load_athlete_names(data_dir)
+  assert sorted(names) == sorted(
+    f'Athlete {bib}' for bib in range(athlinks_stub.n_athletes))
+  assert not job_dir.exists()
+  assert count_requests(athlinks_stub, '/metadata/event/1000') == 1
+  assert count_requests(athlinks_stub, '/individual') == (
+    athlinks_stub.n_athletes + 1)  # bib 3's 503 was retried
+  assert athlinks_stub.requests[('/individual', 3)] == 2
+
+  # New results: the listing is re-fetched, only new athletes are.
+  n_listing = count_requests(athlinks_stub, '/event/1000')
+  athlinks_stub.n_athletes += 10
+  run_crawl(data_dir, athlinks_stub)
+  assert len(load_athlete_names(data_dir)) == athlinks_stub.n_athletes
+  assert count_requests(athlinks_stub, '/event/1000') > n_listing
+  assert count_requests(athlinks_stub, '/individual') == (
+    athlinks_stub.n_athletes + 1)
+  assert count_requests(athlinks_stub, '/metadata/event/1000') == 1
+
+
+def load_athlete_items(data_dir):
+  with open(data_dir / str(RACE_YEAR) / 'raw' / 'athletes.json', 'r') as f:
+    return {item['name']: item for item in json.load(f)}
+
+
+def test_incremental_crawl_refetches_changed_athletes(athlinks_stub, data_dir):
+  athlinks_stub.n_athletes = 30
+  run_crawl(data_dir, athlinks_stub)
+  items = load_athlete_items(data_dir)
+  assert items['Athlete 5']['split_data'][-1]['time_ms'] == 12000
+
+  # A corrected time shows up in the listing, so only that athlete's
+  # cached page is stale.
+  athlinks_stub.time_offsets_ms = {5: 60000}
+  run_crawl(data_dir, athlinks_stub)
+  assert athlinks_stub.requests[('/individual', 5)] == 2
+  assert count_requests(athlinks_stub, '/individual') == (
+    athlinks_stub.n_athletes + 1)
+  items_new = load_athlete_items(data_dir)
+  assert items_new['Athlete 5']['split_data'][-1]['time_ms'] == 72000
+  assert items_new['Athlete 6'] == items['Athlete 6']
+
+  # ...and the refreshed page is what's cached now.
+  run_crawl(data_dir, athlinks_stub)
+  assert count_requests(athlinks_stub, '/individual') == (
+    athlinks_stub.n_athletes + 1)
+
+
+def test_crawl_years_share_concurrency_caps(athlinks_stub, tmp_path):
+  race_years = [2097, 2098, 2099]
+  with open(tmp_path / 'race_urls.json', 'w') as f:
+    json.dump({str(race_year): RACE_URL for race_year in race_years}, f)
+  athlinks_stub.n_athletes = 40
+  athlinks_stub.delay_secs = 0.01
+
+  kwargs = {'concurrent_requests': 16, 'concurrent_requests_per_domain': 3}
+  subprocess.run(
+    [sys.executable, '-c', CRAWL_YEARS_SCRIPT, str(tmp_path),
+     json.dumps(kwargs), athlinks_stub.url],
+    cwd=REPO_DIR, check=True, timeout=120)
+
+  # One domain: three crawls of up to 3 each, but 3 at a time overall.
+  assert 1 < athlinks_stub.peak_active <= 3
+  for race_year in race_years:
+    with open(tmp_path / str(race_year) / 'raw' / 'athletes.json', 'r') as f:
+      assert len(json.load(f)) == athlinks_stub.n_athletes
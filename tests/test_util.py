@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from processing import synthetic, util
+
+
+def test_df_td_fmt_matches_per_element():
+  df_td = synthetic.create_df_split_times(30, 5, seed=7)
+  df_td.columns = [*df_td.columns[:-1], df_td.columns[0]]  # a duplicate name
+  df_td.iloc[0, 1] = pd.Timedelta(hours=123, seconds=4)
+  df_td.iloc[1, 2] = pd.Timedelta(seconds=-5)
+
+  df_out = util.df_td_fmt(df_td)
+  df_expected = df_td.apply(lambda col: col.map(
+    lambda td: pd.NA if pd.isna(td) else util.scalar_td_fmt(td))
+  ).astype('string')
+  pd.testing.assert_frame_equal(df_out, df_expected)
+  assert df_out.iloc[0, 1] == '123:00:04'
+  assert (df_out.dtypes == 'string').all()
+
+  pd.testing.assert_frame_equal(util.df_td_fmt(df_td, cache=True), df_out)
+  pd.testing.assert_frame_equal(util.df_td_fmt(df_td, cache=True), df_out)
+
+
+def test_df_td_fmt_empty():
+  df_td = pd.DataFrame(np.empty((3, 0), dtype='timedelta64[ns]'))
+  assert util.df_td_fmt(df_td).shape == (3, 0)